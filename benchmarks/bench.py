@@ -0,0 +1,357 @@
+"""
+Times the analysis, synthesis and I/O hot paths on synthetic inputs
+
+Results are written as JSON. Given a baseline written by an earlier run, the benchmarks
+that got slower than the baseline by more than a tolerance are reported and the script
+exits with status 1. It does the same for cases with an absolute target, such as startup
+against lpc.STARTUP_TARGET, whose best time misses it.
+
+    python -m benchmarks.bench -o results.json
+    python -m benchmarks.bench --baseline results.json --tolerance .25
+"""
+import argparse
+import contextlib
+import inspect
+import itertools
+import json
+import math
+import numpy as np
+import os
+from os import path
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numba
+
+from lpyc_tts_shotgunllama import lpc, resample
+from lpyc_tts_shotgunllama.analyzer import analyze, windows
+from lpyc_tts_shotgunllama.player import bank, g2p, pool
+from lpyc_tts_shotgunllama.player.phoneme import Phoneme, Phonology
+
+RATE: int = 44100
+_SEED: int = 1234
+
+# A benchmark builds its inputs from keyword parameters and returns the callable to time,
+# or yields it once and cleans up when the case is done
+Setup = Callable[..., Union[Callable[[], object], Iterator[Callable[[], object]]]]
+
+_benchmarks: Dict[str, Tuple[Setup, Dict[str, list]]] = {}
+
+def benchmark(name: str, **grid: list) -> Callable[[Setup], Setup]:
+    """Registers a setup function to be timed once for every combination of grid values"""
+    def register(setup: Setup) -> Setup:
+        _benchmarks[name] = (setup, grid)
+        return setup
+    return register
+
+def synthetic_voice(seconds: float, f0: float = 120, noise: float = .05) -> np.ndarray:
+    """A vowel-like signal: decaying harmonics of f0 plus a little noise"""
+    rng: np.random.Generator = np.random.default_rng(_SEED)
+    t: np.ndarray = np.arange(round(seconds * RATE)) / RATE
+    signal: np.ndarray = sum(np.sin(2 * np.pi * f0 * k * t + k) / k for k in range(1, 30))
+    return signal / np.abs(signal).max() * .8 + rng.standard_normal(len(t)) * noise
+
+def synthetic_phoneme(order: int, continuous: bool = True, seconds: float = .3,\
+        rate: int = RATE) -> Phoneme:
+    signal: np.ndarray = resample.resample(synthetic_voice(seconds), RATE, rate)
+    frames: List[lpc.LPC] = analyze.analyze(signal, order, rate // 50, rate // 100, 'hann',\
+        framerate=rate)
+    return Phoneme(frames, continuous, rate)
+
+def synthetic_phonology(order: int, names: List[str], rate: int = RATE) -> Phonology:
+    phoneme: Phoneme = synthetic_phoneme(order, rate=rate)
+    return Phonology({name: phoneme for name in names}, seed=_SEED,\
+        output_rate=RATE if rate != RATE else None)
+
+@benchmark('calc_burg', order=[8, 16, 48], size=[441, 882, 1764])
+def _calc_burg(order: int, size: int) -> Callable[[], object]:
+    frame: np.ndarray = windows.hann(synthetic_voice(size / RATE))
+    return lambda: analyze.calc_burg(frame, order)
+
+@benchmark('analyze', window=['none', 'hann', 'hamming', 'blackman', 'kaiser'], order=[16, 48])
+def _analyze(window: str, order: int) -> Callable[[], object]:
+    signal: np.ndarray = synthetic_voice(1)
+    return lambda: analyze.analyze(signal, order, 882, 441, window, framerate=RATE)
+
+@benchmark('Adaptation.apply', max_distance=[0, 3], measure=list(analyze.distances))
+def _adapt(max_distance: float, measure: str) -> Callable[[], object]:
+    frames: List[lpc.LPC] = analyze.analyze(synthetic_voice(1), 48, 882, 441, 'hann')
+    adaptation: analyze.Adaptation = analyze.Adaptation(max_distance, measure, silence_db=-60)
+    return lambda: list(adaptation.apply(frames))
+
+@benchmark('autocorrelation', size=[256, 1024, 4096], offset=[1, 32])
+def _autocorrelation(size: int, offset: int) -> Callable[[], object]:
+    signal: np.ndarray = synthetic_voice(size / RATE)
+    return lambda: analyze.autocorrelation(signal, offset)
+
+@benchmark('window', window=list(windows.windows), size=[256, 1024, 4096])
+def _window(window: str, size: int) -> Callable[[], object]:
+    frame: np.ndarray = synthetic_voice(size / RATE)
+    function: windows.Window = windows.windows[window]
+    return lambda: function(frame)
+
+@benchmark('LPCPlayer.play', order=[16, 48], samples=[441, 4410, 44100])
+def _play(order: int, samples: int) -> Callable[[], object]:
+    frame: lpc.LPC = synthetic_phoneme(order).frames[5]
+    player: lpc.LPCPlayer = lpc.LPCPlayer(order, seed=_SEED)
+    player.prime(frame, 120 / RATE)
+    return lambda: player.play(frame, 120 / RATE, samples)
+
+@benchmark('LPCPlayer.render_sequence', order=[16, 48], block_size=[1, 32],\
+    dtype=['float64', 'float32'])
+def _render_sequence(order: int, block_size: int, dtype: str) -> Callable[[], object]:
+    phoneme: Phoneme = synthetic_phoneme(order)
+    coefficients, gains, voices, _ = phoneme.arrays()
+    coefficients = coefficients.astype(dtype)
+    player: lpc.LPCPlayer = lpc.LPCPlayer(order, seed=_SEED, block_size=block_size,\
+        dtype=np.dtype(dtype).type)
+    player.prime(phoneme.frames[0], 120 / RATE)
+    frequencies: np.ndarray = np.full(len(gains), 120 / RATE)
+    counts: np.ndarray = np.full(len(gains), 441)
+    return lambda: player.render_sequence(coefficients, gains, voices, frequencies, counts)
+
+@benchmark('_fast_play', order=[16, 48], samples=[441, 44100])
+def _fast_play(order: int, samples: int) -> Callable[[], object]:
+    frame: lpc.LPC = synthetic_phoneme(order).frames[5]
+    player: lpc.LPCPlayer = lpc.LPCPlayer(order, seed=_SEED)
+    player.prime(frame, 120 / RATE)
+    noise: np.ndarray = player.noise(samples)
+    return lambda: lpc._fast_play(samples, 120 / RATE, frame.coefficients, frame.gain,\
+        frame.voice, player.frequency, player.coefficients, player.gain, player.voice,\
+        player.speed, player.cache, player.index, player.phase, 0, 0, 0, noise.copy())
+
+@benchmark('Phoneme.play_on', order=[16, 48], duration=[.1, .5, 2])
+def _play_on(order: int, duration: float) -> Callable[[], object]:
+    phoneme: Phoneme = synthetic_phoneme(order)
+    player: lpc.LPCPlayer = lpc.LPCPlayer(order, seed=_SEED)
+    return lambda: phoneme.play_on(player, duration, 120, True, vibrato=.03)
+
+@benchmark('Phonology.play_str', order=[16, 48], words=[1, 10, 50])
+def _play_str(order: int, words: int) -> Callable[[], object]:
+    phonology: Phonology = synthetic_phonology(order, ['a', 'm', 'n'])
+    sentence: str = ' '.join(["'m-a-n"] * words)
+    return lambda: phonology.play_str(sentence)
+
+@benchmark('Phonology.play_str@rate', rate_order=['44100/48', '22050/24', '16000/20'])
+def _play_str_rate(rate_order: str) -> Callable[[], object]:
+    rate, order = map(int, rate_order.split('/'))
+    phonology: Phonology = synthetic_phonology(order, ['a', 'm', 'n'], rate)
+    sentence: str = ' '.join(["'m-a-n"] * 10)
+    return lambda: phonology.play_str(sentence)
+
+@benchmark('resample', rates=['16000/44100', '22050/44100', '44100/16000'])
+def _resample(rates: str) -> Callable[[], object]:
+    from_rate, to_rate = map(int, rates.split('/'))
+    signal: np.ndarray = resample.resample(synthetic_voice(1), RATE, from_rate)
+    return lambda: resample.resample(signal, from_rate, to_rate)
+
+@benchmark('SynthesisPool', workers=[1, 2, 4], processes=[False, True])
+def _pool(workers: int, processes: bool) -> Iterator[Callable[[], object]]:
+    """Scaling of batch synthesis with the number of workers, at 8 sentences per batch"""
+    with tempfile.TemporaryDirectory(prefix='lpyc-bench-') as directory:
+        bank_path: str = path.join(directory, 'voice.bank')
+        bank.write_bank(bank_path, synthetic_phonology(48, ['a', 'm', 'n']).phonemes)
+        texts: List[str] = [' '.join(["'m-a-n"] * 5)] * 8
+        with pool.SynthesisPool(Phonology.load_bank(bank_path), workers, processes, _SEED)\
+                as workers_pool:
+            yield lambda: list(workers_pool.synthesize_batch(texts))
+
+@benchmark('G2P.markup', words=[100, 1000], memo=[False, True])
+def _markup(words: int, memo: bool) -> Callable[[], object]:
+    rng: np.random.Generator = np.random.default_rng(_SEED)
+    letters: np.ndarray = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    text: str = ', '.join(''.join(rng.choice(letters, rng.integers(2, 10)))\
+        for _ in range(words))
+    front: g2p.G2P = g2p.G2P()
+    if memo:
+        return lambda: front.markup(text)
+    return lambda: g2p.G2P().markup(text)
+
+@benchmark('Phonology.load', order=[16, 48], phonemes=[8, 32])
+def _load(order: int, phonemes: int) -> Callable[[], object]:
+    directory: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory(prefix='lpyc-bench-')
+    d: dict = {
+        'framerate': RATE,
+        'order': order,
+        'continuous': True,
+        'frames': list(map(lpc.LPC.todict, synthetic_phoneme(order).frames))
+    }
+    names: List[str] = [f'p{i}' for i in range(phonemes)]
+    name: str
+    for name in names:
+        with open(path.join(directory.name, name + '.json'), 'w') as file:
+            json.dump(d, file)
+    # The closure keeps the directory alive until the case is done
+    return lambda: (directory, Phonology.load(names, directory.name))
+
+@benchmark('Phonology.load_bank', order=[16, 48], phonemes=[8, 32])
+def _load_bank(order: int, phonemes: int) -> Iterator[Callable[[], object]]:
+    """Opening a bank and building every phoneme from its mapped columns"""
+    phoneme: Phoneme = synthetic_phoneme(order)
+    with tempfile.TemporaryDirectory(prefix='lpyc-bench-') as directory:
+        bank_path: str = path.join(directory, 'voice.bank')
+        bank.write_bank(bank_path, {f'p{i}': phoneme for i in range(phonemes)})
+        def load() -> Phonology:
+            phonology: Phonology = Phonology.load_bank(bank_path)
+            # Touch every phoneme, since the bank builds them on first access
+            for name in phonology.phonemes:
+                phonology.phonemes[name]
+            return phonology
+        yield load
+
+@benchmark('startup')
+def _startup() -> Callable[[], object]:
+    """Importing the analysis and synthesis modules and warming the kernels in a fresh
+    interpreter; the untimed first call warms numba's cache"""
+    script: str = 'from lpyc_tts_shotgunllama import lpc\n'\
+        'from lpyc_tts_shotgunllama.analyzer import analyze, player\n'\
+        'from lpyc_tts_shotgunllama.player import phoneme\n'\
+        'lpc.warmup()'
+    return lambda: subprocess.run([sys.executable, '-c', script], check=True)
+
+# Seconds that the best time of a case must stay under, whatever the baseline
+TARGETS: Dict[str, float] = {'startup[]': lpc.STARTUP_TARGET}
+
+def cases(pattern: Optional[str] = None) -> Iterator[Tuple[str, Setup, dict]]:
+    """Yields the name, setup function and parameters of every benchmark case whose name
+    matches pattern"""
+    name: str
+    for name, (setup, grid) in _benchmarks.items():
+        values: tuple
+        for values in itertools.product(*grid.values()):
+            params: dict = dict(zip(grid, values))
+            case: str = f'{name}[' + ','.join(f'{k}={v}' for k, v in params.items()) + ']'
+            if pattern is None or re.search(pattern, case):
+                yield case, setup, params
+
+@contextlib.contextmanager
+def _prepared(setup: Setup, params: dict) -> Iterator[Callable[[], object]]:
+    """Runs a setup function and, if it is a generator, finishes it after the case"""
+    made: Union[Callable[[], object], Iterator[Callable[[], object]]] = setup(**params)
+    if not inspect.isgenerator(made):
+        yield made
+        return
+    try:
+        yield next(made)
+    finally:
+        made.close()
+
+def measure(function: Callable[[], object], repeat: int = 5, min_time: float = .05)\
+        -> Dict[str, float]:
+    """
+    Times function after one untimed call, which absorbs compilation. Each of repeat rounds
+    calls it enough times to take at least min_time seconds. Returns the best, median and
+    worst seconds per call over the rounds.
+    """
+    function()
+    number: int = 1
+    while True:
+        start: float = time.perf_counter()
+        i: int
+        for i in range(number):
+            function()
+        elapsed: float = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, math.ceil(min_time / elapsed)))
+    rounds: List[float] = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for i in range(number):
+            function()
+        rounds.append((time.perf_counter() - start) / number)
+    return {
+        'best': min(rounds),
+        'median': statistics.median(rounds),
+        'worst': max(rounds),
+        'number': number
+    }
+
+def run(pattern: Optional[str] = None, repeat: int = 5, min_time: float = .05,\
+        verbose: bool = True) -> dict:
+    results: Dict[str, Dict[str, float]] = {}
+    for case, setup, params in cases(pattern):
+        with _prepared(setup, params) as function:
+            results[case] = measure(function, repeat, min_time)
+        if verbose:
+            print(f'{case}: {results[case]["best"] * 1e3:.4g} ms', file=sys.stderr)
+    return {
+        'machine': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'numba': numba.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'results': results
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[Tuple[str, float]]:
+    """Returns the cases whose best time exceeds the baseline's by more than tolerance,
+    as a fraction, with the ratio of their times"""
+    regressions: List[Tuple[str, float]] = []
+    case: str
+    for case, timing in results['results'].items():
+        base: Optional[dict] = baseline['results'].get(case)
+        if base is None:
+            continue
+        ratio: float = timing['best'] / base['best']
+        if ratio > 1 + tolerance:
+            regressions.append((case, ratio))
+    return regressions
+
+def missed_targets(results: dict) -> List[Tuple[str, float]]:
+    """Returns the cases whose best time exceeds their entry in TARGETS, with that time"""
+    return [(case, results['results'][case]['best']) for case in TARGETS\
+        if case in results['results'] and results['results'][case]['best'] > TARGETS[case]]
+
+def main():
+    parser: argparse.ArgumentParser = argparse.ArgumentParser('Benchmark analysis and synthesis')
+    parser.add_argument('-o', '--output', type=str, default=None,\
+        help='Path to write JSON results to (default: standard output)')
+    parser.add_argument('-k', '--filter', type=str, default=None,\
+        help='Regular expression selecting benchmark cases by name')
+    parser.add_argument('-b', '--baseline', type=str, default=None,\
+        help='JSON results of an earlier run to compare against')
+    parser.add_argument('-t', '--tolerance', type=float, default=.25,\
+        help='Allowed slowdown against the baseline, as a fraction (default .25)')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Timing rounds per case')
+    parser.add_argument('-m', '--min-time', type=float, default=.05,\
+        help='Minimum seconds per timing round')
+    parser.add_argument('-l', '--list', action='store_true', help='List cases and exit')
+    args: argparse.Namespace = parser.parse_args()
+    if args.list:
+        for case, _, _ in cases(args.filter):
+            print(case)
+        return
+    lpc.warmup()
+    results: dict = run(args.filter, args.repeat, args.min_time)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+    elif not args.baseline:
+        json.dump(results, sys.stdout, indent=1)
+    missed: List[Tuple[str, float]] = missed_targets(results)
+    for case, seconds in missed:
+        print(f'TARGET MISSED {case}: {seconds:.3f} s over {TARGETS[case]:.3f} s',\
+            file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline: dict = json.load(file)
+        regressions: List[Tuple[str, float]] = compare(results, baseline, args.tolerance)
+        for case, ratio in regressions:
+            print(f'REGRESSION {case}: {ratio:.2f}x baseline', file=sys.stderr)
+        if regressions:
+            exit(1)
+        print(f'No regressions beyond {args.tolerance:.0%} of {args.baseline}', file=sys.stderr)
+    if missed:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,22 @@
 import argparse
+import contextlib
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+import glob
+import io
+import json
 import math
 import numpy as np
+import os
+from os import path
 import sys
-from typing import Tuple, List, Optional, Callable, Union
+from typing import Tuple, List, Dict, Optional, Callable, Iterable, Iterator, Union
 
-from lpyc_tts_shotgunllama import lpc
-from lpyc_tts_shotgunllama.analyzer import windows
+from lpyc_tts_shotgunllama import lpc, profiling, resample, wavio
+from lpyc_tts_shotgunllama.analyzer import pitch, windows
 
-def calc_burg(signal: np.ndarray, max_order: int) -> Tuple[List[np.ndarray], np.ndarray]:
+def calc_burg(signal: np.ndarray, max_order: int, dtype: type = np.float64)\
+        -> Tuple[List[np.ndarray], np.ndarray]:
     """
     Calculates LPC coefficients and gains for orders 1..max_order for a given signal
     using Burg's method of minimizing forward and backward propagation error.
@@ -17,16 +26,17 @@ def calc_burg(signal: np.ndarray, max_order: int) -> Tuple[List[np.ndarray], np.
     
     signal: an array-like of the pre-windowed signal to analyze
     max_order: the maximum order LPC coefficients and gain to calculate
+    dtype: float type to calculate in and of the results
     """
-    signal: np.ndarray = np.asanyarray(signal, dtype=float)
+    signal: np.ndarray = np.asanyarray(signal, dtype=dtype)
     
     lpc_order_coeffs: List[np.ndarray] = []
-    lpc_order_gains: np.ndarray = np.zeros(max_order)
+    lpc_order_gains: np.ndarray = np.zeros(max_order, dtype)
     error_f: np.ndarray = signal.copy()
     error_b: np.ndarray = signal.copy()
     N: int = len(signal)
     rho: float = sum(abs(signal**2)) / N
-    coeffs: np.ndarray = np.zeros(0)
+    coeffs: np.ndarray = np.zeros(0, dtype)
     
     order: int
     for order in range(max_order):
@@ -43,27 +53,86 @@ def calc_burg(signal: np.ndarray, max_order: int) -> Tuple[List[np.ndarray], np.
         
         error_f, error_b = error_f + reflection * error_b, error_b + reflection * error_f
         coeffs = coeffs + reflection * coeffs[::-1]
-        coeffs = np.concatenate((coeffs, [reflection]))
+        coeffs = np.concatenate((coeffs, np.array([reflection], dtype)))
         lpc_order_coeffs.append(coeffs)
     
     return lpc_order_coeffs, lpc_order_gains
 
-def autocorrelation(signal: np.ndarray, offset: int = 1) -> float:
-    num: float = 0
-    den0: float = 0
-    den1: float = 0
-    N: int = len(signal)
-    for i in range(N - offset):
-        num += signal[i] * signal[i + offset]
-        den0 += signal[i] ** 2
-        den1 += signal[i + offset] ** 2
-    return num / (den0 * den1) ** .5
+def calc_burg_batch(frames: np.ndarray, max_order: int, progressive: bool = False,\
+        dtype: type = np.float64) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates LPC coefficients and gains for every row of a 2-D array of frames at once,
+    running the same recursion as calc_burg over all frames in parallel.
+    
+    The frames are NOT windowed by this function.
+    
+    frames: a 2-D array-like with one pre-windowed frame per row
+    max_order: the maximum order LPC coefficients and gain to calculate
+    progressive: True to also keep the coefficients and gains of every lower order
+    dtype: float type to calculate in and of the results
+    
+    Returns a (frames x max_order) coefficient matrix and an array of one gain per frame.
+    If progressive, returns a (frames x max_order x max_order) array whose [:, o, :o+1]
+    holds the order o+1 coefficients, and a (frames x max_order) array of gains.
+    """
+    frames = np.asanyarray(frames, dtype=dtype)
+    n_frames, N = frames.shape
+    
+    coeffs: np.ndarray = np.zeros((n_frames, max_order), dtype)
+    order_coeffs: Optional[np.ndarray] = None
+    order_gains: Optional[np.ndarray] = None
+    if progressive:
+        order_coeffs = np.zeros((n_frames, max_order, max_order), dtype)
+        order_gains = np.zeros((n_frames, max_order), dtype)
+    error_f: np.ndarray = frames
+    error_b: np.ndarray = frames
+    rho: np.ndarray = np.einsum('ij,ij->i', frames, frames) / N
+    
+    order: int
+    for order in range(max_order):
+        error_f = error_f[:, 1:]
+        error_b = error_b[:, :-1]
+        num: np.ndarray = -2 * np.einsum('ij,ij->i', error_f, error_b)
+        den: np.ndarray = np.einsum('ij,ij->i', error_f, error_f) +\
+            np.einsum('ij,ij->i', error_b, error_b)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            reflection: np.ndarray = num / den
+        reflection[reflection != reflection] = 0
+        
+        rho *= 1 - reflection ** 2
+        
+        column: np.ndarray = reflection[:, np.newaxis]
+        error_f, error_b = error_f + column * error_b, error_b + column * error_f
+        if order:
+            coeffs[:, :order] += column * coeffs[:, order - 1::-1]
+        coeffs[:, order] = reflection
+        if progressive:
+            order_coeffs[:, order, :order + 1] = coeffs[:, :order + 1]
+            order_gains[:, order] = rho
+    
+    if progressive:
+        return order_coeffs, order_gains
+    return coeffs, rho
+
+def autocorrelation(signal: np.ndarray, offset: int = 1) -> Union[float, np.ndarray]:
+    """
+    Calculates the normalized correlation between a signal and itself delayed by offset
+    samples. For a 2-D array, calculates it for each row.
+    """
+    signal = np.asanyarray(signal, dtype=float)
+    head: np.ndarray = signal[..., :signal.shape[-1] - offset]
+    tail: np.ndarray = signal[..., offset:]
+    num: np.ndarray = np.einsum('...i,...i->...', head, tail)
+    den0: np.ndarray = np.einsum('...i,...i->...', head, head)
+    den1: np.ndarray = np.einsum('...i,...i->...', tail, tail)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return num / (den0 * den1) ** .5
 
 def analyze(signal: np.ndarray,\
     order: int, window_size: int, step_size: int,\
     window_type: Optional[Union[str, Callable[[np.ndarray], np.ndarray]]] = None,\
-    progressive: bool = False)\
-        -> Union[List[lpc.LPC], List[List[lpc.LPC]]]:
+    progressive: bool = False, batch: bool = True, framerate: Optional[float] = None,\
+    dtype: type = np.float64) -> Union[List[lpc.LPC], List[List[lpc.LPC]]]:
     """
     Analyzes a signal and returns a list of frames, each frame a tuple of coefficients and gain
     
@@ -72,90 +141,561 @@ def analyze(signal: np.ndarray,\
     window_size: length of each frame
     step_size: stride between frames
     progressive: True to return each order up to the specified max order
+    batch: True to analyze frames in blocks with calc_burg_batch, False to call calc_burg
+        once per frame
+    framerate: sample rate of the signal in Hz; if given, each frame's f0 is estimated and
+        its voicing is the periodicity found by the pitch tracker, clipped to [0, 1].
+        Otherwise voicing is the squared lag-one autocorrelation and f0 is 0.
+    dtype: float type to window and analyze the signal in and of the frames' coefficients.
+        float32 coefficients take half the memory and are what a float32 LPCPlayer plays.
     """
-    signal = np.asanyarray(signal, dtype=float)
+    signal = np.asanyarray(signal, dtype=dtype)
     N: int = len(signal)
     
     frames: Union[List[lpc.LPC], List[List[lpc.LPC]]] = []
-    if window_type is not None:
-        if isinstance(window_type, str):
-            if window_type.lower() == 'none':
-                window_type = None
-            else:
-                window_type = windows.windows[window_type.lower()]
+    window_type = _resolve_window(window_type)
+    profiling.audio('analysis', N, framerate)
+    
+    if batch:
+        return _analyze_batch(signal, order, window_size, step_size, window_type, progressive,\
+            framerate, dtype)
     
     start: int
     for start in range(0, N, step_size):
         sample: np.ndarray = signal[start : start + window_size]
         windowed: np.ndarray = sample
         if window_type is not None:
-            windowed = window_type(windowed)
-        ac: float = autocorrelation(windowed) ** 2
-        _coeffs, _gain = calc_burg(windowed, order)
+            with profiling.stage('analyze.window'):
+                windowed = window_type(windowed)
+        voices, f0s = _voicing(windowed[np.newaxis], framerate)
+        ac: float = voices[0]
+        f0: float = f0s[0]
+        with profiling.stage('analyze.burg'):
+            _coeffs, _gain = calc_burg(windowed, order, dtype)
         if not progressive:
             coeffs: np.ndarray = _coeffs[-1]
-            gain: float = _gain[-1]
-            frames.append(lpc.LPC(coeffs, gain, ac))
+            gain: float = float(_gain[-1])
+            frames.append(lpc.LPC(coeffs, gain, ac, f0))
         else:
             frame: List[lpc.LPC] = []
             for o in range(order):
-                frame.append(lpc.LPC(_coeffs[o], _gain[0], ac))
+                frame.append(lpc.LPC(_coeffs[o], float(_gain[0]), ac, f0))
             frames.append(frame)
     
     return frames
 
+_BATCH_FRAMES: int = 64
+
+def _resolve_window(window_type: Optional[Union[str, Callable[[np.ndarray], np.ndarray]]])\
+        -> Optional[Callable[[np.ndarray], np.ndarray]]:
+    if isinstance(window_type, str):
+        if window_type.lower() == 'none':
+            return None
+        return windows.windows[window_type.lower()]
+    return window_type
+
+def _windowed_blocks(signal: np.ndarray, window_size: int, step_size: int,\
+        window_type: Optional[Callable[[np.ndarray], np.ndarray]], tails: bool = True)\
+        -> Iterator[np.ndarray]:
+    """
+    Yields 2-D blocks of windowed frames covering the same frames as analyze's loop.
+    Frames that fit entirely in the signal are taken _BATCH_FRAMES at a time from a strided
+    view of the signal; the shorter frames at the end are each yielded alone if tails.
+    The frames have the dtype of the signal.
+    """
+    N: int = len(signal)
+    starts: range = range(0, N, step_size)
+    n_full: int = (N - window_size) // step_size + 1 if N >= window_size else 0
+    if n_full:
+        full: np.ndarray = np.lib.stride_tricks.sliding_window_view(signal, window_size)\
+            [::step_size]
+        window: Optional[np.ndarray] = None
+        if isinstance(window_type, windows.Window):
+            window = window_type.coefficients(window_size)
+        elif window_type is not None:
+            window = window_type(np.ones(window_size))
+        if window is not None:
+            window = window.astype(signal.dtype, copy=False)
+        i: int
+        for i in range(0, n_full, _BATCH_FRAMES):
+            block: np.ndarray = full[i : i + _BATCH_FRAMES]
+            if window is not None:
+                with profiling.stage('analyze.window'):
+                    block = block * window
+            yield block
+    if not tails:
+        return
+    start: int
+    for start in starts[n_full:]:
+        tail: np.ndarray = signal[start : start + window_size].copy()
+        if window_type is not None:
+            with profiling.stage('analyze.window'):
+                tail = window_type(tail).astype(signal.dtype, copy=False)
+        yield tail[np.newaxis]
+
+def _voicing(windowed: np.ndarray, framerate: Optional[float])\
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the voicing and f0 of each row of a 2-D array of windowed frames"""
+    if not framerate:
+        with profiling.stage('analyze.autocorrelation'):
+            return autocorrelation(windowed) ** 2, np.zeros(len(windowed))
+    with profiling.stage('analyze.pitch'):
+        periodicity, f0s = pitch.track(windowed, framerate)
+    return np.clip(periodicity, 0, 1), f0s
+
+def _analyze_blocks(blocks: Iterable[np.ndarray], order: int, progressive: bool,\
+        framerate: Optional[float] = None, dtype: type = np.float64)\
+        -> Iterator[Union[lpc.LPC, List[lpc.LPC]]]:
+    """Runs calc_burg_batch on each block of windowed frames and yields the resulting frames"""
+    windowed: np.ndarray
+    for windowed in blocks:
+        with profiling.stage('analyze.burg'):
+            _coeffs, _gains = calc_burg_batch(windowed, order, progressive, dtype)
+        acs, f0s = _voicing(windowed, framerate)
+        i: int
+        for i in range(len(windowed)):
+            if not progressive:
+                yield lpc.LPC(_coeffs[i], float(_gains[i]), acs[i], f0s[i])
+            else:
+                yield [lpc.LPC(_coeffs[i, o, :o + 1], float(_gains[i, 0]), acs[i], f0s[i])\
+                    for o in range(order)]
+
+def _analyze_batch(signal: np.ndarray, order: int, window_size: int, step_size: int,\
+        window_type: Optional[Callable[[np.ndarray], np.ndarray]], progressive: bool,\
+        framerate: Optional[float], dtype: type = np.float64)\
+        -> Union[List[lpc.LPC], List[List[lpc.LPC]]]:
+    """Batched implementation of analyze using calc_burg_batch"""
+    return list(_analyze_blocks(_windowed_blocks(signal, window_size, step_size, window_type),\
+        order, progressive, framerate, dtype))
+
+def analyze_stream(chunks: Iterable[np.ndarray],\
+    order: int, window_size: int, step_size: int,\
+    window_type: Optional[Union[str, Callable[[np.ndarray], np.ndarray]]] = None,\
+    progressive: bool = False, framerate: Optional[float] = None, dtype: type = np.float64)\
+        -> Iterator[Union[lpc.LPC, List[lpc.LPC]]]:
+    """
+    Analyzes a signal delivered in chunks and yields its frames as soon as each frame's
+    window has been received. Only the samples still needed by upcoming windows are kept
+    between chunks. Yields the same frames as analyze on the concatenated chunks.
+    
+    chunks: iterable of array-likes of consecutive input samples
+    """
+    window_type = _resolve_window(window_type)
+    buffer: np.ndarray = np.zeros(0, dtype)
+    skip: int = 0
+    chunk: np.ndarray
+    for chunk in chunks:
+        chunk = np.asanyarray(chunk, dtype=dtype)
+        profiling.audio('analysis', len(chunk), framerate)
+        dropped: int = min(skip, len(chunk))
+        skip -= dropped
+        buffer = np.concatenate((buffer, chunk[dropped:]))
+        if len(buffer) < window_size:
+            continue
+        n_full: int = (len(buffer) - window_size) // step_size + 1
+        yield from _analyze_blocks(_windowed_blocks(buffer, window_size, step_size,\
+            window_type, tails=False), order, progressive, framerate, dtype)
+        skip = max(0, n_full * step_size - len(buffer))
+        buffer = buffer[n_full * step_size:]
+    yield from _analyze_blocks(_windowed_blocks(buffer, window_size, step_size, window_type),\
+        order, progressive, framerate, dtype)
+
+def dump_stream(header: dict, frames: Iterable[lpc.LPC], output: io.IOBase) -> None:
+    """
+    Writes frames to output as they arrive, in the same JSON document json.dump would write
+    for the header with the frames added as its last key 'frames'
+    """
+    opening: str = json.dumps({**header, 'frames': []})
+    output.write(opening[:-2])
+    separator: str = ''
+    frame: lpc.LPC
+    for frame in frames:
+        with profiling.stage('analyze.dump'):
+            output.write(separator)
+            output.write(json.dumps(frame.todict()))
+        separator = ', '
+    output.write(opening[-2:])
+
+_ENVELOPE_FFT: int = 1024
+_MIN_POWER: float = 1e-20
+
+def envelope(frame: lpc.LPC) -> np.ndarray:
+    """Returns the power spectrum of a frame's filter, gain / |A|^2, from 0 to the Nyquist
+    frequency at _ENVELOPE_FFT // 2 + 1 points"""
+    a: np.ndarray = np.concatenate(([1.], frame.coefficients))
+    return np.maximum(frame.gain / np.maximum(np.abs(np.fft.rfft(a, _ENVELOPE_FFT)) ** 2,\
+        _MIN_POWER), _MIN_POWER)
+
+def envelope_power(spectrum: np.ndarray) -> float:
+    """Returns the mean power of a frame from its envelope, the power of the windowed
+    signal it was analyzed from"""
+    return float((spectrum[0] + spectrum[-1] + 2 * spectrum[1:-1].sum()) / _ENVELOPE_FFT)
+
+def levinson(r: np.ndarray, order: int) -> Tuple[np.ndarray, float]:
+    """Returns the prediction coefficients and error power of an autocorrelation sequence
+    by the Levinson-Durbin recursion"""
+    coeffs: np.ndarray = np.zeros(0)
+    error: float = float(r[0])
+    i: int
+    for i in range(order):
+        reflection: float = -(r[i + 1] + coeffs @ r[i:0:-1]) / error
+        coeffs = np.concatenate((coeffs + reflection * coeffs[::-1], [reflection]))
+        error *= 1 - reflection ** 2
+    return coeffs, error
+
+def spectral_distance(p: np.ndarray, q: np.ndarray) -> float:
+    """Returns the RMS difference in dB between two envelopes, gain included"""
+    return float(np.sqrt(np.mean((10 * np.log10(p / q)) ** 2)))
+
+def itakura_saito(p: np.ndarray, q: np.ndarray) -> float:
+    """Returns the Itakura-Saito divergence of envelope p from envelope q"""
+    ratio: np.ndarray = p / q
+    return float(np.mean(ratio - np.log(ratio) - 1))
+
+distances: Dict[str, Callable[[np.ndarray, np.ndarray], float]] = {
+    'spectral': spectral_distance,
+    'itakura-saito': itakura_saito
+}
+
+@dataclass
+class Adaptation:
+    """
+    Energy-adaptive, variable frame rate thinning of analyzed frames. Frames quieter than
+    silence_db are marked silent, as frames with zero gain, or dropped. Each run of
+    consecutive frames that stay within max_distance of the run's first frame is merged into
+    one frame lasting the whole run.
+    
+    Frame to frame, Burg estimates of a steady sound differ by about 2 dB at order 48, so
+    the default max_distance merges runs that differ by about their estimation noise.
+    
+    max_distance: largest distance at which a frame joins a run, in the units of the
+        measure: dB RMS for 'spectral'. 0 to merge only silent frames.
+    measure: name of the distance in distances to compare envelopes with
+    max_voice: largest difference in voicing at which a frame joins a run
+    silence_db: power in dB, relative to a full-scale square wave, below which a windowed
+        frame is silent, or None to treat no frame as silent
+    skip_silence: True to drop silent frames instead of marking them
+    max_duration: most steps a merged frame lasts
+    """
+    max_distance: float = 3
+    measure: str = 'spectral'
+    max_voice: float = .1
+    silence_db: Optional[float] = None
+    skip_silence: bool = False
+    max_duration: int = 64
+    
+    def __post_init__(self) -> None:
+        if self.measure not in distances:
+            raise ValueError(f'Unknown distance measure {self.measure}; '\
+                f'expected one of {", ".join(distances)}')
+    
+    def apply(self, frames: Iterable[lpc.LPC]) -> Iterator[lpc.LPC]:
+        """
+        Yields the frames of analyze or analyze_stream, not progressive, thinned. A merged
+        frame is yielded once the frame after its run arrives.
+        """
+        distance: Callable[[np.ndarray, np.ndarray], float] = distances[self.measure]
+        run: List[lpc.LPC] = []
+        spectra: List[np.ndarray] = []
+        steps: int = 0
+        run_silent: bool = False
+        frame: lpc.LPC
+        for frame in frames:
+            with profiling.stage('analyze.adapt'):
+                spectrum: np.ndarray = envelope(frame)
+                silent: bool = self.silence_db is not None and\
+                    10 * math.log10(envelope_power(spectrum)) < self.silence_db
+                if silent:
+                    if self.skip_silence:
+                        continue
+                    frame = lpc.LPC(np.zeros_like(frame.coefficients), 0., 0., 0.,\
+                        frame.duration)
+                joins: bool = bool(run) and silent == run_silent and\
+                    steps + frame.duration <= self.max_duration and\
+                    (silent or (abs(frame.voice - run[0].voice) <= self.max_voice and\
+                    distance(spectrum, spectra[0]) <= self.max_distance))
+            if joins:
+                run.append(frame)
+                spectra.append(spectrum)
+                steps += frame.duration
+                continue
+            if run:
+                yield _merge(run, spectra)
+            run = [frame]
+            spectra = [spectrum]
+            steps = frame.duration
+            run_silent = silent
+        if run:
+            yield _merge(run, spectra)
+
+def _merge(run: List[lpc.LPC], spectra: List[np.ndarray]) -> lpc.LPC:
+    """
+    Returns one frame lasting a whole run. Its filter is fit to the mean of the run's
+    envelopes, which is the spectrum of their mean autocorrelation, so it is stable. Its
+    voicing and pitch are the run's mean voicing and voiced pitch.
+    """
+    if len(run) == 1:
+        return run[0]
+    with profiling.stage('analyze.adapt'):
+        coefficients: np.ndarray = run[0].coefficients
+        gain: float = 0.
+        if run[0].gain != 0:
+            coefficients, gain = levinson(np.fft.irfft(np.mean(spectra, axis=0)),\
+                len(coefficients))
+        pitches: List[float] = [frame.f0 for frame in run if frame.f0 > 0]
+        return lpc.LPC(coefficients.astype(run[0].coefficients.dtype), float(gain),\
+            float(np.mean([frame.voice for frame in run])),\
+            float(np.mean(pitches)) if pitches else 0.,\
+            sum(frame.duration for frame in run))
+
+def analyze_parallel(signal: np.ndarray,\
+    order: int, window_size: int, step_size: int,\
+    window_type: Optional[Union[str, Callable[[np.ndarray], np.ndarray]]] = None,\
+    progressive: bool = False, workers: Optional[int] = None,\
+    executor: Optional[Executor] = None, framerate: Optional[float] = None,\
+    dtype: type = np.float64) -> Union[List[lpc.LPC], List[List[lpc.LPC]]]:
+    """
+    Analyzes a signal like analyze, splitting its frames into one contiguous block per
+    worker and analyzing the blocks in a process pool. Returns the same frames as analyze.
+    
+    workers: number of processes to use, or None for one per CPU
+    executor: an existing executor to submit blocks to instead of starting a pool
+    
+    window_type must be a window name or a picklable callable.
+    """
+    signal = np.asanyarray(signal, dtype=dtype)
+    n_frames: int = len(range(0, len(signal), step_size))
+    workers = workers or os.cpu_count() or 1
+    if n_frames == 0 or (workers == 1 and executor is None):
+        return analyze(signal, order, window_size, step_size, window_type, progressive,\
+            framerate=framerate, dtype=dtype)
+    bounds: np.ndarray = np.linspace(0, n_frames, min(workers, n_frames) + 1).astype(int)
+    pool: Executor = executor or ProcessPoolExecutor(len(bounds) - 1)
+    try:
+        futures: List[Future] = []
+        first: int
+        last: int
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            block: np.ndarray = signal[first * step_size : (last - 1) * step_size + window_size]
+            futures.append(pool.submit(analyze, block, order, window_size, step_size,\
+                window_type, progressive, framerate=framerate, dtype=dtype))
+        frames: Union[List[lpc.LPC], List[List[lpc.LPC]]] = []
+        future: Future
+        for future, first, last in zip(futures, bounds[:-1], bounds[1:]):
+            frames += future.result()[:last - first]
+    finally:
+        if executor is None:
+            pool.shutdown()
+    return frames
+
+def analyze_file(ipath: str, order: int, step_seconds: float, window_seconds: float = 0,\
+        window_type: str = 'none', workers: int = 1, dtype: type = np.float64,\
+        rate: int = 0, adaptation: Optional[Adaptation] = None) -> dict:
+    """
+    Reads and analyzes a WAV file and returns the dictionary saved by main
+    
+    step_seconds: stride between frames in seconds
+    window_seconds: length of each frame in seconds, or 0 for twice the stride
+    workers: number of processes to split the file's frames across
+    dtype: float type to analyze in; see analyze
+    rate: sample rate in Hz to resample the file to before analysis, or 0 for its own
+    adaptation: settings to thin the frames with, or None to keep every frame
+    """
+    samples, file_rate = wavio.read(ipath, channel=0)
+    if rate and rate != file_rate:
+        with profiling.stage('resample'):
+            samples = resample.resample(samples, file_rate, rate)
+    rate = rate or file_rate
+    step_size: int = int(rate * step_seconds)
+    window_size: int = int(rate * (window_seconds or (step_seconds * 2)))
+    frames: List[lpc.LPC] = analyze_parallel(samples, order, window_size, step_size,\
+        window_type, workers=workers, framerate=rate, dtype=dtype)
+    analysis: dict = {
+        'framerate': rate,
+        'step_size': step_size,
+        'window_size': window_size,
+        'window_type': window_type,
+        'order': order
+    }
+    if adaptation is not None:
+        frames = list(adaptation.apply(frames))
+        analysis['adaptation'] = asdict(adaptation)
+    analysis['frames'] = frames
+    return analysis
+
+def _corpus_paths(paths: List[str]) -> List[str]:
+    """Expands directories to the WAV files they contain and list files to their lines"""
+    expanded: List[str] = []
+    p: str
+    for p in paths:
+        if path.isdir(p):
+            expanded += sorted(glob.glob(path.join(p, '*.wav')) + glob.glob(path.join(p, '*.WAV')))
+        elif path.splitext(p)[1].lower() in ('.txt', '.lst'):
+            with open(p) as file:
+                expanded += [line.strip() for line in file if line.strip()]
+        else:
+            expanded.append(p)
+    return expanded
+
+def _resampled(chunks: Iterable[np.ndarray], from_rate: int, to_rate: int)\
+        -> Iterator[np.ndarray]:
+    """Resamples a stream of chunks, passing them through if the rates are equal"""
+    if from_rate == to_rate:
+        yield from chunks
+        return
+    resampler: resample.Resampler = resample.Resampler(from_rate, to_rate)
+    chunk: np.ndarray
+    for chunk in chunks:
+        with profiling.stage('resample'):
+            chunk = resampler.process(chunk)
+        yield chunk
+    yield resampler.flush()
+
+def _dtype(args: argparse.Namespace) -> type:
+    return np.float32 if args.float32 else np.float64
+
+def _adaptation(args: argparse.Namespace) -> Optional[Adaptation]:
+    if not args.adapt and args.silence is None:
+        return None
+    return Adaptation(args.adapt, args.distance, silence_db=args.silence,\
+        skip_silence=args.skip_silence)
+
+def _main_corpus(args: argparse.Namespace) -> None:
+    """Analyzes many files in a process pool, writing one output per input and/or a bank"""
+    from lpyc_tts_shotgunllama.player import bank, phoneme
+    ipaths: List[str] = _corpus_paths(args.paths)
+    if not ipaths:
+        print('No input files found', file=sys.stderr)
+        exit(1)
+    if args.outdir:
+        os.makedirs(args.outdir, exist_ok=True)
+    continuous: set = set(map(str.lower, args.continuous))
+    writer: Optional[bank.BankWriter] = None
+    try:
+        with ProcessPoolExecutor(args.jobs or None) as pool:
+            futures: List[Future] = [pool.submit(analyze_file, ipath, args.order,\
+                args.step_size, args.window_size, args.window_type, 1, _dtype(args), args.rate,\
+                _adaptation(args)) for ipath in ipaths]
+            ipath: str
+            future: Future
+            for ipath, future in zip(ipaths, futures):
+                name: str = path.splitext(path.basename(ipath))[0]
+                try:
+                    analysis: dict = future.result()
+                except Exception as e:
+                    print(f'Could not analyze {ipath}: {e}', file=sys.stderr)
+                    continue
+                try:
+                    if args.outdir:
+                        with open(path.join(args.outdir, name + '.json'), 'w') as output:
+                            dump_stream({key: value for key, value in analysis.items()\
+                                if key != 'frames'}, analysis['frames'], output)
+                    if args.merge:
+                        if writer is None:
+                            writer = bank.BankWriter(args.merge, args.order, _dtype(args))
+                        writer.add(name.lower(), phoneme.Phoneme(analysis['frames'],\
+                            name.lower() in continuous, analysis['framerate']))
+                except Exception as e:
+                    print(f'Error writing output for {ipath}: {e}', file=sys.stderr)
+                    for future in futures:
+                        future.cancel()
+                    exit(2)
+        if writer is not None:
+            writer.close()
+            writer = None
+    finally:
+        # Discards the spooled bank if analysis stopped early
+        if writer is not None:
+            writer.abort()
+
 def main():
-    import io, json, sys, wave
     parser: argparse.ArgumentParser = argparse.ArgumentParser('Read a WAV file and convert it to saved LPC data')
     parser.add_argument('-o', '--order', type=int, required=True, help='Filter order')
-    parser.add_argument('-f', '--window_type', type=str, default='none', help='Type of windowing function(none, Hann, Hamming, or Welch)')
+    parser.add_argument('-f', '--window_type', type=str, default='none', help='Type of windowing function(none, Hann, Hamming, Welch, Blackman or Kaiser)')
     parser.add_argument('-s', '--step_size', type=float, default=.01, help='Stride of step size in seconds')
     parser.add_argument('-w', '--window_size', type=float, default=0, help='Duration of window in seconds')
-    parser.add_argument('ipath', type=str, help='Path to input .WAV file')
-    parser.add_argument('opath', type=str, nargs='?', default='', help='Path to output .WAV file')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes, or 0 for one per CPU')
+    parser.add_argument('-d', '--outdir', type=str, default='', help='Corpus mode: directory to write one JSON output per input to')
+    parser.add_argument('-m', '--merge', type=str, default='', help='Corpus mode: path of a phoneme bank to write all inputs to')
+    parser.add_argument('-c', '--continuous', type=str, action='append', default=[],\
+        help='Corpus mode: name of an input to mark continuous in the merged bank (repeatable)')
+    parser.add_argument('-r', '--rate', type=int, default=0,\
+        help='Sample rate to resample inputs to before analysis, e.g. 16000 (default: each file\'s own)')
+    parser.add_argument('-a', '--adapt', type=float, default=0,\
+        help='Merge runs of frames within this distance of each other into one frame that lasts '\
+        'the whole run, e.g. 3 (dB for the spectral distance); 0 to keep every frame')
+    parser.add_argument('--distance', type=str, default='spectral', choices=list(distances),\
+        help='Distance measure --adapt compares frames with (default spectral)')
+    parser.add_argument('--silence', type=float, default=None,\
+        help='Power in dB relative to full scale, e.g. -60, below which frames are marked silent')
+    parser.add_argument('--skip-silence', action='store_true',\
+        help='Drop frames below --silence instead of marking them')
+    parser.add_argument('--float32', action='store_true',\
+        help='Analyze in single precision and store float32 frames in a merged bank')
+    parser.add_argument('--profile', action='store_true',\
+        help='Print the time spent in each stage and the real-time factor to stderr; '\
+        'work done in worker processes is not included')
+    parser.add_argument('paths', type=str, nargs='+', help='Path to input .WAV file and optional output path, '\
+        'or in corpus mode any number of .WAV files, directories of them and .txt/.lst files listing them')
     args: argparse.Namespace = parser.parse_args()
+    if not (args.outdir or args.merge) and (path.isdir(args.paths[0]) or len(args.paths) > 2):
+        parser.error('Use --outdir or --merge to analyze a directory or more than one file')
+    profile: Optional[profiling.Profile] = profiling.Profile() if args.profile else None
+    try:
+        with profile or contextlib.nullcontext():
+            if args.outdir or args.merge:
+                _main_corpus(args)
+            else:
+                _main_file(args)
+    finally:
+        if profile is not None:
+            print(profile.report(), file=sys.stderr)
+
+def _main_file(args: argparse.Namespace) -> None:
+    """Analyzes a single file, streaming it through analyze_stream unless split across jobs"""
+    ipath: str = args.paths[0]
+    opath: str = args.paths[1] if len(args.paths) > 1 else ''
     try:
-        with wave.open(args.ipath, 'r') as file:
-            rate: int = file.getframerate()
-            channels: int = file.getnchannels()
-            width: int = file.getsampwidth()
-            nframes: int = file.getnframes()
-            frames: bytes = file.readframes(nframes)
+        reader: wavio.WavReader = wavio.WavReader(ipath, channel=0)
     except Exception as e:
-        print(f'Could not open wav file {args.ipath}: {e}', file=sys.stderr)
+        print(f'Could not open wav file {ipath}: {e}', file=sys.stderr)
         exit(1)
+    rate: int = args.rate or reader.rate
     step_size: int = int(rate * args.step_size)
     window_size: int = int(rate * (args.window_size or (args.step_size * 2)))
-    samples: np.ndarray = np.zeros(nframes)
-    stride: int = channels * width
-    for n in range(nframes):
-        sample: int = int.from_bytes(frames[n * stride : n * stride + width],\
-            'little',\
-            signed = width > 1)
-        if width == 1:
-            sample = round(sample * 255 / 127) - 128
-        sample /= 1 << (width * 8 - 1)
-        samples[n] = sample
-    frames: List[lpc.LPC] = analyze(samples, args.order, window_size, step_size, args.window_type)
+    frames: Iterable[lpc.LPC]
+    if args.jobs == 1:
+        frames = analyze_stream(_resampled(reader.chunks(), reader.rate, rate), args.order,\
+            window_size, step_size, args.window_type, framerate=rate, dtype=_dtype(args))
+    else:
+        frames = analyze_parallel(resample.resample(reader.read(), reader.rate, rate),\
+            args.order, window_size, step_size, args.window_type, workers=args.jobs or None,\
+            framerate=rate, dtype=_dtype(args))
+    adaptation: Optional[Adaptation] = _adaptation(args)
+    header: dict = {
+        'framerate': rate,
+        'step_size': step_size,
+        'window_size': window_size,
+        'window_type': args.window_type,
+        'order': args.order
+    }
+    if adaptation is not None:
+        frames = adaptation.apply(frames)
+        header['adaptation'] = asdict(adaptation)
     output: io.IOBase
     try:
-        if not args.opath:
+        if not opath:
             output = sys.stdout
         else:
-            output = open(args.opath, 'w')
-        json.dump({
-            'framerate': rate,
-            'step_size': step_size,
-            'window_size': window_size,
-            'window_type': args.window_type,
-            'order': args.order,
-            'frames': list(map(lpc.LPC.todict, frames))
-        }, output)
+            output = open(opath, 'w')
+        dump_stream(header, frames, output)
         if output is not sys.stdout:
             output.close()
     except Exception as e:
         print(f'Error writing to specified output {e}', file=sys.stderr)
         exit(2)
+    finally:
+        reader.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
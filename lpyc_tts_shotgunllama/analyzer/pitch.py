@@ -0,0 +1,63 @@
+import numpy as np
+from typing import Tuple
+
+_PEAK_RATIO: float = .9
+
+def autocorrelate(frames: np.ndarray, max_lag: int) -> np.ndarray:
+    """
+    Computes the autocorrelation of every row of a 2-D array of frames for lags 0..max_lag
+    with one batched real FFT
+    """
+    frames = np.asanyarray(frames, dtype=float)
+    N: int = frames.shape[-1]
+    n_fft: int = 1 << max(1, (N + max_lag)).bit_length()
+    spectrum: np.ndarray = np.fft.rfft(frames, n_fft)
+    return np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, n_fft)[..., :max_lag + 1]
+
+def track(frames: np.ndarray, framerate: float, fmin: float = 60, fmax: float = 500,\
+        threshold: float = .45) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estimates the periodicity and fundamental frequency of every row of a 2-D array of
+    frames from the first peak of its normalized autocorrelation, between the lags of fmax
+    and fmin, that comes within _PEAK_RATIO of the highest one.
+
+    frames: 2-D array-like, one windowed frame per row
+    framerate: sample rate of the frames in Hz
+    fmin, fmax: range of fundamental frequencies searched, in Hz
+    threshold: minimum periodicity for a frame to be considered voiced
+
+    Returns an array of periodicities in [-1, 1] and an array of f0 estimates in Hz, with
+    0 for frames that are unvoiced or too short to contain a period.
+    """
+    frames = np.asanyarray(frames, dtype=float)
+    n_frames, N = frames.shape
+    min_lag: int = max(1, int(framerate / fmax))
+    max_lag: int = min(N - 2, int(np.ceil(framerate / fmin)))
+    periodicity: np.ndarray = np.zeros(n_frames)
+    f0: np.ndarray = np.zeros(n_frames)
+    if max_lag <= min_lag or n_frames == 0:
+        return periodicity, f0
+    r: np.ndarray = autocorrelate(frames, max_lag + 1)
+    energy: np.ndarray = r[:, 0]
+    # Undo the taper of the biased estimate so that longer lags are not penalized
+    r = r * (N / (N - np.arange(max_lag + 2)))
+    candidates: np.ndarray = r[:, min_lag : max_lag + 1]
+    # Take the shortest lag whose peak is close to the highest one, so that multiples of
+    # the period, which correlate almost as well, are not mistaken for it
+    peaks: np.ndarray = (candidates >= r[:, min_lag - 1 : max_lag]) &\
+        (candidates >= r[:, min_lag + 1 : max_lag + 2]) &\
+        (candidates >= _PEAK_RATIO * candidates.max(axis=1, keepdims=True))
+    lags: np.ndarray = np.where(peaks.any(axis=1), np.argmax(peaks, axis=1),\
+        np.argmax(candidates, axis=1)) + min_lag
+    rows: np.ndarray = np.arange(n_frames)
+    peak: np.ndarray = r[rows, lags]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        periodicity = np.where(energy > 0, peak / energy, 0)
+        # Parabolic interpolation around the peak for sub-sample lag resolution
+        left: np.ndarray = r[rows, lags - 1]
+        right: np.ndarray = r[rows, lags + 1]
+        curvature: np.ndarray = left - 2 * peak + right
+        offset: np.ndarray = np.where(curvature < 0, .5 * (left - right) / curvature, 0)
+    voiced: np.ndarray = periodicity >= threshold
+    f0[voiced] = framerate / (lags[voiced] + np.clip(offset[voiced], -.5, .5))
+    return periodicity, f0
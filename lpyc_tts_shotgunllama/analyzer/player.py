@@ -2,16 +2,21 @@ from dataclasses import dataclass, field
 import io
 import json
 import numpy as np
-import pyaudio as pa
 import random
 import sys
-from threading import Lock, Thread
-import tkinter as tk
-from tkinter import filedialog as fd, Checkbutton, IntVar
-from typing import List, Tuple, Optional, Union
-import wave
+from threading import Event, Lock, Thread
+from typing import List, Tuple, Optional, Union, TYPE_CHECKING
 
-from lpyc_tts_shotgunllama import lpc
+from lpyc_tts_shotgunllama import lpc, wavio
+from lpyc_tts_shotgunllama.ringbuffer import RingBuffer
+
+# pyaudio and tkinter are only imported once a Console actually opens a stream or a
+# dialog, so that rendering code can import this module without loading them
+if TYPE_CHECKING:
+    import pyaudio as pa
+
+_PA_CONTINUE: int = 0 # pyaudio.paContinue
+_RING_BYTES: int = 1 << 16
 
 @dataclass
 class Console:
@@ -19,12 +24,26 @@ class Console:
     framerate: int
     freq: float = 90
     player: lpc.LPCPlayer = field(init=False)
-    audio: pa.PyAudio = field(init=False, default_factory=pa.PyAudio)
-    stream: pa.Stream = field(init=False, default=None)
-    data: bytes = b'\x00'
-    data_index: int = 0
+    audio: Optional['pa.PyAudio'] = field(init=False, default=None)
+    stream: Optional['pa.Stream'] = field(init=False, default=None)
+    ring: RingBuffer = field(default_factory=lambda: RingBuffer(_RING_BYTES), repr=False)
+    generation: int = 0
     playing: bool = False
     lock: Lock = Lock()
+    _out: bytearray = field(default_factory=lambda: bytearray(_RING_BYTES // 4), repr=False)
+    _out_view: memoryview = field(init=False, repr=False)
+    # Writable and read-only views of the first _out_count bytes of _out, rebuilt only when
+    # the callback's frame count changes so that the callback does not allocate
+    _out_count: int = field(default=-1, init=False, repr=False)
+    _out_slice: memoryview = field(init=False, repr=False)
+    _out_readonly: memoryview = field(init=False, repr=False)
+    # The generation the callback last discarded the ring for, and the event it sets after
+    # every read so that the render thread waits for space instead of polling
+    _played: int = field(default=0, init=False, repr=False)
+    _wake: Event = field(default_factory=Event, init=False, repr=False)
+    
+    def __post_init__(self) -> None:
+        self._out_view = memoryview(self._out)
     
     def toggle(self):
         if not self.stream:
@@ -33,10 +52,15 @@ class Console:
             self.stream.stop_stream()
         else:
             print('starting')
-            self.data_index = 0
             self.stream.start_stream()
         self.playing = not self.playing
     
+    def stop(self) -> None:
+        """Ends the selection playing, so that its render thread exits"""
+        with self.lock:
+            self.generation += 1
+        self._wake.set()
+    
     def play(self, indices: List[int], duration: float = 0.01,\
             dst: Optional[Union[str, io.IOBase]] = None, shuffle: bool = False,\
             repeat: bool = True)\
@@ -51,38 +75,67 @@ class Console:
     def _play(self, indices: List[int], duration: float = 0.01,\
             dst: Optional[Union[str, io.IOBase]] = None, repeat: bool = True)\
             -> None:
-        self.lock.acquire()
-        try:
-            self.player.prime(self.frames[indices[0]], self.freq / self.framerate)
-            sample_array: bytearray = bytearray()
-            
-            index: int
-            for index in indices:
-                frame_played: np.ndarray = self.player.play(self.frames[index],\
-                    self.freq / self.framerate,\
-                    round(self.framerate * duration))
-                sample_array += (frame_played * 32767).astype('<h').tobytes()
-            
-            if not repeat:
-                sample_array += b'\x00' * (2 * 44100 // 2)
-            
-            if dst is None:
-                # stream: pa.Stream = self.audio.open(rate=self.framerate,\
-                    # channels=1, format=pa.get_format_from_width(2), output=True)
-                # stream.write(bytes(sample_array))
-                # stream.close()
-                self.data = bytes(sample_array)
-                self.data_index = 0
-            else:
-                with wave.open(dst, 'w') as wav:
-                    wav.setnframes(len(sample_array) // 2)
-                    wav.setnchannels(1)
-                    wav.setsampwidth(2)
-                    wav.setframerate(self.framerate)
-                    wav.setcomptype('NONE', 'not compressed')
-                    wav.writeframes(sample_array)
-        finally:
-            self.lock.release()
+        """
+        Renders the frames at indices, duration seconds per step that each lasts, to dst, or
+        else into the ring buffer one frame at a time as they render and then over and over
+        until another selection is played or stop is called. Without repeat, half a second
+        of silence separates the loops.
+        """
+        n_samples: int = round(self.framerate * duration)
+        frames: List[lpc.LPC] = [self.frames[index] for index in indices]
+        if dst is not None:
+            with self.lock:
+                self.player.prime(frames[0], self.freq / self.framerate)
+                wavio.write(dst, self._render(frames, n_samples), self.framerate)
+            return
+        with self.lock:
+            self.generation += 1
+            generation: int = self.generation
+            self.player.prime(frames[0], self.freq / self.framerate)
+        # Wakes the thread of the previous selection so that it exits
+        self._wake.set()
+        loop: bytearray = bytearray()
+        frame: lpc.LPC
+        for frame in frames:
+            with self.lock:
+                if generation != self.generation:
+                    return
+                data: bytes = wavio.encode(self._render([frame], n_samples))
+            loop += data
+            if not self._push(generation, data):
+                return
+        if not repeat:
+            silence: bytes = bytes(2 * (self.framerate // 2))
+            loop += silence
+            if not self._push(generation, silence):
+                return
+        while self._push(generation, loop):
+            pass
+    
+    def _render(self, frames: List[lpc.LPC], n_samples: int) -> np.ndarray:
+        """Renders frames in order, each for n_samples samples per step of its duration"""
+        return self.player.render_sequence(\
+            np.array([frame.coefficients for frame in frames]),\
+            np.array([frame.gain for frame in frames]),\
+            np.array([frame.voice for frame in frames]),\
+            np.full(len(frames), self.freq / self.framerate),\
+            np.array([frame.duration for frame in frames]) * n_samples)
+    
+    def _push(self, generation: int, data: bytes) -> bool:
+        """Writes data to the ring buffer as the callback frees space, once the callback has
+        discarded the previous selection; returns False as soon as a newer selection starts
+        playing or the console stops"""
+        view: memoryview = memoryview(data)
+        while True:
+            self._wake.clear()
+            with self.lock:
+                if generation != self.generation:
+                    return False
+                if generation == self._played:
+                    view = view[self.ring.write(view):]
+            if not view:
+                return True
+            self._wake.wait()
     
     def load(self, src: io.IOBase) -> None:
         d: dict = json.load(src)
@@ -92,10 +145,14 @@ class Console:
         if self.stream:
             self.stream.close()
             print('Closed')
+        import pyaudio as pa
+        if self.audio is None:
+            self.audio = pa.PyAudio()
         self.stream = self.audio.open(format=pa.get_format_from_width(2), channels=1,\
             rate=self.framerate, output=True, stream_callback=self.callback)
     
     def load_dlg(self) -> None:
+        from tkinter import filedialog as fd
         file: io.IOBase = fd.askopenfile(filetypes=(('JSON', '*.json'),), defaultextension='.json')
         if file is None:
             return
@@ -105,19 +162,28 @@ class Console:
             file.close()
     
     def callback(self, in_data: None, frame_count: int, time_info: dict, status_flags: int) ->\
-            Tuple[bytes, int]:
-        byte_count = frame_count * 2
-        data: bytes = self.data[self.data_index:self.data_index+byte_count]
-        byte_count -= len(data)
-        data += self.data * (byte_count // len(self.data)) +\
-            self.data[:byte_count % len(self.data)]
-        self.data_index = (self.data_index + len(data))
-        flag: int = pa.paContinue
-        self.data_index %= len(self.data)
-        return (data, flag)
+            Tuple[memoryview, int]:
+        byte_count: int = frame_count * 2
+        if byte_count != self._out_count:
+            if byte_count > len(self._out):
+                self._out = bytearray(byte_count)
+                self._out_view = memoryview(self._out)
+            self._out_slice = self._out_view[:byte_count]
+            self._out_readonly = self._out_slice.toreadonly()
+            self._out_count = byte_count
+        generation: int = self.generation
+        if generation != self._played:
+            # Only the reader may move the read position, so the old selection's bytes are
+            # discarded here rather than by the render thread
+            self.ring.clear()
+            self._played = generation
+        self.ring.read_into(self._out_slice)
+        self._wake.set()
+        return (self._out_readonly, _PA_CONTINUE)
     
     def save(self, start: int, end: int, shuffle: bool) -> None:
         start, end = min(start, end), max(start, end)
+        from tkinter import filedialog as fd
         file: io.IOBase = fd.asksaveasfile(filetypes=(('JSON', '*.json'),('All files', '*.*')),\
             defaultextension='.json')
         if not file:
@@ -135,6 +201,8 @@ class Console:
             file.close()
 
 def main():
+    import tkinter as tk
+    from tkinter import IntVar
     console: Console = Console([], 0)
     file: io.IOBase
     with open('d.json', 'r') as file:
@@ -179,6 +247,7 @@ def main():
     freq.bind('<ButtonRelease-1>', update)
     dur.bind('<ButtonRelease-1>', update)
     tk.mainloop()
+    console.stop()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,43 +1,79 @@
+from dataclasses import dataclass
+import functools
 import math
 import numpy as np
+from typing import Callable, Dict
 
-def sine_window(alpha: float) -> np.ndarray:
-    def _fn(signal: np.ndarray) -> np.ndarray:
+_CACHE_SIZE: int = 128
+
+def _phases(N: int) -> np.ndarray:
+    """Positions (n + 1) / (N + 1) of each sample in a window of length N"""
+    return np.arange(1, N + 1) / (N + 1)
+
+def _sine(N: int, alpha: float) -> np.ndarray:
+    return alpha - (1 - alpha) * np.cos(2 * math.pi * _phases(N))
+
+def _welch(N: int, _: float) -> np.ndarray:
+    return 1 - (2 * _phases(N) - 1) ** 2
+
+def _blackman(N: int, _: float) -> np.ndarray:
+    phases: np.ndarray = _phases(N)
+    return .42 - .5 * np.cos(2 * math.pi * phases) + .08 * np.cos(4 * math.pi * phases)
+
+def _kaiser(N: int, beta: float) -> np.ndarray:
+    return np.i0(beta * np.sqrt(1 - (2 * _phases(N) - 1) ** 2)) / np.i0(beta)
+
+_builders: Dict[str, Callable[[int, float], np.ndarray]] = {
+    'sine': _sine,
+    'welch': _welch,
+    'blackman': _blackman,
+    'kaiser': _kaiser
+}
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def _coefficients(kind: str, param: float, N: int) -> np.ndarray:
+    window: np.ndarray = _builders[kind](N, param)
+    window.setflags(write=False)
+    return window
+
+@dataclass(frozen=True)
+class Window:
+    """
+    A window function. Its coefficients are built once per length and kept in a bounded
+    cache shared by all windows.
+    """
+    kind: str
+    param: float = 0
+
+    def coefficients(self, N: int) -> np.ndarray:
+        """Returns the read-only coefficients of this window for length N"""
+        return _coefficients(self.kind, self.param, N)
+
+    def __call__(self, signal: np.ndarray) -> np.ndarray:
         """
-        Applies a sine-window to the provided signal and returns the result
+        Applies the window along the last axis of signal, which may be a single frame or a
+        2-D batch of frames, and returns the result
         Does not modify the input parameter
         """
-        N: int = len(signal)
-        windowed: np.ndarray = np.asanyarray(signal, dtype=float)
-        
-        n: int
-        for n in range(N):
-            window: float = alpha - (1 - alpha) * math.cos(2 * math.pi * (n + 1) / (N + 1))
-            windowed[n] *= window
-        
-        return windowed
-    return _fn
+        signal = np.asanyarray(signal, dtype=float)
+        return signal * self.coefficients(signal.shape[-1])
+
+def sine_window(alpha: float) -> Window:
+    return Window('sine', alpha)
+
+def kaiser_window(beta: float) -> Window:
+    return Window('kaiser', beta)
 
 hann = sine_window(0.5)
 hamming = sine_window(0.54)
-
-def welch(signal: np.ndarray) -> np.ndarray:
-    """
-    Applies a Welch window to the provided signal and returns the result
-    Does not modify the input parameter
-    """
-    N: int = len(signal)
-    windowed: np.ndarray = np.asanyarray(signal, dtype=float)
-    
-    n: int
-    for n in range(N):
-        window: float = 1 - ( (n + 1 - (N + 1)/2) / ((N + 1)/2) ) ** 2
-        windowed[n] *= window
-    
-    return windowed
+welch = Window('welch')
+blackman = Window('blackman')
+kaiser = kaiser_window(8.6)
 
 windows = {
     'hann': hann,
     'hamming': hamming,
-    'welch': welch
-}
\ No newline at end of file
+    'welch': welch,
+    'blackman': blackman,
+    'kaiser': kaiser
+}
@@ -5,34 +5,39 @@ import math
 import numba
 from numba import jit, typeof
 import numpy as np
-import random
+import time
 from typing import Optional, Tuple
 
-@jit(nopython=True)
+from lpyc_tts_shotgunllama import profiling
+
+# Seconds a warm start may take; enforced by the startup case of benchmarks/bench.py
+STARTUP_TARGET: float = 1.0
+
+@jit(nopython=True, cache=True)
 def _fast_sawtooth(phase: float, _, __) -> float:
     return (phase % 1) * 2 - 1
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def _fast_square(phase: float, _, __) -> float:
     return 1 if (phase % 1) < .5 else -1
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def _fast_triangle(phase: float, _, __) -> float:
     return min(phase % 1, 1 - (phase % 1)) * 4 - 1
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def _fast_halfsin(phase: float, _, __) -> float:
     return math.sin(phase * 2 * math.pi) if (phase % 1) < .5 else 0
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def _fast_quartersin(phase: float, _, __) -> float:
     return math.sin(phase * 2 * math.pi) if (phase % 1) < .25 else 0
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def _fast_rectsin(phase: float, _, __) -> float:
     return abs(math.sin(phase * 2 * math.pi))
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def _fast_pm(phase: float, amt: float, ratio: float) -> float:
     return math.sin(2 * math.pi * (phase + amt * math.sin(phase * ratio * 2 * math.pi)))
 
@@ -40,15 +45,35 @@ _fast_funcs = (
     _fast_sawtooth, _fast_square, _fast_triangle, _fast_halfsin,
     _fast_quartersin, _fast_rectsin, _fast_pm)
 
-@jit(nopython=True)
-def _fast_play(
-        n_samples: int, new_freq: float, new_coeffs: np.ndarray, new_gain: float,
-        new_voice: float, old_freq: float, old_coeffs: np.ndarray, old_gain: float,
-        old_voice: float, speed: float, cache: np.ndarray, index: int, phase: float,
-        funcid=_fast_sawtooth, pm_amt: float=0, pm_freq: float=0) ->\
-        Tuple[np.ndarray, float, np.ndarray, float, float, np.ndarray, int, float]:
-    samples: np.ndarray = np.zeros(n_samples)
-    for i in range(n_samples):
+@jit(nopython=True, cache=True)
+def _fast_pulse(funcid: int, phase: float, pm_amt: float, pm_freq: float) -> float:
+    """Evaluates excitation waveform number funcid of _fast_funcs, so that kernels select the
+    waveform at run time instead of being specialized for each one"""
+    if funcid == 1:
+        return _fast_square(phase, pm_amt, pm_freq)
+    if funcid == 2:
+        return _fast_triangle(phase, pm_amt, pm_freq)
+    if funcid == 3:
+        return _fast_halfsin(phase, pm_amt, pm_freq)
+    if funcid == 4:
+        return _fast_quartersin(phase, pm_amt, pm_freq)
+    if funcid == 5:
+        return _fast_rectsin(phase, pm_amt, pm_freq)
+    if funcid == 6:
+        return _fast_pm(phase, pm_amt, pm_freq)
+    return _fast_sawtooth(phase, pm_amt, pm_freq)
+
+@jit(nopython=True, cache=True)
+def _fast_frame(
+        samples: np.ndarray, start: int, n_samples: int, new_freq: float,
+        new_coeffs: np.ndarray, new_gain: float, new_voice: float, old_freq: float,
+        old_coeffs: np.ndarray, old_gain: float, old_voice: float, speed: float,
+        cache: np.ndarray, index: int, phase: float, funcid: int, pm_amt: float,
+        pm_freq: float) -> Tuple[float, float, float, int, float]:
+    """Renders one frame into samples[start:start+n_samples], updating old_coeffs and cache
+    in place and returning the rest of the new state. On entry, that part of samples must
+    hold the noise to excite the filter with, uniform in [-1, 1]."""
+    for i in range(start, start + n_samples):
         # pulse: float = (phase % 1) * 2 - 1 # Sawtooth in [-1, 1]
         # pulse = 1 if (phase % 1) < .5 else -1 # Square in [-1, 1]
         # pulse = min(phase % 1, 1 - (phase % 1)) * 4 - 1 # Triangle in [-1, 1]
@@ -56,8 +81,8 @@ def _fast_play(
         # pulse = math.sin(phase * 2 * math.pi) if (phase % 1) < .5 else 0 # halfsin
         # pulse = math.sin(phase * 2 * math.pi) if (phase % 1) < .25 else 0 # quartersin
         # pulse = abs(math.sin(phase * 2 * math.pi)) # rectsin
-        pulse = funcid(phase, pm_amt, pm_freq)
-        noise: float = random.random() * 2 - 1 # Noise in [-1, 1]
+        pulse = _fast_pulse(funcid, phase, pm_amt, pm_freq)
+        noise: float = samples[i] # Noise in [-1, 1]
         old_voice += (new_voice - old_voice) * speed
         pulse = noise + (pulse - noise) * old_voice
         old_gain += (new_gain - old_gain) * speed
@@ -65,44 +90,176 @@ def _fast_play(
         # Limits speed of coeffients between 2^-1 and 2^-5 which mostly avoid instability
         # Original was 2^-1 to 2^-6 or something like that
         hspeed: float = min(5, max(1, 7 + math.log10(old_gain)))
-        hspeed = 2 ** -hspeed
+        # Smooth the coefficients in their own type, so float32 ones are not widened
+        rate = old_coeffs.dtype.type(2 ** -hspeed)
         for j in range(len(new_coeffs)):
-            coeff: float = old_coeffs[j]
-            coeff += (new_coeffs[j] - coeff) * hspeed
-            pulse -= cache[index - 1 - j] * coeff
+            coeff = old_coeffs[j]
+            coeff += (new_coeffs[j] - coeff) * rate
+            pulse -= float(cache[index - 1 - j] * coeff)
             old_coeffs[j] = coeff
         cache[index] = pulse
         index = (index + 1) % len(new_coeffs)
         samples[i] = min(1.0, max(-1.0, pulse * old_gain ** .5))
         old_freq += (new_freq - old_freq) * speed
         phase += old_freq
+    return (old_freq, old_gain, old_voice, index, phase)
+
+@jit(nopython=True, cache=True, fastmath={'reassoc', 'contract'})
+def _fast_frame_blocks(
+        samples: np.ndarray, start: int, n_samples: int, new_freq: float,
+        new_coeffs: np.ndarray, new_gain: float, new_voice: float, old_freq: float,
+        old_coeffs: np.ndarray, old_gain: float, old_voice: float, speed: float,
+        cache: np.ndarray, index: int, phase: float, funcid: int, pm_amt: float,
+        pm_freq: float, block_size: int) -> Tuple[float, float, float, int, float]:
+    """Renders one frame like _fast_frame, but advances the coefficient smoothing
+    block_size samples at a time in closed form and filters each block with one fixed set
+    of coefficients: the set that _fast_frame reaches halfway through the block, taking the
+    smoothing rate as constant over the block. Every coefficient set used is therefore one
+    the reference passes through, between the old coefficients and the new ones.
+    Within a block the filter history is kept in a linear buffer, oldest first, so that
+    the filter is a plain dot product, computed in the dtype of cache. The spectra stay
+    within about 1.5 dB RMS of _fast_frame's."""
+    order: int = len(new_coeffs)
+    # Coefficients in the order of the history they multiply, oldest first
+    coeffs: np.ndarray = np.empty(order, cache.dtype)
+    history: np.ndarray = np.empty(order + block_size, cache.dtype)
+    end: int = start + n_samples
+    for block_start in range(start, end, block_size):
+        n: int = min(end, block_start + block_size) - block_start
+        hspeed: float = min(5, max(1, 7 + math.log10(old_gain)))
+        keep: float = 1 - 2 ** -hspeed
+        middle: float = keep ** ((n + 1) / 2)
+        last: float = keep ** n
+        for j in range(order):
+            delta: float = old_coeffs[j] - new_coeffs[j]
+            coeffs[order - 1 - j] = new_coeffs[j] + delta * middle
+            old_coeffs[j] = new_coeffs[j] + delta * last
+            history[j] = cache[(index + j) % order]
+        for k in range(n):
+            i: int = block_start + k
+            pulse = _fast_pulse(funcid, phase, pm_amt, pm_freq)
+            noise: float = samples[i]
+            old_voice += (new_voice - old_voice) * speed
+            pulse = noise + (pulse - noise) * old_voice
+            old_gain += (new_gain - old_gain) * speed
+            prediction = history[k] * coeffs[0]
+            for j in range(1, order):
+                prediction += history[k + j] * coeffs[j]
+            pulse -= prediction
+            history[k + order] = pulse
+            samples[i] = min(1.0, max(-1.0, pulse * old_gain ** .5))
+            old_freq += (new_freq - old_freq) * speed
+            phase += old_freq
+        for j in range(order):
+            cache[(index + n + j) % order] = history[n + j]
+        index = (index + n) % order
+    return (old_freq, old_gain, old_voice, index, phase)
+
+@jit(nopython=True, nogil=True, cache=True)
+def _fast_play(
+        n_samples: int, new_freq: float, new_coeffs: np.ndarray, new_gain: float,
+        new_voice: float, old_freq: float, old_coeffs: np.ndarray, old_gain: float,
+        old_voice: float, speed: float, cache: np.ndarray, index: int, phase: float,
+        funcid: int=0, pm_amt: float=0, pm_freq: float=0,
+        samples: Optional[np.ndarray]=None, block_size: int=1) ->\
+        Tuple[np.ndarray, float, np.ndarray, float, float, np.ndarray, int, float]:
+    if samples is None:
+        samples = np.empty(n_samples, cache.dtype)
+        samples[:] = np.random.random(n_samples) * 2 - 1
+    if block_size > 1:
+        (old_freq, old_gain, old_voice, index, phase) = _fast_frame_blocks(
+            samples, 0, n_samples, new_freq, new_coeffs, new_gain, new_voice, old_freq,
+            old_coeffs, old_gain, old_voice, speed, cache, index, phase, funcid, pm_amt,
+            pm_freq, block_size)
+    else:
+        (old_freq, old_gain, old_voice, index, phase) = _fast_frame(
+            samples, 0, n_samples, new_freq, new_coeffs, new_gain, new_voice, old_freq,
+            old_coeffs, old_gain, old_voice, speed, cache, index, phase, funcid, pm_amt,
+            pm_freq)
     return (samples, old_freq, old_coeffs, old_gain, old_voice, cache, index, phase)
+
+@jit(nopython=True, nogil=True, cache=True)
+def _fast_render(
+        samples: np.ndarray, coefficients: np.ndarray, gains: np.ndarray, voices: np.ndarray,
+        frequencies: np.ndarray, counts: np.ndarray, old_freq: float, old_coeffs: np.ndarray,
+        old_gain: float, old_voice: float, speed: float, cache: np.ndarray, index: int,
+        phase: float, funcid: int, pm_amt: float, pm_freq: float, block_size: int=1) ->\
+        Tuple[float, float, float, int, float]:
+    """Renders a sequence of frames back to back into samples, which must hold the noise
+    to excite the filter with"""
+    start: int = 0
+    for f in range(len(counts)):
+        if block_size > 1:
+            (old_freq, old_gain, old_voice, index, phase) = _fast_frame_blocks(
+                samples, start, counts[f], frequencies[f], coefficients[f], gains[f],
+                voices[f], old_freq, old_coeffs, old_gain, old_voice, speed, cache, index,
+                phase, funcid, pm_amt, pm_freq, block_size)
+        else:
+            (old_freq, old_gain, old_voice, index, phase) = _fast_frame(
+                samples, start, counts[f], frequencies[f], coefficients[f], gains[f],
+                voices[f], old_freq, old_coeffs, old_gain, old_voice, speed, cache, index,
+                phase, funcid, pm_amt, pm_freq)
+        start += counts[f]
+    return (old_freq, old_gain, old_voice, index, phase)
         
 # _fast_play.inspect_types()
 
 @dataclass
 class LPC:
     """
-    An LPC filter with gain, coefficients, and voice param
+    An LPC filter with gain, coefficients, and voice param, and the fundamental frequency
+    in Hz of the frame it was analyzed from, or 0 if unknown or unvoiced
+    
+    duration: number of analysis steps the frame lasts, more than 1 for a frame standing
+        in for a run of similar frames merged by analyze.Adaptation
     """
     coefficients: np.ndarray
     gain: float
     voice: float
+    f0: float = 0
+    duration: int = 1
     
     def order(self) -> int:
         return len(self.coefficients)
     
     def todict(self) -> dict:
-        return {'coefficients': self.coefficients.tolist(), 'gain': self.gain, 'voice': self.voice}
+        d: dict = {'coefficients': self.coefficients.tolist(), 'gain': self.gain,\
+            'voice': self.voice, 'f0': self.f0}
+        if self.duration != 1:
+            d['duration'] = self.duration
+        return d
     
     @staticmethod
-    def fromdict(d: dict) -> Optional['LPC']:
-        return LPC(np.array(d['coefficients']), d['gain'], d['voice'])
+    def fromdict(d: dict, dtype: type = np.float64) -> Optional['LPC']:
+        return LPC(np.array(d['coefficients'], dtype=dtype), d['gain'], d['voice'], d.get('f0', 0),\
+            d.get('duration', 1))
+
+@dataclass(frozen=True)
+class PlayerState:
+    """
+    A snapshot of the filter state of an LPCPlayer, excluding its random generator
+    """
+    frequency: float
+    gain: float
+    voice: float
+    index: int
+    phase: float
+    cache: np.ndarray
+    coefficients: np.ndarray
+    
+    @property
+    def nbytes(self) -> int:
+        return self.cache.nbytes + self.coefficients.nbytes
 
 @dataclass
 class LPCPlayer:
     """
     Runs an LPC
+    
+    block_size: samples to hold the coefficients fixed for, or 1 to smooth them every sample;
+        at order 48, 32 renders in about 0.6 ms instead of 4.5 ms, with spectra within
+        about 1.5 dB RMS of the per-sample reference's (tested to under 3 dB)
+    dtype: np.float64 or np.float32, the type of the filter state, noise and samples
     """
     order: int
     speed: float = 2**-12
@@ -111,12 +268,50 @@ class LPCPlayer:
     frequency: float = 0.5
     index: int = 0
     phase: float = 0
+    seed: Optional[int] = None
+    block_size: int = 1
+    dtype: type = np.float64
     cache: np.ndarray = field(init=False)
     coefficients: np.ndarray = field(init=False)
+    rng: np.random.Generator = field(init=False, repr=False)
     
     def __post_init__(self):
-        self.cache = np.zeros(self.order)
-        self.coefficients = np.zeros(self.order)
+        if np.dtype(self.dtype) not in (np.float32, np.float64):
+            raise ValueError(f'LPCPlayer dtype must be float32 or float64, got {self.dtype}')
+        self.cache = np.zeros(self.order, self.dtype)
+        self.coefficients = np.zeros(self.order, self.dtype)
+        self.rng = np.random.default_rng(self.seed)
+    
+    def reseed(self, seed: Optional[int]) -> None:
+        """Restarts the random generator used for noise, frame selection and vibrato.
+        The same seed and calls produce bit-identical samples."""
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+    
+    def state(self) -> PlayerState:
+        """Returns a copy of the current filter state"""
+        return PlayerState(self.frequency, self.gain, self.voice, self.index, self.phase,\
+            self.cache.copy(), self.coefficients.copy())
+    
+    def restore(self, state: PlayerState) -> None:
+        """Sets the filter state to a snapshot taken with state()"""
+        self.frequency = state.frequency
+        self.gain = state.gain
+        self.voice = state.voice
+        self.index = state.index
+        self.phase = state.phase
+        self.cache = state.cache.copy()
+        self.coefficients = state.coefficients.copy()
+    
+    def noise(self, n_samples: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Draws a block of n_samples uniform noise samples in [-1, 1) from rng"""
+        if out is None:
+            out = np.empty(n_samples, self.dtype)
+        block: np.ndarray = out[:n_samples]
+        self.rng.random(n_samples, dtype=block.dtype, out=block)
+        block *= 2
+        block -= 1
+        return block
     
     def prime(self, lpc: LPC, frequency: float) -> None:
         """Call before the first call to play with the first frame to be played to set up
@@ -125,8 +320,8 @@ class LPCPlayer:
             raise AttributeError(f'Order of LPCPlayer {self.order} does not match order of LPC {lpc.order()}')
         self.gain = lpc.gain
         self.voice = lpc.voice
-        self.coefficients = lpc.coefficients.copy()
-        self.cache = np.zeros(self.order)
+        self.coefficients = np.array(lpc.coefficients, dtype=self.dtype)
+        self.cache = np.zeros(self.order, self.dtype)
         self.frequency = frequency
         self.index = 0
         self.phase = 0
@@ -140,9 +335,80 @@ class LPCPlayer:
         """Plays an LPC and returns the array of samples"""
         if self.order != lpc.order():
             raise AttributeError(f'Order of LPCPlayer {self.order} does not match order of LPC {lpc.order()}')
-        (samples, self.frequency, self.coefficients, self.gain,\
-            self.voice, self.cache, self.index, self.phase) =\
-            _fast_play(n_samples, frequency, lpc.coefficients, lpc.gain, lpc.voice, self.frequency,\
-                self.coefficients, self.gain, self.voice, self.speed, self.cache, self.index,\
-                self.phase, _fast_funcs[funcid], *pm)
-        return samples
\ No newline at end of file
+        with profiling.stage('LPCPlayer.noise'):
+            noise: np.ndarray = self.noise(n_samples)
+        with profiling.stage('LPCPlayer.kernel'):
+            (samples, self.frequency, self.coefficients, self.gain,\
+                self.voice, self.cache, self.index, self.phase) =\
+                _fast_play(n_samples, frequency, np.asarray(lpc.coefficients, dtype=self.dtype),\
+                    lpc.gain, lpc.voice, self.frequency, self.coefficients, self.gain,\
+                    self.voice, self.speed, self.cache, self.index, self.phase, funcid, *pm,\
+                    noise, self.block_size)
+        return samples
+    
+    def render_sequence(self,
+            coefficients: np.ndarray,
+            gains: np.ndarray,
+            voices: np.ndarray,
+            frequencies: np.ndarray,
+            counts: np.ndarray,
+            funcid: int=0,
+            pm: Tuple[float, float]=(0,0),
+            out: Optional[np.ndarray]=None) -> np.ndarray:
+        """
+        Plays a sequence of frames in one compiled call, equivalent to calling play once
+        per frame, and returns the samples
+        
+        coefficients: (frames x order) matrix of filter coefficients
+        gains, voices: gain and voice param of each frame
+        frequencies: frequency of each frame, in cycles per sample
+        counts: number of samples to play each frame for
+        out: buffer of at least sum(counts) samples of the player's dtype to render into
+            instead of a new array
+        """
+        coefficients = np.asarray(coefficients, dtype=self.dtype)
+        if coefficients.ndim != 2 or coefficients.shape[1] != self.order:
+            raise AttributeError(f'Order of LPCPlayer {self.order} does not match coefficients of shape {coefficients.shape}')
+        counts = np.asarray(counts, dtype=np.int64)
+        n_samples: int = int(counts.sum())
+        if out is None:
+            out = np.empty(n_samples, self.dtype)
+        elif len(out) < n_samples:
+            raise ValueError(f'Output buffer of {len(out)} samples cannot hold {n_samples}')
+        with profiling.stage('LPCPlayer.noise'):
+            self.noise(n_samples, out)
+        with profiling.stage('LPCPlayer.kernel'):
+            (self.frequency, self.gain, self.voice, self.index, self.phase) =\
+                _fast_render(out, coefficients, np.asarray(gains, dtype=float),\
+                    np.asarray(voices, dtype=float), np.asarray(frequencies, dtype=float),\
+                    counts, self.frequency, self.coefficients, self.gain, self.voice,\
+                    self.speed, self.cache, self.index, self.phase, funcid, *pm,\
+                    self.block_size)
+        return out[:n_samples]
+
+def warmup() -> float:
+    """
+    Compiles, or loads from numba's on-disk cache, every synthesis kernel by running each
+    once on a tiny input, and returns the seconds taken. Call this at startup so that the
+    first real render does not pay for compilation. With a warm cache, importing this
+    module and calling warmup should take well under STARTUP_TARGET seconds.
+    """
+    start: float = time.perf_counter()
+    player: LPCPlayer = LPCPlayer(2)
+    frame: LPC = LPC(np.zeros(2), 1., 1.)
+    player.prime(frame, .01)
+    player.play(frame, .01, 1)
+    player.render_sequence(np.zeros((1, 2)), np.ones(1), np.ones(1), np.full(1, .01),\
+        np.ones(1, dtype=np.int64))
+    player.block_size = 2
+    player.render_sequence(np.zeros((1, 2)), np.ones(1), np.ones(1), np.full(1, .01),\
+        np.ones(1, dtype=np.int64))
+    player = LPCPlayer(2, dtype=np.float32)
+    player.prime(frame, .01)
+    player.play(frame, .01, 1)
+    player.render_sequence(np.zeros((1, 2)), np.ones(1), np.ones(1), np.full(1, .01),\
+        np.ones(1, dtype=np.int64))
+    player.block_size = 2
+    player.render_sequence(np.zeros((1, 2)), np.ones(1), np.ones(1), np.full(1, .01),\
+        np.ones(1, dtype=np.int64))
+    return time.perf_counter() - start
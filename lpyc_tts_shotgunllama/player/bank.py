@@ -0,0 +1,315 @@
+"""
+Packed phoneme banks
+
+A bank stores every phoneme of a phonology in a single binary file so that it can be
+memory-mapped instead of parsed. The layout is:
+
+    MAGIC | column data ... | JSON index | index length (<Q) | MAGIC
+
+Each per-frame column (coefficients, gains, voices, pitches, durations) is one contiguous array covering the
+frames of all phonemes back to back, aligned to _ALIGN bytes. The JSON index records the
+offset, dtype and shape of every column and maps each phoneme name to its [start, stop)
+frame range along with its continuous flag and framerate. Banks written before frames had
+durations have no durations column, and their frames last one step each.
+
+A bank compressed by player.codebook has a version 2 index with a 'codebook' entry. In place
+of the coefficients it stores a shared 'codebook' of line spectral frequencies and per-frame
+'indices' into it, and its gains and voices are quantized to bytes. The codebook is decoded
+to a table of coefficients once, when the first phoneme is built. The version decides how a
+bank is read, and a bank whose codebook entry disagrees with its version is rejected.
+"""
+import argparse
+from dataclasses import dataclass, field
+import json
+import numpy as np
+from os import path
+import shutil
+import struct
+import sys
+import tempfile
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from lpyc_tts_shotgunllama import lpc
+from lpyc_tts_shotgunllama.player.phoneme import Phoneme
+
+MAGIC: bytes = b'LPCBANK\x00'
+# Newest format this module reads; banks without a codebook are still written as version 1
+VERSION: int = 2
+_PLAIN_VERSION: int = 1
+_ALIGN: int = 64
+_FOOTER: struct.Struct = struct.Struct('<Q8s')
+
+def _frame_columns(order: int, dtype: np.dtype) -> Dict[str, Tuple[np.dtype, Tuple[int, ...]]]:
+    return {
+        'coefficients': (dtype, (order,)),
+        'gains': (dtype, ()),
+        'voices': (dtype, ()),
+        'pitches': (dtype, ()),
+        'durations': (np.dtype(np.uint32), ()),
+    }
+
+class BankWriter:
+    """
+    Writes a bank file one phoneme, or one frame, at a time
+
+    Column data is spooled to temporary files while writing, so memory use does not
+    depend on the number of frames written.
+    """
+
+    def __init__(self, dst: str, order: int, dtype: np.dtype = np.float64) -> None:
+        self.path: str = dst
+        self.order: int = order
+        self.columns: Dict[str, Tuple[np.dtype, Tuple[int, ...]]] =\
+            _frame_columns(order, np.dtype(dtype))
+        self.phonemes: Dict[str, dict] = {}
+        self.n_frames: int = 0
+        self._spools: Dict[str, BinaryIO] = {name: tempfile.TemporaryFile()\
+            for name in self.columns}
+        self._current: Optional[Tuple[str, bool, int, int]] = None
+
+    def begin(self, name: str, continuous: bool, framerate: int) -> None:
+        """Starts a new phoneme; subsequent calls to append add frames to it"""
+        if self._current is not None:
+            self.end()
+        if name in self.phonemes:
+            raise KeyError(f'Phoneme {name} already written to bank')
+        self._current = (name, continuous, framerate, self.n_frames)
+
+    def append(self, frame: lpc.LPC) -> None:
+        """Appends a single frame to the current phoneme"""
+        if self._current is None:
+            raise ValueError('append called before begin')
+        if frame.order() != self.order:
+            raise AttributeError(f'Order of bank {self.order} does not match order of LPC {frame.order()}')
+        self._write_column('coefficients', frame.coefficients)
+        self._write_column('gains', frame.gain)
+        self._write_column('voices', frame.voice)
+        self._write_column('pitches', frame.f0)
+        self._write_column('durations', frame.duration)
+        self.n_frames += 1
+
+    def extend(self, frames: Iterable[lpc.LPC]) -> None:
+        """Appends frames to the current phoneme as they are produced, e.g. by analyze_stream"""
+        frame: lpc.LPC
+        for frame in frames:
+            self.append(frame)
+
+    def end(self) -> None:
+        """Finishes the current phoneme"""
+        if self._current is None:
+            return
+        name, continuous, framerate, start = self._current
+        self.phonemes[name] = {
+            'start': start,
+            'stop': self.n_frames,
+            'continuous': bool(continuous),
+            'framerate': int(framerate)
+        }
+        self._current = None
+
+    def add(self, name: str, phoneme: Phoneme) -> None:
+        """Writes a whole phoneme"""
+        self.begin(name, phoneme.continuous, phoneme.framerate)
+        self.extend(phoneme.frames)
+        self.end()
+
+    def close(self) -> None:
+        """Finishes the last phoneme and writes the bank to disk"""
+        self.end()
+        index: dict = {
+            'version': _PLAIN_VERSION,
+            'order': self.order,
+            'n_frames': self.n_frames,
+            'columns': {},
+            'phonemes': self.phonemes
+        }
+        with open(self.path, 'wb') as dst:
+            dst.write(MAGIC)
+            name: str
+            for name, (dtype, shape) in self.columns.items():
+                spool: BinaryIO = self._spools[name]
+                spool.seek(0)
+                _append_column(dst, index, name, dtype, [self.n_frames, *shape],\
+                    lambda: shutil.copyfileobj(spool, dst))
+                spool.close()
+            _write_footer(dst, index)
+
+    def abort(self) -> None:
+        """Discards the spooled columns without writing the bank"""
+        spool: BinaryIO
+        for spool in self._spools.values():
+            spool.close()
+
+    def _write_column(self, name: str, value: Union[float, np.ndarray]) -> None:
+        dtype, _ = self.columns[name]
+        self._spools[name].write(np.asarray(value, dtype=dtype).tobytes())
+
+    def __enter__(self) -> 'BankWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def _append_column(dst: BinaryIO, index: dict, name: str, dtype: np.dtype, shape: List[int],\
+        write: Callable[[], Any]) -> None:
+    """Aligns dst, records a column in the index and calls write to write its data"""
+    dst.write(b'\x00' * (-dst.tell() % _ALIGN))
+    index['columns'][name] = {
+        'offset': dst.tell(),
+        'dtype': dtype.str,
+        'shape': shape
+    }
+    write()
+
+def _write_footer(dst: BinaryIO, index: dict) -> None:
+    encoded: bytes = json.dumps(index).encode('utf-8')
+    dst.write(encoded)
+    dst.write(_FOOTER.pack(len(encoded), MAGIC))
+
+def write_arrays(dst: str, index: dict, columns: Mapping[str, np.ndarray]) -> None:
+    """Writes a bank file from an index, without its 'columns' entry, and whole column arrays"""
+    index = dict(index, columns={})
+    with open(dst, 'wb') as file:
+        file.write(MAGIC)
+        name: str
+        array: np.ndarray
+        for name, array in columns.items():
+            array = np.ascontiguousarray(array)
+            _append_column(file, index, name, array.dtype, list(array.shape),\
+                lambda: file.write(array.tobytes()))
+        _write_footer(file, index)
+
+def write_bank(dst: str, phonemes: Mapping[str, Phoneme], dtype: np.dtype = np.float64) -> None:
+    """Writes a mapping of phonemes to a bank file"""
+    if not phonemes:
+        raise ValueError('Cannot write an empty bank')
+    first: Phoneme = next(iter(phonemes.values()))
+    with BankWriter(dst, first.frames[0].order(), dtype) as writer:
+        name: str
+        phoneme: Phoneme
+        for name, phoneme in phonemes.items():
+            writer.add(name, phoneme)
+
+@dataclass
+class Bank(Mapping[str, Phoneme]):
+    """
+    A read-only, memory-mapped bank of phonemes
+
+    Only the index is parsed when the bank is opened. Each phoneme's frames are built
+    on first access as views into the mapped column arrays and are then kept.
+    """
+    path: str
+    index: dict = field(init=False, repr=False)
+    columns: Dict[str, np.ndarray] = field(init=False, repr=False)
+    _phonemes: Dict[str, Phoneme] = field(init=False, repr=False, default_factory=dict)
+    _table: Optional[np.ndarray] = field(init=False, repr=False, default=None)
+
+    def __post_init__(self) -> None:
+        with open(self.path, 'rb') as src:
+            if src.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{self.path} is not a phoneme bank')
+            src.seek(-_FOOTER.size, 2)
+            footer_start: int = src.tell()
+            length, magic = _FOOTER.unpack(src.read(_FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError(f'{self.path} is truncated or corrupt')
+            src.seek(footer_start - length)
+            self.index = json.loads(src.read(length).decode('utf-8'))
+        if self.index['version'] > VERSION:
+            raise ValueError(f'Bank version {self.index["version"]} is newer than supported {VERSION}')
+        if self.compressed != ('codebook' in self.index):
+            raise ValueError(f'{self.path} has a version {self.index["version"]} index '\
+                f'{"without" if self.compressed else "with"} a codebook')
+        mapped: np.ndarray = np.memmap(self.path, dtype=np.uint8, mode='r')
+        self.columns = {}
+        name: str
+        column: dict
+        for name, column in self.index['columns'].items():
+            dtype: np.dtype = np.dtype(column['dtype'])
+            shape: Tuple[int, ...] = tuple(column['shape'])
+            n_bytes: int = int(np.prod(shape)) * dtype.itemsize
+            self.columns[name] = mapped[column['offset'] : column['offset'] + n_bytes]\
+                .view(dtype).reshape(shape)
+
+    @property
+    def compressed(self) -> bool:
+        """Whether the frames are stored as codebook indices, as versions after 1 are"""
+        return self.index['version'] > _PLAIN_VERSION
+
+    def order(self) -> int:
+        return self.index['order']
+
+    def __getitem__(self, name: str) -> Phoneme:
+        phoneme: Optional[Phoneme] = self._phonemes.get(name)
+        if phoneme is None:
+            entry: dict = self.index['phonemes'][name]
+            frames: slice = slice(entry['start'], entry['stop'])
+            pitches: Optional[np.ndarray] = self.columns['pitches'][frames]\
+                if 'pitches' in self.columns else None
+            durations: Optional[np.ndarray] = self.columns['durations'][frames]\
+                if 'durations' in self.columns else None
+            if self.compressed:
+                phoneme = self._decode(entry, frames, pitches, durations)
+            else:
+                phoneme = Phoneme.fromarrays(self.columns['coefficients'][frames],\
+                    self.columns['gains'][frames], self.columns['voices'][frames],\
+                    entry['continuous'], entry['framerate'], pitches, durations)
+            self._phonemes[name] = phoneme
+        return phoneme
+
+    def _decode(self, entry: dict, frames: slice, pitches: Optional[np.ndarray],\
+            durations: Optional[np.ndarray]) -> Phoneme:
+        """Builds a phoneme of a compressed bank from the decoded codebook table"""
+        from lpyc_tts_shotgunllama.player import codebook
+        if self._table is None:
+            self._table = codebook.from_lsf(self.columns['codebook'])
+        info: dict = self.index['codebook']
+        return Phoneme.fromarrays(self._table[self.columns['indices'][frames]],\
+            codebook.dequantize_gains(self.columns['gains'][frames], *info['gain_range']),\
+            codebook.dequantize_voices(self.columns['voices'][frames]),\
+            entry['continuous'], entry['framerate'],\
+            None if pitches is None else pitches.astype(float), durations)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index['phonemes'])
+
+    def __len__(self) -> int:
+        return len(self.index['phonemes'])
+
+    def __contains__(self, name: Any) -> bool:
+        return name in self.index['phonemes']
+
+def main():
+    parser: argparse.ArgumentParser = argparse.ArgumentParser('Pack phoneme or analysis JSON files into a phoneme bank')
+    parser.add_argument('-o', '--output', type=str, required=True, help='Path to output bank file')
+    parser.add_argument('-c', '--continuous', type=str, action='append', default=[],\
+        help='Name of a phoneme to mark continuous when its input does not say (repeatable)')
+    parser.add_argument('--float32', action='store_true',\
+        help='Store the frames in single precision, halving the size of the bank')
+    parser.add_argument('ipaths', type=str, nargs='+',\
+        help='Input JSON files; each is stored under its file name without extension')
+    args: argparse.Namespace = parser.parse_args()
+    continuous: set = set(map(str.lower, args.continuous))
+    phonemes: Dict[str, Phoneme] = {}
+    ipath: str
+    for ipath in args.ipaths:
+        name: str = path.splitext(path.basename(ipath))[0].lower()
+        try:
+            with open(ipath) as file:
+                d: dict = json.load(file)
+        except Exception as e:
+            print(f'Could not read {ipath}: {e}', file=sys.stderr)
+            exit(1)
+        d.setdefault('continuous', name in continuous)
+        phonemes[name] = Phoneme.fromdict(d)
+    try:
+        write_bank(args.output, phonemes, np.float32 if args.float32 else np.float64)
+    except Exception as e:
+        print(f'Error writing bank {args.output}: {e}', file=sys.stderr)
+        exit(2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Bounded cache of rendered audio
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import numpy as np
+from threading import Lock
+from typing import Dict, Hashable, Optional, Tuple
+
+from lpyc_tts_shotgunllama import lpc
+
+@dataclass
+class RenderCache:
+    """
+    A least-recently-used cache of rendered segments, each stored with the player state at
+    its end, limited to max_bytes of samples and state
+
+    seed: base seed of the randomness of the segments rendered for the cache. It belongs to
+        the cache rather than to a player so that players with different seeds, such as the
+        workers of a seeded SynthesisPool, share entries.
+    """
+    max_bytes: int = 64 << 20
+    seed: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    nbytes: int = 0
+    _entries: 'OrderedDict[Hashable, Tuple[np.ndarray, lpc.PlayerState]]' =\
+        field(default_factory=OrderedDict, init=False, repr=False)
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False)
+    
+    def get(self, key: Hashable) -> Optional[Tuple[np.ndarray, lpc.PlayerState]]:
+        """Returns the read-only samples and end state stored for key, or None"""
+        with self._lock:
+            entry: Optional[Tuple[np.ndarray, lpc.PlayerState]] = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+    
+    def put(self, key: Hashable, samples: np.ndarray, state: lpc.PlayerState) -> None:
+        """Stores a copy of samples with the player state at their end, evicting the least
+        recently used entries to stay within max_bytes"""
+        size: int = samples.nbytes + state.nbytes
+        if size > self.max_bytes:
+            return
+        samples = samples.copy()
+        samples.setflags(write=False)
+        with self._lock:
+            old: Optional[Tuple[np.ndarray, lpc.PlayerState]] = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[0].nbytes + old[1].nbytes
+            self._entries[key] = (samples, state)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (evicted, evicted_state) = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes + evicted_state.nbytes
+                self.evictions += 1
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Returns the hit, miss and eviction counters along with the current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.nbytes
+            }
+    
+    def __len__(self) -> int:
+        return len(self._entries)
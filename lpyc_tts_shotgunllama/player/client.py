@@ -0,0 +1,81 @@
+"""
+Client for the synthesis daemon in player.daemon
+"""
+import argparse
+import json
+import socket
+import sys
+from typing import Iterator, Optional, Tuple
+
+from lpyc_tts_shotgunllama.player.daemon import Address, add_address_arguments, address_of,\
+    connect
+
+_RECV_BYTES: int = 1 << 16
+
+def request(address: Address, text: str, mode: str = 'speak', fmt: str = 'wav',\
+        seed: Optional[int] = None, **params) -> Tuple[dict, Iterator[bytes]]:
+    """
+    Sends a synthesis request and returns the response header and an iterator over the
+    audio bytes as they arrive
+
+    mode: 'speak' or 'sing' for markup, or 'text' for plain text
+    params: keyword arguments of compile_str, or of compile_sing if mode is 'sing'
+    Raises RuntimeError if the daemon rejects the request.
+    """
+    sock: socket.socket = connect(address)
+    message: dict = {'text': text, 'mode': mode, 'format': fmt, 'params': params}
+    if seed is not None:
+        message['seed'] = seed
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+    stream = sock.makefile('rb')
+    header: dict = json.loads(stream.readline().decode('utf-8'))
+    if 'error' in header:
+        stream.close()
+        sock.close()
+        raise RuntimeError(header['error'])
+    
+    def chunks() -> Iterator[bytes]:
+        try:
+            while True:
+                data: bytes = stream.read1(_RECV_BYTES)
+                if not data:
+                    return
+                yield data
+        finally:
+            stream.close()
+            sock.close()
+    
+    return header, chunks()
+
+def main():
+    parser: argparse.ArgumentParser = argparse.ArgumentParser('Request speech from a running synthesis daemon')
+    parser.add_argument('text', type=str, help='Markup to speak or sing, or plain text with --plain')
+    parser.add_argument('-o', '--output', type=str, default='-',\
+        help='Path to write audio to, or - for standard output (default)')
+    parser.add_argument('--sing', action='store_true', help='Sing instead of speaking')
+    parser.add_argument('--plain', action='store_true',\
+        help='Speak plain text, converted to markup by the daemon')
+    parser.add_argument('--pcm', action='store_true', help='Write raw 16-bit PCM instead of WAV')
+    parser.add_argument('-f', '--freq', type=float, default=None, help='Base frequency in Hz')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='Seed for the player')
+    add_address_arguments(parser)
+    args: argparse.Namespace = parser.parse_args()
+    params: dict = {} if args.freq is None else {'base_freq': args.freq}
+    try:
+        mode: str = 'sing' if args.sing else 'text' if args.plain else 'speak'
+        header, chunks = request(address_of(args), args.text, mode, 'pcm' if args.pcm else 'wav',\
+            args.seed, **params)
+    except (OSError, RuntimeError) as e:
+        print(f'Request failed: {e}', file=sys.stderr)
+        exit(1)
+    dst = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    try:
+        chunk: bytes
+        for chunk in chunks:
+            dst.write(chunk)
+    finally:
+        if dst is not sys.stdout.buffer:
+            dst.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""
+Vector-quantized compression of phoneme banks
+
+Frames are converted from prediction coefficients to line spectral frequencies (LSFs), which
+interpolate and quantize well and always decode to a stable filter while they stay sorted.
+The LSFs of all frames of a bank are clustered with k-means into a shared codebook, and each
+frame keeps only the index of its nearest codeword, its gain quantized on a log scale to a
+byte, its voicing quantized to a byte, its pitch as a half float and its duration.
+
+    python -m lpyc_tts_shotgunllama.player.codebook voice.bank -o voice.vq.bank -k 256
+"""
+import argparse
+import numpy as np
+import sys
+from typing import Dict, List, Mapping, Tuple
+
+from lpyc_tts_shotgunllama.player import bank
+from lpyc_tts_shotgunllama.player.phoneme import Phoneme
+
+_MIN_GAIN: float = 1e-12
+_N_FFT: int = 512
+_GRID: int = 1 << 13
+_REFINEMENTS: int = 4
+
+def _split(order: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the factors of the trivial roots of the sum and difference polynomials"""
+    if order % 2 == 0:
+        return np.array([1., 1.]), np.array([1., -1.])
+    return np.array([1.]), np.array([1., 0., -1.])
+
+def _roots_by_eig(polynomial: np.ndarray, trivial: np.ndarray) -> np.ndarray:
+    """Returns the angles in (0, pi) of the roots of a sum or difference polynomial"""
+    reduced: np.ndarray = np.polydiv(polynomial, trivial)[0]
+    # Roots come in conjugate pairs on the unit circle; keep one of each pair
+    return np.sort(np.abs(np.angle(np.roots(reduced))))[1::2]
+
+def _zero_phase(polynomials: np.ndarray, angles: np.ndarray, symmetric: bool) -> np.ndarray:
+    """
+    Evaluates rows of symmetric or antisymmetric polynomials in z^-1 on the unit circle at
+    the given angles, one angle per row, with the linear phase removed so that the result
+    is real
+    """
+    n: np.ndarray = np.arange(polynomials.shape[1]) - (polynomials.shape[1] - 1) / 2
+    basis: np.ndarray = np.cos(angles[:, np.newaxis] * n) if symmetric else\
+        np.sin(angles[:, np.newaxis] * n)
+    return np.einsum('ij,ij->i', polynomials, basis)
+
+def to_lsf(coefficients: np.ndarray) -> np.ndarray:
+    """
+    Converts rows of prediction coefficients, as used by LPCPlayer, to sorted line spectral
+    frequencies in radians. The filters must be stable, as Burg's method guarantees.
+    
+    The roots are bracketed by sign changes on a grid of _GRID angles evaluated with one
+    FFT per polynomial and refined by regula falsi. Rows with roots closer together than
+    the grid fall back to numpy's eigenvalue root finder.
+    """
+    coefficients = np.atleast_2d(np.asanyarray(coefficients, dtype=float))
+    n_frames, order = coefficients.shape
+    a: np.ndarray = np.hstack((np.ones((n_frames, 1)), coefficients, np.zeros((n_frames, 1))))
+    polynomials: Tuple[np.ndarray, np.ndarray] = (a + a[:, ::-1], a - a[:, ::-1])
+    grid: np.ndarray = np.arange(1, _GRID) * (np.pi / _GRID)
+    shift: np.ndarray = np.exp(1j * grid * (order + 1) / 2)
+    lsf: np.ndarray = np.empty((n_frames, order))
+    found: List[Tuple[np.ndarray, np.ndarray]] = []
+    for polynomial, symmetric in zip(polynomials, (True, False)):
+        spectrum: np.ndarray = np.fft.rfft(polynomial, 2 * _GRID)[:, 1:_GRID] * shift
+        values: np.ndarray = spectrum.real if symmetric else spectrum.imag
+        frames, cells = np.nonzero(np.signbit(values[:, :-1]) != np.signbit(values[:, 1:]))
+        low: np.ndarray = grid[cells]
+        high: np.ndarray = grid[cells + 1]
+        f_low: np.ndarray = values[frames, cells]
+        f_high: np.ndarray = values[frames, cells + 1]
+        rows: np.ndarray = polynomial[frames]
+        for _ in range(_REFINEMENTS):
+            middle: np.ndarray = (low * f_high - high * f_low) / (f_high - f_low)
+            f_middle: np.ndarray = _zero_phase(rows, middle, symmetric)
+            left: np.ndarray = np.signbit(f_middle) == np.signbit(f_low)
+            low, f_low = np.where(left, middle, low), np.where(left, f_middle, f_low)
+            high, f_high = np.where(left, high, middle), np.where(left, f_high, f_middle)
+        found.append((frames, (low * f_high - high * f_low) / (f_high - f_low)))
+    frames: np.ndarray = np.concatenate([f for f, _ in found])
+    angles: np.ndarray = np.concatenate([r for _, r in found])
+    counts: np.ndarray = np.bincount(frames, minlength=n_frames)
+    complete: np.ndarray = counts == order
+    keep: np.ndarray = complete[frames]
+    ordering: np.ndarray = np.lexsort((angles[keep], frames[keep]))
+    lsf[complete] = angles[keep][ordering].reshape(-1, order)
+    trivial_sum, trivial_difference = _split(order)
+    i: int
+    for i in np.nonzero(~complete)[0]:
+        lsf[i] = np.sort(np.concatenate((_roots_by_eig(polynomials[0][i], trivial_sum),\
+            _roots_by_eig(polynomials[1][i], trivial_difference))))
+    return lsf
+
+def _expand(cosines: np.ndarray, trivial: np.ndarray) -> np.ndarray:
+    """Multiplies trivial by (1 - 2 cos(w) z^-1 + z^-2) for every w of each row"""
+    n_rows, m = cosines.shape
+    polynomial: np.ndarray = np.zeros((n_rows, len(trivial) + 2 * m), dtype=cosines.dtype)
+    polynomial[:, :len(trivial)] = trivial
+    length: int = len(trivial)
+    i: int
+    for i in range(m):
+        previous: np.ndarray = polynomial[:, :length].copy()
+        polynomial[:, 1 : length + 1] -= 2 * cosines[:, i : i + 1] * previous
+        polynomial[:, 2 : length + 2] += previous
+        length += 2
+    return polynomial
+
+def from_lsf(lsf: np.ndarray) -> np.ndarray:
+    """
+    Converts rows of sorted line spectral frequencies back to prediction coefficients
+    
+    The products are expanded in extended precision where the platform has it: at high
+    orders, rounding in double precision alone distorts the sharpest resonances by tenths
+    of a dB.
+    """
+    lsf = np.atleast_2d(np.asanyarray(lsf, dtype=np.longdouble))
+    order: int = lsf.shape[1]
+    trivial_sum, trivial_difference = _split(order)
+    total: np.ndarray = _expand(np.cos(lsf[:, 0::2]), trivial_sum)
+    difference: np.ndarray = _expand(np.cos(lsf[:, 1::2]), trivial_difference)
+    return ((total + difference) / 2)[:, 1 : order + 1].astype(float)
+
+def spectral_distortion(reference: np.ndarray, decoded: np.ndarray) -> np.ndarray:
+    """Returns the RMS difference in dB between the log spectral envelopes of corresponding
+    rows of two coefficient matrices"""
+    ones: np.ndarray = np.ones((len(reference), 1))
+    envelopes: List[np.ndarray] = [-20 * np.log10(np.abs(np.fft.rfft(\
+        np.hstack((ones, coefficients)), _N_FFT)) + _MIN_GAIN)\
+        for coefficients in (reference, decoded)]
+    return np.sqrt(np.mean((envelopes[0] - envelopes[1]) ** 2, axis=1))
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 25, seed: int = 0)\
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Clusters the rows of data into k centers with k-means++ seeding; returns the centers
+    and the index of each row's center"""
+    rng: np.random.Generator = np.random.default_rng(seed)
+    k = min(k, len(data))
+    norms: np.ndarray = np.einsum('ij,ij->i', data, data)
+    centers: np.ndarray = np.empty((k, data.shape[1]))
+    centers[0] = data[rng.integers(len(data))]
+    nearest: np.ndarray = np.einsum('ij,ij->i', data - centers[0], data - centers[0])
+    c: int
+    for c in range(1, k):
+        total: float = nearest.sum()
+        choice: int = rng.choice(len(data), p=nearest / total) if total > 0\
+            else rng.integers(len(data))
+        centers[c] = data[choice]
+        nearest = np.minimum(nearest, np.einsum('ij,ij->i', data - centers[c], data - centers[c]))
+    labels: np.ndarray = np.zeros(len(data), dtype=np.int64)
+    for _ in range(iterations):
+        distances: np.ndarray = norms[:, np.newaxis] - 2 * data @ centers.T +\
+            np.einsum('ij,ij->i', centers, centers)
+        new_labels: np.ndarray = np.argmin(distances, axis=1)
+        counts: np.ndarray = np.bincount(new_labels, minlength=k)
+        sums: np.ndarray = np.zeros_like(centers)
+        np.add.at(sums, new_labels, data)
+        filled: np.ndarray = counts > 0
+        centers[filled] = sums[filled] / counts[filled, np.newaxis]
+        # Restart empty clusters on the rows worst served by their centers
+        worst: np.ndarray = np.argsort(distances[np.arange(len(data)), new_labels])[::-1]
+        centers[~filled] = data[worst[:np.count_nonzero(~filled)]]
+        if np.array_equal(new_labels, labels) and filled.all():
+            break
+        labels = new_labels
+    # The labels above were assigned before the last update of the centers
+    distances = norms[:, np.newaxis] - 2 * data @ centers.T +\
+        np.einsum('ij,ij->i', centers, centers)
+    return centers, np.argmin(distances, axis=1)
+
+def quantize_gains(gains: np.ndarray) -> Tuple[np.ndarray, Tuple[float, float]]:
+    """Quantizes gains to bytes evenly spaced in log gain; returns them and the log range"""
+    logs: np.ndarray = np.log(np.maximum(gains, _MIN_GAIN))
+    low, high = float(logs.min()), float(logs.max())
+    scale: float = 255 / (high - low) if high > low else 0
+    return np.round((logs - low) * scale).astype(np.uint8), (low, high)
+
+def dequantize_gains(codes: np.ndarray, low: float, high: float) -> np.ndarray:
+    return np.exp(low + codes.astype(float) * ((high - low) / 255))
+
+def quantize_voices(voices: np.ndarray) -> np.ndarray:
+    return np.round(np.clip(voices, 0, 1) * 255).astype(np.uint8)
+
+def dequantize_voices(codes: np.ndarray) -> np.ndarray:
+    return codes.astype(float) / 255
+
+def compress(phonemes: Mapping[str, Phoneme], dst: str, k: int = 256, iterations: int = 25,\
+        seed: int = 0) -> Dict[str, float]:
+    """
+    Writes phonemes to a compressed bank with a codebook of at most k codewords and returns
+    the mean spectral distortion of each phoneme, in dB, which is also stored in the index
+    """
+    names: List[str] = list(phonemes)
+    arrays: List[Tuple[np.ndarray, ...]] = [phonemes[name].arrays() for name in names]
+    coefficients: np.ndarray = np.concatenate([a[0] for a in arrays])
+    gains: np.ndarray = np.concatenate([a[1] for a in arrays])
+    voices: np.ndarray = np.concatenate([a[2] for a in arrays])
+    pitches: np.ndarray = np.concatenate([a[3] for a in arrays])
+    durations: np.ndarray = np.concatenate([phonemes[name].durations() for name in names])
+    lsf: np.ndarray = to_lsf(coefficients)
+    centers, labels = kmeans(lsf, k, iterations, seed)
+    # Sorted LSFs decode to stable filters, and means of sorted vectors stay sorted
+    centers = np.sort(centers, axis=1)
+    distortion: np.ndarray = spectral_distortion(coefficients, from_lsf(centers)[labels])
+    gain_codes, gain_range = quantize_gains(gains)
+    index: dict = {
+        'version': bank.VERSION,
+        'order': coefficients.shape[1],
+        'n_frames': len(coefficients),
+        'codebook': {'size': len(centers), 'gain_range': list(gain_range)},
+        'phonemes': {}
+    }
+    report: Dict[str, float] = {}
+    start: int = 0
+    name: str
+    for name, a in zip(names, arrays):
+        stop: int = start + len(a[0])
+        report[name] = float(distortion[start:stop].mean()) if stop > start else 0.
+        index['phonemes'][name] = {
+            'start': start,
+            'stop': stop,
+            'continuous': bool(phonemes[name].continuous),
+            'framerate': int(phonemes[name].framerate),
+            'distortion_db': report[name]
+        }
+        start = stop
+    bank.write_arrays(dst, index, {
+        'codebook': centers.astype(np.float32),
+        'indices': labels.astype(np.uint8 if len(centers) <= 256 else np.uint16),
+        'gains': gain_codes,
+        'voices': quantize_voices(voices),
+        'pitches': pitches.astype(np.float16),
+        'durations': durations.astype(np.uint32)
+    })
+    return report
+
+def main():
+    parser: argparse.ArgumentParser = argparse.ArgumentParser('Compress a phoneme bank with a shared LSF codebook')
+    parser.add_argument('input', type=str, help='Path to input bank file')
+    parser.add_argument('-o', '--output', type=str, required=True, help='Path to output bank file')
+    parser.add_argument('-k', '--codewords', type=int, default=256,\
+        help='Maximum number of codewords (default 256)')
+    parser.add_argument('-i', '--iterations', type=int, default=25, help='k-means iterations')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Seed for k-means seeding')
+    args: argparse.Namespace = parser.parse_args()
+    try:
+        source: bank.Bank = bank.Bank(args.input)
+    except Exception as e:
+        print(f'Could not open bank {args.input}: {e}', file=sys.stderr)
+        exit(1)
+    if source.compressed:
+        print(f'{args.input} is already compressed', file=sys.stderr)
+        exit(1)
+    try:
+        report: Dict[str, float] = compress(source, args.output, args.codewords,\
+            args.iterations, args.seed)
+    except Exception as e:
+        print(f'Error writing bank {args.output}: {e}', file=sys.stderr)
+        exit(2)
+    name: str
+    for name, distortion in report.items():
+        print(f'{name}\t{distortion:.2f} dB')
+    print(f'mean\t{np.mean(list(report.values())):.2f} dB')
+
+if __name__ == '__main__':
+    main()
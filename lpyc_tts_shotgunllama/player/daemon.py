@@ -0,0 +1,224 @@
+"""
+A long-running synthesis server that loads a phonology and warms the kernels once
+
+Protocol: a client connects, sends one JSON object on a single line and reads the response.
+The request holds
+    text: markup to speak or sing, or plain text to speak
+    mode: 'speak' (play_str, the default), 'sing' (sing_str) or 'text' (plain text
+        converted by the daemon's g2p front end)
+    params: keyword arguments of compile_str or compile_sing
+    format: 'wav' (the default) or 'pcm' for raw 16-bit little-endian mono samples
+    seed: optional seed for the worker's player
+The daemon answers with one JSON line, either {"rate", "samples", "format"} or {"error"},
+followed in the first case by the audio, streamed as it renders, after which it closes the
+connection.
+"""
+import argparse
+from glob import glob
+import json
+import os
+from os import path
+import queue
+import socket
+import socketserver
+import struct
+import sys
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple, Union
+
+from lpyc_tts_shotgunllama import lpc
+from lpyc_tts_shotgunllama.player import bank, g2p
+from lpyc_tts_shotgunllama.player.phoneme import Phonology, RenderPlan
+
+Address = Union[str, Tuple[str, int]]
+
+DEFAULT_PORT: int = 8765
+_MAX_REQUEST: int = 1 << 20
+_CHUNK_SAMPLES: int = 2048
+_PARAMS: Dict[str, FrozenSet[str]] = {
+    'speak': frozenset(('base_freq', 'phoneme_len', 'vibrato', 'prosody')),
+    'sing': frozenset(('base_freq', 'duration', 'vibrato', 'funcid', 'pm')),
+    'text': frozenset(('base_freq', 'phoneme_len', 'vibrato', 'prosody'))
+}
+
+def wav_header(n_samples: int, rate: int, width: int = 2) -> bytes:
+    """Returns the header of a mono PCM WAV file holding n_samples samples"""
+    n_bytes: int = n_samples * width
+    return b'RIFF' + struct.pack('<I', 36 + n_bytes) + b'WAVEfmt ' +\
+        struct.pack('<IHHIIHH', 16, 1, 1, rate, rate * width, width, width * 8) +\
+        b'data' + struct.pack('<I', n_bytes)
+
+class Synthesizer:
+    """
+    Serves synthesis requests on a fixed number of forks of a phonology, so that at most
+    workers requests render at once and each has a player of its own
+
+    front: the text front end for requests in 'text' mode, or None for one without a
+        lexicon
+    """
+
+    def __init__(self, phonology: Phonology, workers: int = 1,\
+            front: Optional[g2p.G2P] = None) -> None:
+        self.phonology: Phonology = phonology
+        self.front: g2p.G2P = front or g2p.G2P()
+        self._idle: 'queue.Queue[Phonology]' = queue.Queue()
+        self._initial: lpc.PlayerState = phonology.fork().player.state()
+        i: int
+        for i in range(workers):
+            self._idle.put(phonology.fork())
+
+    def warm(self) -> float:
+        """Compiles or loads the kernels and renders a word on every worker; returns the time
+        the kernels took"""
+        elapsed: float = lpc.warmup()
+        forks: List[Phonology] = [self._idle.get() for _ in range(self._idle.qsize())]
+        name: str = next(iter(self.phonology.phonemes))
+        fork: Phonology
+        for fork in forks:
+            fork.play_str(name)
+            self._idle.put(fork)
+        return elapsed
+
+    def compile(self, request: dict) -> RenderPlan:
+        """Checks a request and compiles its text into a render plan"""
+        mode: str = request.get('mode', 'speak')
+        if mode not in _PARAMS:
+            raise ValueError(f'Unknown mode {mode}')
+        params: dict = request.get('params', {})
+        unknown: FrozenSet[str] = frozenset(params) - _PARAMS[mode]
+        if unknown:
+            raise ValueError(f'Unknown parameters for {mode}: {", ".join(sorted(unknown))}')
+        if 'pm' in params:
+            params = dict(params, pm=tuple(params['pm']))
+        text: str = request['text']
+        if mode == 'sing':
+            return self.phonology.compile_sing(text, **params)
+        if mode == 'text':
+            return self.front.compile(self.phonology, text, **params)
+        return self.phonology.compile_str(text, **params)
+
+    def stream(self, plan: RenderPlan, seed: Optional[int] = None,\
+            chunk_samples: int = _CHUNK_SAMPLES) -> Iterator[bytes]:
+        """Renders a plan on an idle worker and yields 16-bit PCM chunks"""
+        phonology: Phonology = self._idle.get()
+        try:
+            phonology.player.restore(self._initial)
+            phonology.player.reseed(seed)
+            for chunk in phonology.stream(plan, chunk_samples, width=2):
+                yield chunk.tobytes()
+        finally:
+            self._idle.put(phonology)
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: '_Server'
+
+    def handle(self) -> None:
+        synthesizer: Synthesizer = self.server.synthesizer
+        try:
+            line: bytes = self.rfile.readline(_MAX_REQUEST)
+            request: dict = json.loads(line.decode('utf-8'))
+            plan: RenderPlan = synthesizer.compile(request)
+            fmt: str = request.get('format', 'wav')
+            if fmt not in ('wav', 'pcm'):
+                raise ValueError(f'Unknown format {fmt}')
+        except Exception as e:
+            self._send({'error': f'{type(e).__name__}: {e}'})
+            return
+        rate: int = synthesizer.phonology.rate
+        n_samples: int = synthesizer.phonology.output_samples(plan)
+        self._send({'rate': rate, 'samples': n_samples, 'format': fmt})
+        try:
+            if fmt == 'wav':
+                self.wfile.write(wav_header(n_samples, rate))
+            chunk: bytes
+            for chunk in synthesizer.stream(plan, request.get('seed', synthesizer.phonology.seed)):
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send(self, response: dict) -> None:
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    synthesizer: Synthesizer
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    synthesizer: Synthesizer
+
+def serve(synthesizer: Synthesizer, address: Address) -> socketserver.BaseServer:
+    """Binds a threaded server to a Unix socket path or a (host, port) pair; call
+    serve_forever on the result"""
+    server: Union[_Server, _UnixServer]
+    if isinstance(address, str):
+        if path.exists(address):
+            os.unlink(address)
+        server = _UnixServer(address, _Handler)
+    else:
+        server = _Server(address, _Handler)
+    server.synthesizer = synthesizer
+    return server
+
+def connect(address: Address) -> socket.socket:
+    """Opens a connection to a daemon at a Unix socket path or a (host, port) pair"""
+    if isinstance(address, str):
+        sock: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+        return sock
+    return socket.create_connection(address)
+
+def load_phonology(source: str, seed: Optional[int] = None) -> Phonology:
+    """Loads a phonology from a bank file or from a directory of phoneme JSON files"""
+    if not path.isdir(source):
+        return Phonology(bank.Bank(source), seed)
+    names: List[str] = [path.splitext(path.basename(p))[0]\
+        for p in sorted(glob(path.join(source, '*.json')))]
+    return Phonology(Phonology.load(names, source).phonemes, seed)
+
+def add_address_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('-u', '--unix', type=str, default=None, help='Path of a Unix socket')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,\
+        help=f'TCP port on localhost, used if no Unix socket is given (default {DEFAULT_PORT})')
+
+def address_of(args: argparse.Namespace) -> Address:
+    return args.unix if args.unix else ('127.0.0.1', args.port)
+
+def main():
+    parser: argparse.ArgumentParser = argparse.ArgumentParser('Serve speech synthesis requests on localhost')
+    parser.add_argument('source', type=str, help='Phoneme bank file, or directory of phoneme JSON files')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,\
+        help='Number of requests to render at once (default: one per CPU)')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='Default seed for requests')
+    parser.add_argument('-l', '--lexicon', type=str, default=None,\
+        help='Compiled lexicon for plain-text requests (see player.g2p)')
+    parser.add_argument('-r', '--rate', type=int, default=None,\
+        help='Sample rate to serve audio at, if different from the phonemes\' framerate')
+    add_address_arguments(parser)
+    args: argparse.Namespace = parser.parse_args()
+    try:
+        phonology: Phonology = load_phonology(args.source, args.seed)
+    except Exception as e:
+        print(f'Could not load phonology {args.source}: {e}', file=sys.stderr)
+        exit(1)
+    if not phonology.phonemes:
+        print(f'No phonemes found in {args.source}', file=sys.stderr)
+        exit(1)
+    phonology.output_rate = args.rate
+    synthesizer: Synthesizer = Synthesizer(phonology, max(1, args.jobs), g2p.G2P(args.lexicon))
+    elapsed: float = synthesizer.warm()
+    address: Address = address_of(args)
+    server: socketserver.BaseServer = serve(synthesizer, address)
+    print(f'Kernels ready in {elapsed:.2f}s; serving {len(phonology.phonemes)} phonemes on {address}',\
+        file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if isinstance(address, str) and path.exists(address):
+            os.unlink(address)
+
+if __name__ == '__main__':
+    main()
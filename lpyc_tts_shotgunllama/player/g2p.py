@@ -0,0 +1,340 @@
+"""
+Plain-text front end: converts English text to the phoneme markup of Phonology.compile_str
+
+Words are looked up in a compiled lexicon, then in a short list of common words, and
+otherwise spelled out by letter-to-sound rules. Each distinct word is converted once per
+G2P and then served from a memo.
+
+A lexicon is compiled from a text source with one word per line followed by its
+pronunciation, either as markup ('thh-u') or as ARPAbet phones as in the CMU
+Pronouncing Dictionary ('DH AH0'). The compiled file is an open-addressing hash table that
+is memory-mapped on first use:
+
+    MAGIC | n_words, n_slots (<II) | slots | key offsets | value offsets | keys | values
+
+slots holds 1 + the number of the word hashed to each slot, or 0 if empty; words are probed
+linearly from crc32(key) modulo n_slots. Keys are UTF-8 and values hold one byte per
+phoneme: its index in INVENTORY, plus _STRESS if stressed.
+
+    python -m lpyc_tts_shotgunllama.player.g2p cmudict.dict -o english.lex
+"""
+import argparse
+from dataclasses import dataclass, field
+import numpy as np
+import re
+import struct
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Tuple, Union
+import zlib
+
+from lpyc_tts_shotgunllama.player.phoneme import Phonology, RenderPlan
+
+# The phoneme names of phonemes.txt, in the order their indices are stored in lexicons
+INVENTORY: Tuple[str, ...] = ('a', 'au', 'ae', 'aa', 'e', 'ee', 'i', 'o', 'oo', 'u', 'uu',\
+    'w', 'y', 'r', 'l', 'n', 'm', 'ng', 's', 'z', 'f', 'v', 'c', 'j', 'th', 'thh', 'h',\
+    'b', 'p', 'g', 'k', 'd', 't')
+VOWELS: frozenset = frozenset(INVENTORY[:11])
+
+MAGIC: bytes = b'LPCLEX\x00\x00'
+_HEADER: struct.Struct = struct.Struct('<II')
+_STRESS: int = 0x80
+_IDS: Dict[str, int] = {name: i for i, name in enumerate(INVENTORY)}
+
+# ARPAbet phones in the inventory; stress digits are stripped before lookup
+_ARPABET: Dict[str, str] = {
+    'AA': 'a', 'AE': 'aa', 'AH': 'u', 'AO': 'au', 'AW': 'a-oo', 'AY': 'a-ee', 'EH': 'e',
+    'ER': 'u-r', 'EY': 'e-ee', 'IH': 'i', 'IY': 'ee', 'OW': 'o', 'OY': 'au-ee', 'UH': 'oo',
+    'UW': 'uu', 'B': 'b', 'CH': 't-c', 'D': 'd', 'DH': 'thh', 'F': 'f', 'G': 'g', 'HH': 'h',
+    'JH': 'j', 'K': 'k', 'L': 'l', 'M': 'm', 'N': 'n', 'NG': 'ng', 'P': 'p', 'R': 'r',
+    'S': 's', 'SH': 'c', 'T': 't', 'TH': 'th', 'V': 'v', 'W': 'w', 'Y': 'y', 'Z': 'z',
+    'ZH': 'j'
+}
+
+# Frequent words the rules get wrong, unstressed as they usually are in running speech
+_COMMON: Dict[str, str] = {
+    'a': 'u', 'the': 'thh-u', 'of': 'u-v', 'to': 't-uu', 'and': 'aa-n-d', 'is': 'i-z',
+    'was': 'w-u-z', 'are': 'a-r', 'be': 'b-ee', 'he': 'h-ee', 'she': 'c-ee', 'we': 'w-ee',
+    'me': 'm-ee', 'you': 'y-uu', 'your': 'y-au-r', 'they': 'thh-e-ee', 'them': 'thh-e-m',
+    'their': 'thh-e-r', 'there': 'thh-e-r', 'this': 'thh-i-s', 'that': 'thh-aa-t',
+    'these': 'thh-ee-z', 'those': 'thh-o-z', 'then': 'thh-e-n', 'than': 'thh-aa-n',
+    'with': 'w-i-thh', 'what': 'w-u-t', 'who': 'h-uu', 'do': 'd-uu', 'does': 'd-u-z',
+    'one': 'w-u-n', 'two': 't-uu', 'have': 'h-aa-v', 'has': 'h-aa-z', 'said': 's-e-d',
+    'from': 'f-r-u-m', 'for': 'f-au-r', 'or': 'au-r', 'some': 's-u-m', 'come': 'k-u-m',
+    'i': 'a-ee', 'my': 'm-a-ee', 'by': 'b-a-ee', 'as': 'aa-z', 'his': 'h-i-z',
+    'her': 'h-u-r', 'were': 'w-u-r', 'been': 'b-i-n', 'would': 'w-oo-d',
+    'could': 'k-oo-d', 'should': 'c-oo-d', 'there\'s': 'thh-e-r-z', 'it\'s': 'i-t-s',
+    'don\'t': 'd-o-n-t', 'no': 'n-o', 'so': 's-o', 'go': 'g-o', 'into': 'i-n-t-uu',
+    'any': 'e-n-ee', 'many': 'm-e-n-ee', 'other': 'u-thh-u-r', 'where': 'w-e-r',
+    'zero': 'z-ee-r-o', 'four': 'f-au-r', 'eleven': 'i-l-e-v-u-n', 'hundred': 'h-u-n-d-r-i-d'
+}
+
+_C: str = '[bcdfghjklmnpqrstvwxz]'
+_MAGIC_E: str = f'(?={_C}e(?:s|d)?$)'
+# Letter-to-sound rules as (pattern, phonemes), tried in order at each position of a word.
+# A pattern matches the letters it consumes, and may look at the letters around them.
+_RULES: Tuple[Tuple[str, str], ...] = (
+    ('tion', 'c-u-n'), ('sion', 'j-u-n'), ('ture', 't-c-u-r'), ('tch', 't-c'),
+    ('eigh', 'e-ee'), ('igh', 'a-ee'), ('augh', 'au'), ('ough', 'au'), ('sch', 's-k'),
+    ('dge', 'j'), ('ge$', 'j'), ('ch', 't-c'), ('sh', 'c'), ('ph', 'f'), ('th', 'th'),
+    ('wh', 'w'), ('ck', 'k'), ('nk', 'ng-k'), ('ng', 'ng'), ('qu', 'k-w'), ('^kn', 'n'),
+    ('^wr', 'r'), ('^gn', 'n'), ('^gh', 'g'), ('gh', ''), ('^x', 'z'), ('x', 'k-s'),
+    ('c(?=[eiy])', 's'), ('c', 'k'), ('q', 'k'),
+    ('bb', 'b'), ('dd', 'd'), ('ff', 'f'), ('gg', 'g'), ('ll', 'l'), ('mm', 'm'),
+    ('nn', 'n'), ('pp', 'p'), ('rr', 'r'), ('ss', 's'), ('tt', 't'), ('zz', 'z'),
+    ('(?<=[sxz])es$', 'i-z'), ('(?<=[td])ed$', 'i-d'), ('(?<=[pkfsx])ed$', 't'),
+    ('ed$', 'd'), ('(?<=[bdglmnrvwaeo])s$', 'z'),
+    ('ee', 'ee'), ('ea', 'ee'), ('ie$', 'a-ee'), ('ie', 'ee'), ('ei', 'ee'), ('ey$', 'ee'),
+    ('ay', 'e-ee'), ('ai', 'e-ee'), ('oa', 'o'), ('oe$', 'o'), ('oo', 'uu'), ('ou', 'a-oo'),
+    ('ow$', 'o'), ('ow', 'a-oo'), ('oi', 'au-ee'), ('oy', 'au-ee'), ('au', 'au'),
+    ('aw', 'au'), ('ew', 'y-uu'), ('ue$', 'uu'), ('ui', 'uu'),
+    ('ar', 'a-r'), ('er', 'u-r'), ('ir', 'u-r'), ('ur', 'u-r'), ('or', 'au-r'),
+    ('a' + _MAGIC_E, 'e-ee'), ('e' + _MAGIC_E, 'ee'), ('i' + _MAGIC_E, 'a-ee'),
+    ('o' + _MAGIC_E, 'o'), ('u' + _MAGIC_E, 'y-uu'),
+    (f'(?<=[aeiouy]{_C})e(?=[sd]?$)', ''), ('(?<=..)e$', ''),
+    ('^y', 'y'), (f'(?<=^{_C})y$', 'a-ee'), (f'(?<=^{_C}{_C})y$', 'a-ee'), ('y$', 'ee'),
+    ('y', 'i'), ('a$', 'u'), ('a', 'aa'), ('e', 'e'), ('i', 'i'), ('o$', 'o'),\
+    ('o(?=l[dt])', 'o'), ('o', 'a'), ('u', 'u'),
+    ('b', 'b'), ('d', 'd'), ('f', 'f'), ('g', 'g'), ('h', 'h'), ('j', 'j'), ('k', 'k'),
+    ('l', 'l'), ('m', 'm'), ('n', 'n'), ('p', 'p'), ('r', 'r'), ('s', 's'), ('t', 't'),
+    ('v', 'v'), ('w', 'w'), ('z', 'z'), ('.', '')
+)
+# All rules as one alternation, so that a position takes one regex match to convert
+_RULE_PATTERN: Pattern = re.compile('|'.join(f'(?P<r{i}>{pattern})'\
+    for i, (pattern, _) in enumerate(_RULES)))
+_RULE_SOUNDS: Dict[str, List[str]] = {f'r{i}': sounds.split('-') if sounds else []\
+    for i, (_, sounds) in enumerate(_RULES)}
+
+_TOKEN: Pattern = re.compile(r"[a-z]+(?:'[a-z]+)*|\d+|[,;:.!?]")
+_PAUSES: Dict[str, str] = {',': ',', ';': ';', ':': ';', '.': '.', '!': '.', '?': '.'}
+# Pause markers from shortest to longest
+_PAUSE_MARKS: Tuple[str, ...] = ('', ',', ';', '.')
+_ONES: Tuple[str, ...] = ('zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven',\
+    'eight', 'nine', 'ten', 'eleven', 'twelve', 'thirteen', 'fourteen', 'fifteen',\
+    'sixteen', 'seventeen', 'eighteen', 'nineteen')
+_TENS: Tuple[str, ...] = ('', '', 'twenty', 'thirty', 'forty', 'fifty', 'sixty',\
+    'seventy', 'eighty', 'ninety')
+_SCALES: Tuple[Tuple[int, str], ...] = ((10**9, 'billion'), (10**6, 'million'),\
+    (1000, 'thousand'), (100, 'hundred'))
+
+def number_words(n: int) -> List[str]:
+    """Spells out a non-negative integer below a trillion in English words"""
+    if n < 20:
+        return [_ONES[n]]
+    if n < 100:
+        return [_TENS[n // 10]] + (number_words(n % 10) if n % 10 else [])
+    scale: int
+    name: str
+    for scale, name in _SCALES:
+        if n >= scale:
+            return number_words(n // scale) + [name] +\
+                (number_words(n % scale) if n % scale else [])
+    return []
+
+def rules(word: str) -> str:
+    """Converts a lowercase word to markup with the letter-to-sound rules, stressing the
+    first syllable of words of more than one"""
+    sounds: List[str] = []
+    pos: int = 0
+    while pos < len(word):
+        match: re.Match = _RULE_PATTERN.match(word, pos)
+        sounds += _RULE_SOUNDS[match.lastgroup]
+        pos = match.end()
+    # A syllable starts at each vowel that does not follow another
+    nuclei: List[int] = [i for i, sound in enumerate(sounds)\
+        if sound in VOWELS and (i == 0 or sounds[i - 1] not in VOWELS)]
+    if len(nuclei) > 1:
+        sounds[nuclei[0]] = sounds[nuclei[0]].upper()
+    return '-'.join(sounds)
+
+def arpabet(phones: Iterable[str]) -> str:
+    """Converts ARPAbet phones with stress digits to markup, capitalizing primary stress"""
+    sounds: List[str] = []
+    phone: str
+    for phone in phones:
+        mapped: List[str] = _ARPABET[phone.rstrip('012')].split('-')
+        if phone.endswith('1'):
+            mapped[0] = mapped[0].upper()
+        sounds += mapped
+    return '-'.join(sounds)
+
+def read_source(src: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yields the words and markup of a lexicon source file. Lines starting with ';;;' or '#'
+    are comments, and alternative pronunciations marked 'word(2)' are skipped.
+    """
+    with open(src, encoding='utf-8', errors='replace') as file:
+        line: str
+        for line in file:
+            parts: List[str] = line.split('#', 1)[0].split()
+            if len(parts) < 2 or line.startswith(';;;') or parts[0].endswith(')'):
+                continue
+            word: str = parts[0].lower()
+            if len(parts) == 2 and all(sound.lower() in _IDS for sound in parts[1].split('-')):
+                yield word, parts[1]
+            elif all(phone.rstrip('012') in _ARPABET for phone in parts[1:]):
+                yield word, arpabet(parts[1:])
+
+def _encode(markup: str) -> bytes:
+    return bytes(_IDS[sound.lower()] | (_STRESS if sound.isupper() else 0)\
+        for sound in markup.split('-'))
+
+def _decode(value: bytes) -> str:
+    return '-'.join(INVENTORY[b & ~_STRESS].upper() if b & _STRESS else INVENTORY[b]\
+        for b in value)
+
+def compile_lexicon(entries: Iterable[Tuple[str, str]], dst: str) -> int:
+    """Writes words and their markup to a lexicon file; the first entry of a word wins.
+    Returns the number of words written."""
+    words: Dict[bytes, bytes] = {}
+    word: str
+    markup: str
+    for word, markup in entries:
+        words.setdefault(word.lower().encode('utf-8'), _encode(markup))
+    keys: List[bytes] = list(words)
+    n_slots: int = 1 << max(1, (2 * len(keys) - 1).bit_length())
+    slots: np.ndarray = np.zeros(n_slots, dtype='<u4')
+    i: int
+    key: bytes
+    for i, key in enumerate(keys):
+        slot: int = zlib.crc32(key) % n_slots
+        while slots[slot]:
+            slot = (slot + 1) % n_slots
+        slots[slot] = i + 1
+    key_offsets: np.ndarray = np.cumsum([0] + [len(key) for key in keys]).astype('<u4')
+    value_offsets: np.ndarray = np.cumsum([0] + [len(words[key]) for key in keys]).astype('<u4')
+    with open(dst, 'wb') as file:
+        file.write(MAGIC)
+        file.write(_HEADER.pack(len(keys), n_slots))
+        file.write(slots.tobytes())
+        file.write(key_offsets.tobytes())
+        file.write(value_offsets.tobytes())
+        file.write(b''.join(keys))
+        file.write(b''.join(words[key] for key in keys))
+    return len(keys)
+
+@dataclass
+class Lexicon:
+    """
+    A read-only, memory-mapped compiled lexicon. The file is opened on the first lookup, and
+    only the pages of the slots and words probed are read from disk.
+    """
+    path: str
+    _arrays: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, bytes, bytes]] =\
+        field(default=None, init=False, repr=False)
+
+    def _open(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, bytes, bytes]:
+        if self._arrays is None:
+            mapped: np.ndarray = np.memmap(self.path, dtype=np.uint8, mode='r')
+            if mapped[:len(MAGIC)].tobytes() != MAGIC:
+                raise ValueError(f'{self.path} is not a lexicon')
+            n_words, n_slots = _HEADER.unpack(mapped[len(MAGIC) : len(MAGIC) + _HEADER.size])
+            offset: int = len(MAGIC) + _HEADER.size
+            arrays: List[np.ndarray] = []
+            n: int
+            for n in (n_slots, n_words + 1, n_words + 1):
+                arrays.append(mapped[offset : offset + 4 * n].view('<u4'))
+                offset += 4 * n
+            n_keys: int = int(arrays[1][-1])
+            keys: memoryview = memoryview(mapped[offset : offset + n_keys])
+            values: memoryview = memoryview(mapped[offset + n_keys : offset + n_keys +\
+                int(arrays[2][-1])])
+            self._arrays = (arrays[0], arrays[1], arrays[2], keys, values)
+        return self._arrays
+
+    def get(self, word: str) -> Optional[str]:
+        """Returns the markup of a word, or None if it is not in the lexicon"""
+        slots, key_offsets, value_offsets, keys, values = self._open()
+        key: bytes = word.lower().encode('utf-8')
+        slot: int = zlib.crc32(key) % len(slots)
+        while slots[slot]:
+            i: int = int(slots[slot]) - 1
+            if keys[key_offsets[i] : key_offsets[i + 1]] == key:
+                return _decode(values[value_offsets[i] : value_offsets[i + 1]])
+            slot = (slot + 1) % len(slots)
+        return None
+
+    def __contains__(self, word: str) -> bool:
+        return self.get(word) is not None
+
+    def __len__(self) -> int:
+        return len(self._open()[1]) - 1
+
+@dataclass
+class G2P:
+    """
+    Converts plain text to markup for Phonology.compile_str
+
+    lexicon: a Lexicon, the path of a compiled lexicon file, or None to use only the
+        common words and the letter-to-sound rules
+    max_memo: number of distinct words to remember the conversion of
+    """
+    lexicon: Optional[Union[Lexicon, str]] = None
+    max_memo: int = 1 << 16
+    _memo: Dict[str, str] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if isinstance(self.lexicon, str):
+            self.lexicon = Lexicon(self.lexicon)
+
+    def word(self, word: str) -> str:
+        """Returns the markup of one lowercase word"""
+        markup: Optional[str] = self._memo.get(word)
+        if markup is None:
+            if self.lexicon is not None:
+                markup = self.lexicon.get(word)
+            if markup is None:
+                markup = _COMMON.get(word)
+            if markup is None:
+                markup = rules(word.replace("'", ''))
+            if len(self._memo) < self.max_memo:
+                self._memo[word] = markup
+        return markup
+
+    def markup(self, text: str) -> str:
+        """
+        Converts text to markup. Numbers are spelled out, and each punctuation mark
+        becomes a pause before the next word.
+        """
+        words: List[str] = []
+        pause: str = ''
+        token: str
+        for token in _TOKEN.findall(text.lower()):
+            if token in _PAUSES:
+                pause = max(pause, _PAUSES[token], key=_PAUSE_MARKS.index)
+                continue
+            spoken: List[str] = [token]
+            if token.isdigit():
+                spoken = number_words(int(token)) if len(token) <= 12\
+                    else [_ONES[int(digit)] for digit in token]
+            spelled: str
+            for spelled in spoken:
+                markup: str = self.word(spelled)
+                if markup:
+                    words.append(pause + markup)
+                    pause = ''
+        return ' '.join(words)
+
+    def compile(self, phonology: Phonology, text: str, **params) -> RenderPlan:
+        """Converts text to a render plan; params are passed on to compile_str"""
+        return phonology.compile_str(self.markup(text), **params)
+
+def main():
+    parser: argparse.ArgumentParser = argparse.ArgumentParser('Compile a pronunciation lexicon for the text front end')
+    parser.add_argument('source', type=str, nargs='+',\
+        help='Lexicon source files of words and markup or ARPAbet pronunciations')
+    parser.add_argument('-o', '--output', type=str, required=True, help='Path to output lexicon file')
+    args: argparse.Namespace = parser.parse_args()
+    try:
+        entries: List[Tuple[str, str]] = [entry for src in args.source for entry in read_source(src)]
+    except Exception as e:
+        print(f'Could not read lexicon source: {e}', file=sys.stderr)
+        exit(1)
+    try:
+        n: int = compile_lexicon(entries, args.output)
+    except Exception as e:
+        print(f'Error writing lexicon {args.output}: {e}', file=sys.stderr)
+        exit(2)
+    print(f'Compiled {n} words to {args.output}', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures the latency and throughput of a running synthesis daemon with concurrent clients
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import sys
+import time
+from typing import List, Tuple
+
+from lpyc_tts_shotgunllama.player.client import request
+from lpyc_tts_shotgunllama.player.daemon import Address, add_address_arguments, address_of
+
+def _timed_request(address: Address, text: str) -> Tuple[float, float, int]:
+    """Returns the seconds to the first audio byte, the seconds to the last, and the number
+    of samples received"""
+    start: float = time.perf_counter()
+    header, chunks = request(address, text, fmt='pcm')
+    first: float = 0
+    n_bytes: int = 0
+    chunk: bytes
+    for chunk in chunks:
+        if not n_bytes:
+            first = time.perf_counter() - start
+        n_bytes += len(chunk)
+    return first, time.perf_counter() - start, n_bytes // 2
+
+def run(address: Address, text: str, requests: int, clients: int) -> dict:
+    """Sends requests copies of text from clients threads and returns timing statistics"""
+    start: float = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        results: List[Tuple[float, float, int]] = list(pool.map(\
+            lambda _: _timed_request(address, text), range(requests)))
+    elapsed: float = time.perf_counter() - start
+    first: np.ndarray = np.array([result[0] for result in results])
+    total: np.ndarray = np.array([result[1] for result in results])
+    samples: int = sum(result[2] for result in results)
+    return {
+        'requests': requests,
+        'clients': clients,
+        'seconds': elapsed,
+        'requests_per_second': requests / elapsed,
+        'samples_per_second': samples / elapsed,
+        'first_byte_p50': float(np.percentile(first, 50)),
+        'first_byte_p95': float(np.percentile(first, 95)),
+        'total_p50': float(np.percentile(total, 50)),
+        'total_p95': float(np.percentile(total, 95))
+    }
+
+def main():
+    parser: argparse.ArgumentParser = argparse.ArgumentParser('Load test a running synthesis daemon')
+    parser.add_argument('-t', '--text', type=str, default="'m-a-n ,s-e-e-m 'p-i-t",\
+        help='Markup to request')
+    parser.add_argument('-n', '--requests', type=int, default=100, help='Number of requests')
+    parser.add_argument('-c', '--clients', type=int, default=8, help='Number of concurrent clients')
+    add_address_arguments(parser)
+    args: argparse.Namespace = parser.parse_args()
+    try:
+        stats: dict = run(address_of(args), args.text, args.requests, args.clients)
+    except (OSError, RuntimeError) as e:
+        print(f'Load test failed: {e}', file=sys.stderr)
+        exit(1)
+    key: str
+    for key, value in stats.items():
+        print(f'{key}: {value:.4g}' if isinstance(value, float) else f'{key}: {value}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Renders several voices at once and mixes them
+"""
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass
+import numpy as np
+import os
+from typing import List, Optional, Sequence
+
+from lpyc_tts_shotgunllama.player.phoneme import Phonology, RenderPlan
+
+@dataclass
+class Track:
+    """
+    One voice of a mix: plans rendered back to back on a phonology, scaled by gain and
+    starting offset samples into the mix
+    """
+    phonology: Phonology
+    plans: Sequence[RenderPlan]
+    gain: float = 1
+    offset: int = 0
+    
+    @property
+    def n_samples(self) -> int:
+        return sum(map(self.phonology.output_samples, self.plans))
+    
+    def render(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Renders the plans of this track, without its gain, and returns the samples"""
+        n_samples: int = self.n_samples
+        if out is None:
+            out = np.empty(n_samples, self.phonology.dtype)
+        start: int = 0
+        plan: RenderPlan
+        for plan in self.plans:
+            n: int = self.phonology.output_samples(plan)
+            self.phonology.render(plan, out[start : start + n])
+            start += n
+        return out[:n_samples]
+
+def mix(tracks: Sequence[Track], out: Optional[np.ndarray] = None,\
+        workers: Optional[int] = None, executor: Optional[Executor] = None) -> np.ndarray:
+    """
+    Renders tracks in a thread pool and sums them, each scaled by its gain, into one buffer.
+    The synthesis kernel releases the GIL, so tracks render in parallel.
+    
+    out: buffer to mix into instead of a new array; it is cleared first
+    workers: number of threads to use, or None for one per CPU
+    executor: an existing executor to submit tracks to instead of starting a pool
+    
+    Each track must have a phonology of its own; see Phonology.fork.
+    Returns the mix, as long as the longest track, in the widest dtype of the tracks'.
+    """
+    if len({id(track.phonology.player) for track in tracks}) < len(tracks):
+        raise ValueError('Tracks rendered at the same time cannot share a player')
+    n_samples: int = max((track.offset + track.n_samples for track in tracks), default=0)
+    if out is None:
+        out = np.zeros(n_samples, np.result_type(np.float32,\
+            *(track.phonology.dtype for track in tracks)))
+    elif len(out) < n_samples:
+        raise ValueError(f'Output buffer of {len(out)} samples cannot hold {n_samples}')
+    else:
+        out[:n_samples] = 0
+    workers = min(workers or os.cpu_count() or 1, max(1, len(tracks)))
+    if workers == 1 and executor is None:
+        track: Track
+        for track in tracks:
+            out[track.offset : track.offset + track.n_samples] += track.gain * track.render()
+        return out[:n_samples]
+    pool: Executor = executor or ThreadPoolExecutor(workers)
+    try:
+        futures: List[Future] = [pool.submit(track.render) for track in tracks]
+        future: Future
+        for future, track in zip(futures, tracks):
+            out[track.offset : track.offset + track.n_samples] += track.gain * future.result()
+    finally:
+        if executor is None:
+            pool.shutdown()
+    return out[:n_samples]
@@ -1,54 +1,142 @@
 from dataclasses import dataclass, field
+import itertools
 import json
 import numpy as np
 from os import path
-import random
-from typing import List, Dict, ClassVar, Tuple
+from typing import Iterator, List, Dict, ClassVar, Mapping, Optional, Tuple
+import zlib
 
-from lpyc_tts_shotgunllama import lpc
+from lpyc_tts_shotgunllama import lpc, profiling, resample, wavio
+from lpyc_tts_shotgunllama.player.cache import RenderCache
 
 @dataclass
 class Phoneme:
     frames: List[lpc.LPC]
     continuous: bool
     framerate: int
+    _arrays: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] =\
+        field(default=None, init=False, repr=False, compare=False)
+    _ends: Optional[np.ndarray] = field(default=None, init=False, repr=False, compare=False)
+    
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the coefficients, gains, voices and pitches of the frames packed into arrays.
+        The coefficients keep the float type of the frames'."""
+        if self._arrays is None:
+            self._arrays = (np.array([frame.coefficients for frame in self.frames]),\
+                np.array([frame.gain for frame in self.frames], dtype=float),\
+                np.array([frame.voice for frame in self.frames], dtype=float),\
+                np.array([frame.f0 for frame in self.frames], dtype=float))
+        return self._arrays
+    
+    def durations(self) -> np.ndarray:
+        """Returns the number of steps each frame lasts, all 1 unless frames were merged"""
+        return np.diff(self.ends(), prepend=0)
+    
+    def ends(self) -> np.ndarray:
+        """Returns the step each frame ends on, the running sum of the frames' durations"""
+        if self._ends is None:
+            self._ends = np.cumsum([frame.duration for frame in self.frames], dtype=np.int64)
+        return self._ends
+    
+    def frame_count(self, duration: float, frame_size: float = .01) -> int:
+        """Returns the number of frames play_on plays for a given duration"""
+        if duration < 0 or not self.continuous:
+            return len(self.frames)
+        return int((duration + frame_size * .00099) // frame_size)
+    
+    def sample_count(self, duration: float, frame_size: float = .01) -> int:
+        """Returns the number of samples play_on returns for a given duration"""
+        steps: int = int(self.ends()[-1]) if (duration < 0 or not self.continuous)\
+            and self.frames else self.frame_count(duration, frame_size)
+        return steps * round(frame_size * self.framerate)
     
     def play_on(self, player: lpc.LPCPlayer, duration: float, frequency: float,\
             prime: bool = False, *, frame_size: float = .01, vibrato: float = 0,
-            funcid: int=0, pm: Tuple[float, float]=(0,0)) -> np.ndarray:
-        if duration < 0 or not self.continuous:
-            n_frames: int = len(self.frames)
-            i_frames: List[int] = list(range(n_frames))
-        else:
-            n_frames: int = int((duration + frame_size * .00099) // frame_size)
-            i_frames: List[int] = [random.choice(range(len(self.frames))) for _ in range(n_frames)]
-        n_samples: int = round(frame_size * self.framerate)
-        samples: np.ndarray = np.zeros(n_samples * n_frames)
-        
-        if prime:
-            player.prime(self.frames[i_frames[0]],\
-                frequency / self.framerate)
+            funcid: int=0, pm: Tuple[float, float]=(0,0), prosody: bool = False,
+            out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Plays this phoneme's frames on player and returns the samples. A phoneme that is
+        not continuous plays each frame in order for its duration in steps of frame_size. A
+        continuous one plays a step of a random frame at a time, chosen in proportion to
+        the frames' durations, so that merging frames does not change how often each
+        sound is heard.
         
-        v_accum: float = 0
-        i_frame: int
-        for i, i_frame in enumerate(i_frames):
-            v_accum += random.random() * vibrato - vibrato / 2
-            v_accum = min(vibrato, max(-vibrato, v_accum))
-            samples[i*n_samples : (i+1)*n_samples] =\
-                player.play(self.frames[i_frame],\
-                frequency * (1 + v_accum) / self.framerate,\
-                n_samples, funcid, pm)
-                
-        return samples
+        prosody: True to play frames that carry an analyzed f0 at that frequency instead
+            of the frequency argument
+        out: buffer to render into instead of a new array
+        """
+        with profiling.stage('Phoneme.select'):
+            n_frames: int = self.frame_count(duration, frame_size)
+            n_samples: int = round(frame_size * self.framerate)
+            ends: np.ndarray = self.ends()
+            if duration < 0 or not self.continuous:
+                i_frames: List[int] = list(range(n_frames))
+                counts: np.ndarray = np.diff(ends, prepend=0) * n_samples
+            else:
+                # With every duration 1 this picks the same frames as drawing indices directly
+                i_frames: List[int] = np.searchsorted(ends, player.rng.integers(ends[-1],\
+                    size=n_frames), 'right').tolist()
+                counts: np.ndarray = np.full(n_frames, n_samples)
+            
+            if prime and i_frames:
+                player.prime(self.frames[i_frames[0]],\
+                    frequency / self.framerate)
+            
+            v_accums: np.ndarray = player.rng.random(n_frames) * vibrato - vibrato / 2
+            v_accum: float = 0
+            i: int
+            for i in range(n_frames):
+                v_accum += v_accums[i]
+                v_accum = min(vibrato, max(-vibrato, v_accum))
+                v_accums[i] = v_accum
+            
+            coefficients, gains, voices, pitches = self.arrays()
+            pitches = pitches[i_frames]
+            bases: np.ndarray = np.where(pitches > 0, pitches, frequency) if prosody\
+                else np.full(n_frames, float(frequency))
+        return player.render_sequence(coefficients[i_frames], gains[i_frames], voices[i_frames],\
+            bases * (1 + v_accums) / self.framerate, counts, funcid, pm, out)
     
     @staticmethod
-    def fromdict(d: dict) -> 'Phoneme':
-        frames: List[lpc.LPC] = list(map(lpc.LPC.fromdict, d['frames']))
+    def fromdict(d: dict, dtype: type = np.float64) -> 'Phoneme':
+        frames: List[lpc.LPC] = [lpc.LPC.fromdict(frame, dtype) for frame in d['frames']]
         return Phoneme(frames, d['continuous'], d['framerate'])
+    
+    @staticmethod
+    def fromarrays(coefficients: np.ndarray, gains: np.ndarray, voices: np.ndarray,\
+            continuous: bool, framerate: int, pitches: Optional[np.ndarray] = None,\
+            durations: Optional[np.ndarray] = None) -> 'Phoneme':
+        """Builds a phoneme whose frames are views of the rows of a coefficient matrix"""
+        if pitches is None:
+            pitches = np.zeros(len(coefficients))
+        if durations is None:
+            durations = np.ones(len(coefficients), dtype=np.int64)
+        frames: List[lpc.LPC] = [lpc.LPC(coefficients[i], float(gains[i]), float(voices[i]),\
+            float(pitches[i]), int(durations[i])) for i in range(len(coefficients))]
+        phoneme: Phoneme = Phoneme(frames, continuous, framerate)
+        phoneme._arrays = (coefficients, gains, voices, pitches)
+        return phoneme
 
 @dataclass
 class Phonology:
-    phonemes: Dict[str, Phoneme]
+    """
+    A set of phonemes and a player to speak or sing markup with
+    
+    seed: seed of the player's random generator
+    cache: if given, each word is rendered once per distinct set of parameters and then
+        replayed from the cache. Cached words draw their randomness from a generator derived
+        from the cache's seed and the word, not from seed, so repeated words sound the same
+        whether or not they hit and whichever player renders them.
+        A word is replayed regardless of the filter history it follows.
+    dtype: float type of the player and of the samples rendered; see LPCPlayer
+    output_rate: if given, the rate in Hz to return samples at. The player runs at the
+        phonemes' framerate, which can be lower, and its output is resampled.
+    """
+    phonemes: Mapping[str, Phoneme]
+    seed: Optional[int] = None
+    cache: Optional[RenderCache] = None
+    dtype: type = np.float64
+    output_rate: Optional[int] = None
     framerate: int = field(init=False)
     player: lpc.LPCPlayer = field(init=False)
     
@@ -65,19 +153,35 @@ class Phonology:
         ';': .4,
         '.': .6
     }
+    # Resolution, in cents, of the frequencies in render cache keys
+    _cache_cents: ClassVar[float] = 1
     
     def __post_init__(self) -> None:
         if self.phonemes:
             first: Phoneme = next(iter(self.phonemes.values()))
-            self.player = lpc.LPCPlayer(first.frames[0].order())
+            self.player = lpc.LPCPlayer(first.frames[0].order(), seed=self.seed,\
+                dtype=self.dtype)
             self.framerate = first.framerate
     
-    def play_str(self, sentence: str, *, base_freq: float = 100, phoneme_len: float = .15,\
-            vibrato: float = .03) -> np.ndarray:
-        samps: np.ndarray = np.array([], dtype=float)
+    def fork(self, seed: Optional[int] = None) -> 'Phonology':
+        """
+        Returns a phonology that shares this one's phonemes and cache but has a player of its
+        own, with the same block size and dtype, so that both can render at the same time from
+        different threads
+        """
+        fork: Phonology = Phonology(self.phonemes, seed, self.cache, self.dtype, self.output_rate)
+        if self.phonemes:
+            fork.player.block_size = self.player.block_size
+        return fork
+    
+    def compile_str(self, sentence: str, *, base_freq: float = 100, phoneme_len: float = .15,\
+            vibrato: float = .03, prosody: bool = False) -> 'RenderPlan':
+        """Parses speech markup into a render plan; see play_str"""
+        plan: _PlanBuilder = _PlanBuilder(self)
         words: List[str] = sentence.split()
         word: str
         for word in words:
+            plan.word()
             prime: bool = True
             sounds: List[str] = word.split('-')
             sound: str
@@ -90,7 +194,7 @@ class Phonology:
                     rest += Phonology._rest_markers[sound[0]]
                     sound = sound[1:]
                 if rest:
-                    samps = np.concatenate((samps, np.zeros(round(rest * self.framerate))))
+                    plan.rest(round(rest * self.framerate))
                 lenmul: float = 1
                 while sound and sound[0] in Phonology._len_markers:
                     lenmul *= Phonology._len_markers[sound[0]]
@@ -103,21 +207,20 @@ class Phonology:
                     sound = sound.lower()
                     freqmul *= 2 ** (1/6)
                 if sound and sound in self.phonemes:
-                    samps = np.concatenate((samps, self.phonemes[sound].play_on(\
-                        self.player, phoneme_len * lenmul, base_freq * freqmul, prime,\
-                        vibrato=vibrato)))
+                    plan.phoneme(sound, phoneme_len * lenmul, base_freq * freqmul, prime)
                     prime = False
-            samps = np.concatenate((samps, np.zeros(round(self.framerate * .1))))
-        return samps
+            plan.rest(round(self.framerate * .1))
+        return plan.build(vibrato, 0, (0, 0), prosody)
     
-    def sing_str(self, sentence: str, *, base_freq: float = 100, phoneme_len: float = .15,
-            duration: float=.25, vibrato: float = .03, funcid: int=0,
-            true_vib: Tuple[float, float]=(0,0),
-            pm: Tuple[float, float]=(0,0)) -> np.ndarray:
-        samps: np.ndarray = np.array([], dtype=float)
+    def compile_sing(self, sentence: str, *, base_freq: float = 100, duration: float=.25,
+            vibrato: float = .03, funcid: int=0,
+            pm: Tuple[float, float]=(0,0)) -> 'RenderPlan':
+        """Parses sung markup into a render plan; see sing_str"""
+        plan: _PlanBuilder = _PlanBuilder(self)
         words: List[str] = sentence.split()
         word: str
         for word in words:
+            plan.word()
             prime: bool = True
             sounds: List[str] = word.split('-')
             sound: str
@@ -127,7 +230,7 @@ class Phonology:
             for i, sound in enumerate(sounds):
                 phon = self.phonemes[sound]
                 if not phon.continuous:
-                    lens[i] = len(phon.frames) * .01
+                    lens[i] = phon.sample_count(-1) / phon.framerate
                     len_left -= lens[i]
                 else:
                     cont_ctr += 1
@@ -136,22 +239,239 @@ class Phonology:
                 if phon.continuous:
                     lens[i] = len_left / cont_ctr
                 if sound and sound in self.phonemes:
-                    samps = np.concatenate((samps, self.phonemes[sound].play_on(\
-                        self.player, lens[i], base_freq, prime,\
-                        vibrato=vibrato, pm=pm, funcid=funcid)))
+                    plan.phoneme(sound, lens[i], base_freq, prime)
                     prime = False
-        return samps
+        return plan.build(vibrato, funcid, pm, False)
+    
+    @property
+    def rate(self) -> int:
+        """The rate in Hz of the samples returned"""
+        return self.output_rate or self.framerate
+    
+    def output_samples(self, plan: 'RenderPlan') -> int:
+        """Returns the number of samples render returns for a plan"""
+        return resample.output_length(plan.n_samples, self.framerate, self.rate)
+    
+    def render(self, plan: 'RenderPlan', out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Renders a plan made by compile_str or compile_sing and returns the samples
+        
+        out: buffer of at least output_samples(plan) samples to render into instead of a
+            new array
+        """
+        n_samples: int = plan.n_samples
+        n_output: int = self.output_samples(plan)
+        if out is not None and len(out) < n_output:
+            raise ValueError(f'Output buffer of {len(out)} samples cannot hold {n_output}')
+        internal: np.ndarray = out if out is not None and self.rate == self.framerate\
+            else np.zeros(n_samples, self.dtype)
+        profiling.audio('synthesis', n_samples, self.framerate)
+        with profiling.stage('Phonology.render'):
+            if self.cache is None:
+                self._render_items(plan, 0, len(plan.ids), internal)
+            else:
+                self._render_words(plan, internal)
+        if self.rate == self.framerate:
+            return internal[:n_samples]
+        with profiling.stage('Phonology.resample'):
+            resampled: np.ndarray = resample.resample(internal[:n_samples], self.framerate,\
+                self.rate)
+        if out is None:
+            return resampled
+        out[:n_output] = resampled
+        return out[:n_output]
+    
+    def _render_words(self, plan: 'RenderPlan', out: np.ndarray) -> None:
+        """Renders a plan one word at a time through the render cache"""
+        offsets: np.ndarray = np.concatenate(([0], np.cumsum(plan.counts)))
+        w: int
+        for w in range(len(plan.word_starts) - 1):
+            first: int = plan.word_starts[w]
+            last: int = plan.word_starts[w + 1]
+            self._render_cached(plan, first, last, out[offsets[first] : offsets[last]])
+    
+    def stream(self, plan: 'RenderPlan', chunk_samples: int = 1024,\
+            width: Optional[int] = None) -> Iterator[np.ndarray]:
+        """
+        Renders a plan one phoneme at a time, or one word at a time with a cache, and yields
+        it in chunks of chunk_samples samples, the last of which may be shorter. The chunks
+        add up to the same samples as render, up to rounding when resampling.
+        
+        width: None to yield float samples, or a byte width to yield PCM integers as
+            returned by wavio.to_pcm
+        """
+        if chunk_samples < 1:
+            raise ValueError(f'Chunk size must be positive, got {chunk_samples}')
+        chunk: np.ndarray = np.empty(chunk_samples, self.dtype)
+        filled: int = 0
+        segments: Iterator[Tuple[int, int]] = zip(plan.word_starts[:-1], plan.word_starts[1:])\
+            if self.cache is not None else ((i, i + 1) for i in range(len(plan.ids)))
+        resampler: Optional[resample.Resampler] = resample.Resampler(self.framerate,\
+            self.rate) if self.rate != self.framerate else None
+        first: int
+        last: int
+        for first, last in itertools.chain(segments, [(0, 0)]):
+            segment: np.ndarray = np.empty(int(plan.counts[first:last].sum()), self.dtype)
+            if last > first:
+                profiling.audio('synthesis', len(segment), self.framerate)
+                with profiling.stage('Phonology.render'):
+                    if self.cache is None:
+                        self._render_items(plan, first, last, segment)
+                    else:
+                        self._render_cached(plan, first, last, segment)
+            if resampler is not None:
+                with profiling.stage('Phonology.resample'):
+                    # The empty segment at the end flushes the resampler
+                    segment = resampler.process(segment) if last > first\
+                        else resampler.flush()
+            offset: int = 0
+            while offset < len(segment):
+                n: int = min(chunk_samples - filled, len(segment) - offset)
+                chunk[filled : filled + n] = segment[offset : offset + n]
+                filled += n
+                offset += n
+                if filled == chunk_samples:
+                    yield chunk.copy() if width is None else wavio.to_pcm(chunk, width)
+                    filled = 0
+        if filled:
+            yield chunk[:filled].copy() if width is None else wavio.to_pcm(chunk[:filled], width)
+    
+    def _render_items(self, plan: 'RenderPlan', first: int, last: int, out: np.ndarray) -> None:
+        """Renders items first through last - 1 of a plan back to back into out"""
+        offset: int = 0
+        i: int
+        for i in range(first, last):
+            segment: np.ndarray = out[offset : offset + plan.counts[i]]
+            if plan.ids[i] < 0:
+                segment[:] = 0
+            else:
+                self.phonemes[plan.names[plan.ids[i]]].play_on(self.player, plan.durations[i],\
+                    plan.frequencies[i], bool(plan.primes[i]), vibrato=plan.vibrato,\
+                    funcid=plan.funcid, pm=plan.pm, prosody=plan.prosody, out=segment)
+            offset += plan.counts[i]
+    
+    def _render_cached(self, plan: 'RenderPlan', first: int, last: int, out: np.ndarray) -> None:
+        """Renders a word of a plan into out through the render cache"""
+        key: tuple = self._cache_key(plan, first, last)
+        hit: Optional[Tuple[np.ndarray, lpc.PlayerState]] = self.cache.get(key)
+        if hit is not None:
+            out[:] = hit[0]
+            self.player.restore(hit[1])
+            return
+        rng: np.random.Generator = self.player.rng
+        self.player.rng = np.random.default_rng(np.random.SeedSequence(self.cache.seed,\
+            spawn_key=(zlib.crc32(repr(key).encode('utf-8')),)))
+        try:
+            self._render_items(plan, first, last, out)
+        finally:
+            self.player.rng = rng
+        self.cache.put(key, out, self.player.state())
+    
+    def _cache_key(self, plan: 'RenderPlan', first: int, last: int) -> tuple:
+        frequencies: np.ndarray = plan.frequencies[first:last]
+        cents: np.ndarray = np.round(np.log2(np.maximum(frequencies, 1e-9)) * 1200 /\
+            Phonology._cache_cents).astype(np.int64)
+        return (tuple(plan.names[i] if i >= 0 else '' for i in plan.ids[first:last]),\
+            plan.durations[first:last].tobytes(), cents.tobytes(),\
+            plan.primes[first:last].tobytes(), plan.counts[first:last].tobytes(),\
+            plan.vibrato, plan.funcid, plan.pm, plan.prosody, np.dtype(self.dtype).str,\
+            self.player.block_size)
+    
+    def play_str(self, sentence: str, *, base_freq: float = 100, phoneme_len: float = .15,\
+            vibrato: float = .03, prosody: bool = False) -> np.ndarray:
+        with profiling.stage('Phonology.compile'):
+            plan: RenderPlan = self.compile_str(sentence, base_freq=base_freq,\
+                phoneme_len=phoneme_len, vibrato=vibrato, prosody=prosody)
+        return self.render(plan)
+    
+    def stream_str(self, sentence: str, *, chunk_samples: int = 1024,\
+            width: Optional[int] = None, base_freq: float = 100, phoneme_len: float = .15,\
+            vibrato: float = .03, prosody: bool = False) -> Iterator[np.ndarray]:
+        """Speaks a sentence like play_str, yielding chunks as they are rendered; see stream"""
+        return self.stream(self.compile_str(sentence, base_freq=base_freq,\
+            phoneme_len=phoneme_len, vibrato=vibrato, prosody=prosody), chunk_samples, width)
+    
+    def sing_str(self, sentence: str, *, base_freq: float = 100, phoneme_len: float = .15,
+            duration: float=.25, vibrato: float = .03, funcid: int=0,
+            true_vib: Tuple[float, float]=(0,0),
+            pm: Tuple[float, float]=(0,0)) -> np.ndarray:
+        with profiling.stage('Phonology.compile'):
+            plan: RenderPlan = self.compile_sing(sentence, base_freq=base_freq,\
+                duration=duration, vibrato=vibrato, funcid=funcid, pm=pm)
+        return self.render(plan)
     
     @staticmethod
-    def load(names: List[str], basedir: str) -> 'Phonology':
+    def load(names: List[str], basedir: str, dtype: type = np.float64) -> 'Phonology':
         phonemes: Dict[str, Phoneme] = {}
         name: str
         for name in names:
             try:
                 with open(path.join(basedir, name+'.json')) as file:
                     d: dict = json.load(file)
-                    phoneme: Phoneme = Phoneme.fromdict(d)
+                    phoneme: Phoneme = Phoneme.fromdict(d, dtype)
                     phonemes[name.lower()] = phoneme
             except Exception as e:
                 print(f'Error loading phoneme {name}: {e}')
-        return Phonology(phonemes)
\ No newline at end of file
+        return Phonology(phonemes, dtype=dtype)
+    
+    @staticmethod
+    def load_bank(src: str, dtype: type = np.float64) -> 'Phonology':
+        """Loads a phonology from a packed bank file written by player.bank"""
+        from lpyc_tts_shotgunllama.player import bank
+        return Phonology(bank.Bank(src), dtype=dtype)
+
+@dataclass
+class RenderPlan:
+    """
+    A sentence compiled into the phonemes and rests to render. Item i plays phoneme
+    names[ids[i]] for durations[i] seconds at frequencies[i] Hz, priming the player first if
+    primes[i], or is a rest if ids[i] is -1. It produces exactly counts[i] samples.
+    Word w consists of items word_starts[w] through word_starts[w + 1] - 1.
+    A plan can be rendered any number of times.
+    """
+    names: Tuple[str, ...]
+    ids: np.ndarray
+    durations: np.ndarray
+    frequencies: np.ndarray
+    primes: np.ndarray
+    counts: np.ndarray
+    word_starts: np.ndarray
+    vibrato: float = 0
+    funcid: int = 0
+    pm: Tuple[float, float] = (0, 0)
+    prosody: bool = False
+    
+    @property
+    def n_samples(self) -> int:
+        return int(self.counts.sum())
+
+class _PlanBuilder:
+    """Accumulates the items of a RenderPlan"""
+    
+    def __init__(self, phonology: Phonology) -> None:
+        self.phonology: Phonology = phonology
+        self.names: Dict[str, int] = {}
+        self.items: List[Tuple[int, float, float, bool, int]] = []
+        self.word_starts: List[int] = []
+    
+    def word(self) -> None:
+        """Starts a new word at the next item"""
+        self.word_starts.append(len(self.items))
+    
+    def phoneme(self, name: str, duration: float, frequency: float, prime: bool) -> None:
+        count: int = self.phonology.phonemes[name].sample_count(duration)
+        self.items.append((self.names.setdefault(name, len(self.names)), duration, frequency,\
+            prime, count))
+    
+    def rest(self, n_samples: int) -> None:
+        self.items.append((-1, 0, 0, False, n_samples))
+    
+    def build(self, vibrato: float, funcid: int, pm: Tuple[float, float], prosody: bool)\
+            -> RenderPlan:
+        ids, durations, frequencies, primes, counts = zip(*self.items) if self.items\
+            else ((),) * 5
+        return RenderPlan(tuple(self.names), np.array(ids, dtype=np.int32),\
+            np.array(durations, dtype=float), np.array(frequencies, dtype=float),\
+            np.array(primes, dtype=bool), np.array(counts, dtype=np.int64),\
+            np.array(self.word_starts + [len(self.items)], dtype=np.int64),\
+            vibrato, funcid, tuple(pm), prosody)
@@ -0,0 +1,143 @@
+"""
+Synthesizes batches of sentences on a pool of workers that each own a player
+"""
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor,\
+    as_completed
+from dataclasses import dataclass
+import numpy as np
+import os
+import queue
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+from lpyc_tts_shotgunllama import lpc
+from lpyc_tts_shotgunllama.player.cache import RenderCache
+from lpyc_tts_shotgunllama.player.phoneme import Phonology
+
+@dataclass(frozen=True)
+class SynthesisParams:
+    """Parameters of Phonology.play_str"""
+    base_freq: float = 100
+    phoneme_len: float = .15
+    vibrato: float = .03
+    prosody: bool = False
+
+def _speak(phonology: Phonology, initial: lpc.PlayerState, text: str,\
+        params: SynthesisParams, seed: Optional[int]) -> np.ndarray:
+    """Speaks text from a fresh player state, so that the result does not depend on which
+    worker rendered it or what it rendered before"""
+    phonology.player.restore(initial)
+    phonology.player.reseed(seed)
+    return phonology.play_str(text, base_freq=params.base_freq,\
+        phoneme_len=params.phoneme_len, vibrato=params.vibrato, prosody=params.prosody)
+
+# State of a worker process, set up by _init_process
+_process_phonology: Optional[Phonology] = None
+_process_initial: Optional[lpc.PlayerState] = None
+
+def _init_process(bank_path: str, dtype: type, output_rate: Optional[int], block_size: int,\
+        cache: Optional[Tuple[int, int]]) -> None:
+    """Loads the bank with the settings of the phonology the pool was made from"""
+    global _process_phonology, _process_initial
+    _process_phonology = Phonology.load_bank(bank_path, dtype)
+    _process_phonology.output_rate = output_rate
+    _process_phonology.player.block_size = block_size
+    if cache is not None:
+        _process_phonology.cache = RenderCache(*cache)
+    _process_initial = _process_phonology.player.state()
+
+def _speak_in_process(text: str, params: SynthesisParams, seed: Optional[int]) -> np.ndarray:
+    return _speak(_process_phonology, _process_initial, text, params, seed)
+
+class SynthesisPool:
+    """
+    A pool of workers that synthesize sentences in parallel, each with a player of its own
+
+    With threads, every worker renders on a fork of phonology and the GIL is released while
+    the kernel runs. With processes, phonology must have been loaded from a bank file, which
+    every worker process maps, so the phoneme frames are shared rather than copied. Each
+    process gets the phonology's dtype, output rate and block size, and an empty render
+    cache of the same size and seed if it has one.
+
+    seed: base seed; sentence i of a batch is rendered with a seed derived from it and i, so
+        a batch renders the same samples however many workers there are
+    """
+
+    def __init__(self, phonology: Phonology, workers: Optional[int] = None,\
+            processes: bool = False, seed: Optional[int] = None) -> None:
+        self.workers: int = workers or os.cpu_count() or 1
+        self.seed: Optional[int] = seed
+        self.executor: Executor
+        if processes:
+            bank_path: Optional[str] = getattr(phonology.phonemes, 'path', None)
+            if bank_path is None:
+                raise ValueError('Process workers need a phonology loaded from a bank file')
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_init_process,\
+                initargs=(bank_path, phonology.dtype, phonology.output_rate,\
+                phonology.player.block_size,\
+                None if phonology.cache is None else\
+                (phonology.cache.max_bytes, phonology.cache.seed)))
+        else:
+            self.executor = ThreadPoolExecutor(self.workers)
+            self._idle: 'queue.Queue[Phonology]' = queue.Queue()
+            i: int
+            for i in range(self.workers):
+                self._idle.put(phonology.fork())
+            self._initial: lpc.PlayerState = phonology.fork().player.state()
+        self.processes: bool = processes
+
+    def _speak(self, text: str, params: SynthesisParams, seed: Optional[int]) -> np.ndarray:
+        phonology: Phonology = self._idle.get()
+        try:
+            return _speak(phonology, self._initial, text, params, seed)
+        finally:
+            self._idle.put(phonology)
+
+    def _seeds(self, n: int) -> List[Optional[int]]:
+        if self.seed is None:
+            return [None] * n
+        return [int(np.random.SeedSequence(self.seed, spawn_key=(i,)).generate_state(1)[0])\
+            for i in range(n)]
+
+    def submit(self, texts: Sequence[str],\
+            params: Union[SynthesisParams, Sequence[SynthesisParams]] = SynthesisParams())\
+            -> List[Future]:
+        """Submits a batch and returns one future per text, in order"""
+        if isinstance(params, SynthesisParams):
+            params = [params] * len(texts)
+        elif len(params) != len(texts):
+            raise ValueError(f'Got {len(params)} parameter sets for {len(texts)} texts')
+        task = _speak_in_process if self.processes else self._speak
+        return [self.executor.submit(task, text, p, seed)\
+            for text, p, seed in zip(texts, params, self._seeds(len(texts)))]
+
+    def synthesize_batch(self, texts: Sequence[str],\
+            params: Union[SynthesisParams, Sequence[SynthesisParams]] = SynthesisParams(),\
+            ordered: bool = True) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Synthesizes texts and yields (index, samples) pairs, in the order of texts if
+        ordered, otherwise as they complete
+
+        params: parameters for all texts, or one set per text
+        """
+        futures: List[Future] = self.submit(texts, params)
+        if ordered:
+            return ((i, future.result()) for i, future in enumerate(futures))
+        indices: dict = {future: i for i, future in enumerate(futures)}
+        return ((indices[future], future.result()) for future in as_completed(futures))
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def __enter__(self) -> 'SynthesisPool':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+def synthesize_batch(phonology: Phonology, texts: Sequence[str],\
+        params: Union[SynthesisParams, Sequence[SynthesisParams]] = SynthesisParams(),\
+        workers: Optional[int] = None, processes: bool = False, seed: Optional[int] = None)\
+        -> List[np.ndarray]:
+    """Synthesizes texts on a temporary SynthesisPool and returns the samples in order"""
+    with SynthesisPool(phonology, workers, processes, seed) as pool:
+        return [samples for _, samples in pool.synthesize_batch(texts, params)]
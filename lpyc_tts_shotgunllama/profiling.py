@@ -0,0 +1,118 @@
+"""
+Optional per-stage timing of analysis and synthesis
+
+Instrumented code wraps each stage in `with profiling.stage(name):`. While no Profile is
+active this returns a shared do-nothing context, so the cost when profiling is off is one
+function call and a global lookup per stage.
+
+    with profiling.Profile() as profile:
+        phonology.play_str("'m-a-n")
+    print(profile.report())
+"""
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import ContextManager, Dict, List, Optional
+
+@dataclass
+class StageStats:
+    seconds: float = 0
+    calls: int = 0
+
+class _Stage:
+    __slots__ = ('profile', 'name', 'start')
+
+    def __init__(self, profile: 'Profile', name: str) -> None:
+        self.profile: Profile = profile
+        self.name: str = name
+        self.start: float = 0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_) -> None:
+        self.profile.add(self.name, time.perf_counter() - self.start)
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *_) -> None:
+        pass
+
+_NULL_STAGE: _NullStage = _NullStage()
+_active: Optional['Profile'] = None
+
+def stage(name: str) -> ContextManager[None]:
+    """Returns a context that times its body as stage name of the active profile, if any"""
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(_active, name)
+
+def audio(kind: str, n_samples: int, rate: float) -> None:
+    """Records that n_samples samples at rate Hz were synthesized or analyzed, as kind"""
+    if _active is not None and rate:
+        _active.add_audio(kind, n_samples / rate)
+
+@dataclass
+class Profile:
+    """
+    Wall time and call counts per stage, and seconds of audio per kind of work, collected
+    from every thread while the profile is active. Stage times are inclusive: a stage that
+    calls another instrumented stage also counts the time spent in it.
+    Work done in other processes is not recorded.
+    """
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    audio_seconds: Dict[str, float] = field(default_factory=dict)
+    wall_seconds: float = 0
+    cpu_seconds: float = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    _previous: Optional['Profile'] = field(default=None, init=False, repr=False)
+    _start: tuple = field(default=(0, 0), init=False, repr=False)
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            stats: Optional[StageStats] = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.seconds += seconds
+            stats.calls += 1
+
+    def add_audio(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            self.audio_seconds[kind] = self.audio_seconds.get(kind, 0) + seconds
+
+    def real_time_factor(self, kind: str = 'synthesis') -> float:
+        """Returns the seconds of audio of a kind processed per second of CPU time"""
+        if not self.cpu_seconds:
+            return 0
+        return self.audio_seconds.get(kind, 0) / self.cpu_seconds
+
+    def report(self) -> str:
+        lines: List[str] = [f'{"stage":<32} {"calls":>8} {"seconds":>10} {"per call":>10}']
+        name: str
+        stats: StageStats
+        for name, stats in sorted(self.stages.items(), key=lambda item: -item[1].seconds):
+            lines.append(f'{name:<32} {stats.calls:>8} {stats.seconds:>10.4f} '\
+                f'{stats.seconds / stats.calls * 1e3:>8.3f}ms')
+        lines.append(f'wall {self.wall_seconds:.4f}s, cpu {self.cpu_seconds:.4f}s')
+        kind: str
+        for kind, seconds in self.audio_seconds.items():
+            lines.append(f'{kind}: {seconds:.3f}s of audio, real-time factor '\
+                f'{self.real_time_factor(kind):.1f}x')
+        return '\n'.join(lines)
+
+    def __enter__(self) -> 'Profile':
+        global _active
+        self._previous = _active
+        self._start = (time.perf_counter(), time.process_time())
+        _active = self
+        return self
+
+    def __exit__(self, *_) -> None:
+        global _active
+        _active = self._previous
+        self.wall_seconds += time.perf_counter() - self._start[0]
+        self.cpu_seconds += time.process_time() - self._start[1]
@@ -0,0 +1,168 @@
+"""
+Polyphase sample rate conversion by rational factors
+
+A rate change from_rate -> to_rate is an upsampling by L and a downsampling by M, with
+L / M the ratio reduced to lowest terms. The anti-aliasing filter is a Kaiser-windowed sinc
+cut off just below the lower rate's Nyquist frequency, split into L phases so that each
+output sample takes one dot product of a phase with the most recent input samples. Output
+sample n is the signal at input time n * M / L, and the filter is centered on it, so the
+output is not delayed.
+"""
+from functools import lru_cache
+import math
+import numpy as np
+from typing import List, Tuple
+
+from lpyc_tts_shotgunllama import profiling
+
+# Zero crossings of the sinc on each side, in samples at the lower of the two rates
+_ZERO_CROSSINGS: int = 16
+# Fraction of the lower rate's Nyquist frequency passed
+_ROLLOFF: float = .9
+_BETA: float = 8.6
+# Output samples computed per vectorized step, bounding the size of the window matrix
+_BLOCK: int = 4096
+# Least output samples per period; shorter periods are merged so that each matrix product
+# computes at least this many columns
+_MIN_PERIOD: int = 64
+
+def ratio(from_rate: int, to_rate: int) -> Tuple[int, int]:
+    """Returns the upsampling and downsampling factors of a rate change"""
+    g: int = math.gcd(int(from_rate), int(to_rate))
+    return int(to_rate) // g, int(from_rate) // g
+
+def output_length(n_samples: int, from_rate: int, to_rate: int) -> int:
+    """Returns the number of samples n_samples samples resample to"""
+    up, down = ratio(from_rate, to_rate)
+    return -(-n_samples * up // down)
+
+@lru_cache(maxsize=16)
+def design(up: int, down: int) -> Tuple[np.ndarray, int]:
+    """
+    Returns the filter for upsampling by up and downsampling by down as a matrix with one
+    column per output sample of a period, and the offset of its first row. Output sample
+    q * up + r is the dot product of column r with the input samples from
+    q * down + offset on.
+    """
+    matrix, offset, _ = _design(up, down)
+    return matrix, offset
+
+@lru_cache(maxsize=16)
+def _design(up: int, down: int) -> Tuple[np.ndarray, int, Tuple[Tuple[int, int, np.ndarray], ...]]:
+    """
+    Returns design's matrix and offset, and the matrix split into bands of consecutive
+    columns as (first column, first row, rows) with only the rows those columns use. The
+    matrix of a large rate change is mostly zeros, which the bands skip.
+    """
+    # Taps per phase, so that the filter spans _ZERO_CROSSINGS periods of the lower rate
+    # on each side
+    taps: int = 2 * _ZERO_CROSSINGS * max(up, down) // up
+    n: int = up * taps + 1
+    cutoff: float = _ROLLOFF * .5 / max(up, down)
+    m: np.ndarray = np.arange(n) - (n - 1) / 2
+    h: np.ndarray = 2 * cutoff * np.sinc(2 * cutoff * m) * np.kaiser(n, _BETA) * up
+    h = np.concatenate((h, np.zeros(up * (taps + 1) - n)))
+    # Phase p, with its taps in input order, oldest first
+    phases: np.ndarray = h.reshape(taps + 1, up).T[:, ::-1]
+    # Output r of a period is centered (r * down + center) / up input samples in
+    center: int = (n - 1) // 2
+    r: np.ndarray = np.arange(up)
+    starts: np.ndarray = (r * down + center) // up - taps
+    matrix: np.ndarray = np.zeros((starts[-1] - starts[0] + taps + 1, up))
+    i: int
+    for i in range(up):
+        first: int = starts[i] - starts[0]
+        matrix[first : first + taps + 1, i] = phases[(i * down + center) % up]
+    # Bands of columns whose rows overlap by at most half, so a band has at most twice the
+    # rows of one column
+    bands: List[Tuple[int, int, np.ndarray]] = []
+    column: int = 0
+    while column < up:
+        low: int = starts[column] - starts[0]
+        end: int = int(np.searchsorted(starts, starts[column] + taps + 1, 'right'))
+        end = max(end, column + 1)
+        bands.append((column, low, matrix[low : starts[end - 1] - starts[0] + taps + 1,\
+            column:end]))
+        column = end
+    return matrix, int(starts[0]), tuple(bands)
+
+class Resampler:
+    """
+    Converts a signal delivered in chunks, keeping only the input samples that upcoming
+    output samples still need. The outputs of process for every chunk, followed by flush,
+    add up to resample of the whole signal.
+    """
+
+    def __init__(self, from_rate: int, to_rate: int) -> None:
+        self.up, self.down = ratio(from_rate, to_rate)
+        # The same filter, designed over several periods at once
+        k: int = -(-_MIN_PERIOD // self.up)
+        self.up *= k
+        self.down *= k
+        self.matrix, self._offset, self._bands = _design(self.up, self.down)
+        # Input samples not yet consumed, the first of which is input sample _base; the
+        # signal is taken to be silent before it starts
+        self._base: int = min(0, self._offset)
+        self._buffer: np.ndarray = np.zeros(-self._base)
+        self._received: int = 0
+        self._next: int = 0
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """Takes the next input samples and returns the output samples now computable"""
+        chunk = np.asanyarray(chunk)
+        if chunk.dtype == np.float32 and self._buffer.dtype != np.float32:
+            self._buffer = self._buffer.astype(np.float32)
+        self._buffer = np.concatenate((self._buffer, chunk))
+        self._received += len(chunk)
+        # Emit whole periods whose input has all been received
+        q: int = (self._received - self._offset - len(self.matrix)) // self.down + 1
+        return self._emit(max(self._next, q * self.up))
+
+    def flush(self) -> np.ndarray:
+        """Returns the remaining output samples, taking the input to be silent after its end"""
+        return self._emit(-(-self._received * self.up // self.down))
+
+    def _emit(self, end: int) -> np.ndarray:
+        if end <= self._next:
+            return np.empty(0, self._buffer.dtype)
+        q0: int = self._next // self.up
+        q1: int = -(-end // self.up)
+        width: int = max(len(band) for _, _, band in self._bands)
+        # Pad the input with silence past the last sample that the periods touch, far enough
+        # for every band's window to exist
+        needed: int = (q1 - 1) * self.down + self._offset + len(self.matrix) + width - self._base
+        buffer: np.ndarray = self._buffer
+        if needed > len(buffer):
+            buffer = np.concatenate((buffer, np.zeros(needed - len(buffer), buffer.dtype)))
+        frames: np.ndarray = np.lib.stride_tricks.sliding_window_view(buffer, width)
+        out: np.ndarray = np.empty((q1 - q0, self.up), buffer.dtype)
+        step: int = max(1, _BLOCK // self.up)
+        q: int
+        with profiling.stage('Resampler'):
+            for q in range(q0, q1, step):
+                first: int = q * self.down + self._offset - self._base
+                n_periods: int = min(step, q1 - q)
+                column: int
+                low: int
+                band: np.ndarray
+                for column, low, band in self._bands:
+                    out[q - q0 : q - q0 + n_periods, column : column + band.shape[1]] =\
+                        frames[first + low : first + low + n_periods * self.down : self.down,\
+                        :len(band)] @ band.astype(buffer.dtype, copy=False)
+        out = out.ravel()[self._next - q0 * self.up : end - q0 * self.up]
+        self._next = end
+        first = (self._next // self.up) * self.down + self._offset
+        if first > self._base:
+            self._buffer = self._buffer[first - self._base:]
+            self._base = first
+        return out
+
+def resample(signal: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """Converts a whole signal from from_rate to to_rate; float32 input stays float32"""
+    signal = np.asanyarray(signal)
+    if signal.dtype != np.float32:
+        signal = signal.astype(float, copy=False)
+    if from_rate == to_rate:
+        return signal.copy()
+    resampler: Resampler = Resampler(from_rate, to_rate)
+    return np.concatenate((resampler.process(signal), resampler.flush()))
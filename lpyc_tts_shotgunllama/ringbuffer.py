@@ -0,0 +1,92 @@
+"""
+A preallocated byte ring buffer for handing audio from a render thread to an audio callback
+"""
+from threading import Event
+from typing import Optional, Union
+
+_Bytes = Union[bytes, bytearray, memoryview]
+
+class RingBuffer:
+    """
+    A single-producer, single-consumer ring of bytes. One thread writes and another reads
+    without locks: only the writer moves the write position and only the reader moves the
+    read position, and both only grow.
+    Reads and writes copy through memoryviews of a buffer allocated once. Discarding unread
+    bytes moves the read position, so it is the reader's job too.
+
+    underruns: number of reads that found fewer bytes than requested since data was
+        first written after the last clear
+    underrun_bytes: total number of bytes those reads were short by
+    """
+
+    def __init__(self, capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError(f'Capacity must be positive, got {capacity}')
+        self.capacity: int = capacity
+        self._buffer: bytearray = bytearray(capacity)
+        self._view: memoryview = memoryview(self._buffer)
+        self._read: int = 0
+        self._write: int = 0
+        self._primed: bool = False
+        self._space: Event = Event()
+        self.underruns: int = 0
+        self.underrun_bytes: int = 0
+
+    def available(self) -> int:
+        """Returns the number of bytes that can be read"""
+        return self._write - self._read
+
+    def free(self) -> int:
+        """Returns the number of bytes that can be written"""
+        return self.capacity - (self._write - self._read)
+
+    def write(self, data: _Bytes) -> int:
+        """Copies as much of data as fits into the ring and returns the number of bytes copied"""
+        data = memoryview(data).cast('B')
+        n: int = min(len(data), self.free())
+        start: int = self._write % self.capacity
+        first: int = min(n, self.capacity - start)
+        self._view[start : start + first] = data[:first]
+        self._view[: n - first] = data[first:n]
+        self._write += n
+        if n:
+            self._primed = True
+        return n
+
+    def read_into(self, out: memoryview) -> int:
+        """
+        Copies up to len(out) bytes from the ring into out, fills the rest of out with zeros
+        and returns the number of bytes copied
+        """
+        n: int = min(len(out), self.available())
+        start: int = self._read % self.capacity
+        first: int = min(n, self.capacity - start)
+        out[:first] = self._view[start : start + first]
+        out[first:n] = self._view[: n - first]
+        if n < len(out):
+            i: int
+            for i in range(n, len(out), len(_ZEROS)):
+                out[i : i + len(_ZEROS)] = _ZEROS[: len(out) - i]
+            if self._primed:
+                self.underruns += 1
+                self.underrun_bytes += len(out) - n
+        self._read += n
+        self._space.set()
+        return n
+
+    def wait_space(self, timeout: Optional[float] = None) -> bool:
+        """Waits until a read frees some space or timeout seconds pass; returns whether any
+        space is free"""
+        self._space.clear()
+        if self.free():
+            return True
+        self._space.wait(timeout)
+        return self.free() > 0
+
+    def clear(self) -> None:
+        """Discards the bytes written so far and not yet read. Called by the reader."""
+        self._read = self._write
+        self._primed = False
+        self._space.set()
+
+_ZEROS: memoryview = memoryview(bytes(1 << 16))
@@ -0,0 +1,160 @@
+"""
+Vectorized PCM WAV decoding and encoding
+
+Samples are exchanged as float arrays in [-1, 1]. Integer PCM of 8 (unsigned), 16, 24
+and 32 bits is converted with array casts rather than per-sample loops.
+"""
+from dataclasses import dataclass, field
+import io
+import numpy as np
+from typing import Iterator, Optional, Tuple, Union
+import wave
+
+from lpyc_tts_shotgunllama import profiling
+
+_WavDst = Union[str, io.IOBase]
+
+def decode(data: bytes, width: int, channels: int = 1, channel: Optional[int] = None,\
+        dtype: np.dtype = np.float64) -> np.ndarray:
+    """
+    Decodes interleaved little-endian PCM bytes to an array of samples in [-1, 1)
+
+    data: PCM bytes as read from a WAV file
+    width: bytes per sample, 1 through 4
+    channels: number of interleaved channels
+    channel: index of the channel to return, or None to average all channels
+    dtype: float dtype of the returned array
+    """
+    with profiling.stage('wavio.decode'):
+        return _decode(data, width, channels, channel, dtype)
+
+def _decode(data: bytes, width: int, channels: int, channel: Optional[int],\
+        dtype: np.dtype) -> np.ndarray:
+    raw: np.ndarray = np.frombuffer(data, dtype=np.uint8)
+    raw = raw[:len(raw) - len(raw) % (width * channels)]
+    ints: np.ndarray
+    if width == 1:
+        ints = raw.astype(np.int16) - 128
+    elif width == 2:
+        ints = raw.view('<i2')
+    elif width == 3:
+        triples: np.ndarray = raw.reshape(-1, 3)
+        ints = triples[:, 0].astype(np.int32) | (triples[:, 1].astype(np.int32) << 8) |\
+            (triples[:, 2].view(np.int8).astype(np.int32) << 16)
+    elif width == 4:
+        ints = raw.view('<i4')
+    else:
+        raise ValueError(f'Unsupported sample width {width}')
+    ints = ints.reshape(-1, channels)
+    scale: float = 1 / (1 << (width * 8 - 1))
+    if channel is not None:
+        return ints[:, channel].astype(dtype) * scale
+    return (ints.mean(axis=1, dtype=np.float64) * scale).astype(dtype)
+
+def to_pcm(samples: np.ndarray, width: int = 2) -> np.ndarray:
+    """
+    Clips samples to [-1, 1] and scales them to integers of the given byte width, truncating
+    toward zero. Widths 1, 2 and 4 return uint8, int16 and int32 arrays; width 3 returns int32.
+    """
+    scale: int = (1 << (width * 8 - 1)) - 1
+    clipped: np.ndarray = np.clip(np.asanyarray(samples, dtype=float), -1, 1) * scale
+    if width == 1:
+        return (clipped.astype(np.int16) + 128).astype(np.uint8)
+    if width == 2:
+        return clipped.astype('<i2')
+    if width in (3, 4):
+        return clipped.astype('<i4')
+    raise ValueError(f'Unsupported sample width {width}')
+
+def encode(samples: np.ndarray, width: int = 2) -> bytes:
+    """Encodes samples in [-1, 1] to little-endian PCM bytes, clipping out of range values"""
+    with profiling.stage('wavio.encode'):
+        ints: np.ndarray = to_pcm(samples, width)
+        if width == 3:
+            return ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        return ints.tobytes()
+
+@dataclass
+class WavReader:
+    """
+    Reads a WAV file in chunks of decoded samples
+
+    channel: index of the channel to read, or None to average all channels
+    """
+    src: _WavDst
+    channel: Optional[int] = None
+    dtype: np.dtype = np.float64
+    file: wave.Wave_read = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.file = wave.open(self.src, 'rb')
+
+    @property
+    def rate(self) -> int:
+        return self.file.getframerate()
+
+    @property
+    def nframes(self) -> int:
+        return self.file.getnframes()
+
+    def read(self, n_frames: int = -1) -> np.ndarray:
+        """Reads and decodes up to n_frames frames, or all remaining frames if negative"""
+        if n_frames < 0:
+            n_frames = self.file.getnframes() - self.file.tell()
+        return decode(self.file.readframes(n_frames), self.file.getsampwidth(),\
+            self.file.getnchannels(), self.channel, self.dtype)
+
+    def chunks(self, chunk_frames: int = 1 << 16) -> Iterator[np.ndarray]:
+        """Yields the rest of the file as arrays of at most chunk_frames samples"""
+        while True:
+            chunk: np.ndarray = self.read(chunk_frames)
+            if not len(chunk):
+                return
+            yield chunk
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> 'WavReader':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+@dataclass
+class WavWriter:
+    """Writes mono float samples to a PCM WAV file in chunks"""
+    dst: _WavDst
+    rate: int
+    width: int = 2
+    file: wave.Wave_write = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.file = wave.open(self.dst, 'wb')
+        self.file.setnchannels(1)
+        self.file.setsampwidth(self.width)
+        self.file.setframerate(self.rate)
+        self.file.setcomptype('NONE', 'not compressed')
+
+    def write(self, samples: np.ndarray) -> None:
+        self.file.writeframes(encode(samples, self.width))
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> 'WavWriter':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+def read(src: _WavDst, channel: Optional[int] = None, dtype: np.dtype = np.float64)\
+        -> Tuple[np.ndarray, int]:
+    """Reads a whole WAV file and returns its samples and rate"""
+    with WavReader(src, channel, dtype) as reader:
+        return reader.read(), reader.rate
+
+def write(dst: _WavDst, samples: np.ndarray, rate: int, width: int = 2) -> None:
+    """Writes mono float samples to a PCM WAV file"""
+    with WavWriter(dst, rate, width) as writer:
+        writer.write(samples)
@@ -2,13 +2,11 @@ import json
 import math
 import numpy as np
 import random
-import struct
-import wave
 
 import numpy as np
 
-from lpyc_tts_shotgunllama import lpc
-from lpyc_tts_shotgunllama.player import phoneme
+from lpyc_tts_shotgunllama import lpc, wavio
+from lpyc_tts_shotgunllama.player import mixer, phoneme
 
 order = 48
 step = 441 * 1
@@ -27,44 +25,16 @@ phonology = phoneme.Phonology.load([
     'p', 'b', 'k', 'g', 't', 'd'
 ], '.')
 # output = phonology.play_str("'i-z-'thh-e-r-'s-U-m-th-ee-ng-g-'y-uu-'w-A-N-t .", base_freq=120)
-output = phonology.sing_str("p-ae-k", base_freq=100, duration=1.5, funcid=0, vibrato=0.01, pm=(.3, .5))
-output = np.concatenate((
-    output,
-    phonology.sing_str("m-aa-y-n", base_freq=100 * 2 ** (2/12), duration=1.5, funcid=0, vibrato=0.01, pm=(.1, .5))))
-output = np.concatenate((
-    output,
-    phonology.sing_str("i-z", base_freq=100 * 2 ** (3/12), duration=1.5, funcid=0, vibrato=0.01, pm=(.5, .5))))
-output = np.concatenate((
-    output,
-    phonology.sing_str("h-a-a-y", base_freq=100 * 2 ** (5/12), duration=1.5, funcid=0, vibrato=0.01, pm=(.5, .5))))
-output1 = output
+def line(phonology, words):
+    return [phonology.compile_sing(word, base_freq=100 * 2 ** (step/12), duration=1.5,
+        funcid=0, vibrato=0.01, pm=pm) for word, step, pm in zip(words, (0, 2, 3, 5),
+        ((.3, .5), (.1, .5), (.5, .5), (.5, .5)))]
 
-output = phonology.sing_str("p-a", base_freq=100, duration=1.5, funcid=0, vibrato=0.01, pm=(.3, .5))
-output = np.concatenate((
-    output,
-    phonology.sing_str("g-i-n", base_freq=100 * 2 ** (2/12), duration=1.5, funcid=0, vibrato=0.01, pm=(.1, .5))))
-output = np.concatenate((
-    output,
-    phonology.sing_str("d-a", base_freq=100 * 2 ** (3/12), duration=1.5, funcid=0, vibrato=0.01, pm=(.5, .5))))
-output = np.concatenate((
-    output,
-    phonology.sing_str("g-i-n", base_freq=100 * 2 ** (5/12), duration=1.5, funcid=0, vibrato=0.01, pm=(.5, .5))))
-keep = min(len(output), len(output1))
+alto = phonology.fork()
+output = mixer.mix([
+    mixer.Track(phonology, line(phonology, ["p-ae-k", "m-aa-y-n", "i-z", "h-a-a-y"]), .5),
+    mixer.Track(alto, line(alto, ["p-a", "g-i-n", "d-a", "g-i-n"]), .5)
+])
 
-output = output[:keep] * .5 + output1[:keep] * .5
 
-
-data = bytearray()
-for sample in output:
-    short = min(32767, max(-32768, int(32767 * sample)))
-    data += (short & 0xffff).to_bytes(2, 'little')
-data = bytes(data)
-
-with wave.open('out.wav', 'w') as wav:
-    wav.setnchannels(1)
-    wav.setframerate(44100)
-    wav.setsampwidth(2)
-    wav.setcomptype('NONE', 'not compressed')
-    wav.setnframes(len(data) // 2)
-    wav.writeframes(data)
-    
\ No newline at end of file
+wavio.write('out.wav', output, 44100)
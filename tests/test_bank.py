@@ -0,0 +1,35 @@
+from os import path
+
+import numpy as np
+import pytest
+
+from lpyc_tts_shotgunllama.player import bank, phoneme
+
+_root: str = path.dirname(path.dirname(path.abspath(__file__)))
+phonology = phoneme.Phonology.load(['a', 'e', 'm', 's', 't'], _root)
+
+def test_bank_round_trip(tmp_path):
+    phonemes = dict(phonology.phonemes)
+    # A phoneme of another framerate and continuity, to check that both are kept per phoneme
+    phonemes['x'] = phoneme.Phoneme(phonemes['a'].frames[:5], not phonemes['a'].continuous,\
+        22050)
+    dst = str(tmp_path / 'voice.bank')
+    bank.write_bank(dst, phonemes)
+    loaded = bank.Bank(dst)
+    assert list(loaded) == list(phonemes) and loaded.order() == 48
+    for name, original in phonemes.items():
+        decoded = loaded[name]
+        assert decoded.continuous == original.continuous
+        assert decoded.framerate == original.framerate
+        for a, b in zip(decoded.arrays(), original.arrays()):
+            assert np.array_equal(a, b)
+        assert np.array_equal(decoded.durations(), original.durations())
+
+def test_bank_rejects_bad_magic_and_footer(tmp_path):
+    dst = tmp_path / 'voice.bank'
+    bank.write_bank(str(dst), phonology.phonemes)
+    data = dst.read_bytes()
+    for corrupt in (b'NOTABANK' + data[8:], data[:-1], data[:-8] + b'LPCBANK\x01'):
+        (tmp_path / 'bad.bank').write_bytes(corrupt)
+        with pytest.raises(ValueError):
+            bank.Bank(str(tmp_path / 'bad.bank'))
@@ -0,0 +1,113 @@
+import numpy as np
+
+from lpyc_tts_shotgunllama.analyzer import analyze
+
+def _signal(n: int = 4000, seed: int = 1) -> np.ndarray:
+    rng: np.random.Generator = np.random.default_rng(seed)
+    t: np.ndarray = np.arange(n)
+    return np.sin(t * .05) + .5 * np.sin(t * .31) + .1 * rng.standard_normal(n)
+
+def test_calc_burg_batch_matches_calc_burg():
+    frames: np.ndarray = _signal().reshape(10, 400)
+    coeffs, gains = analyze.calc_burg_batch(frames, 12)
+    progressive_coeffs, progressive_gains = analyze.calc_burg_batch(frames, 12, True)
+    for i, frame in enumerate(frames):
+        _coeffs, _gains = analyze.calc_burg(frame, 12)
+        assert np.allclose(coeffs[i], _coeffs[-1])
+        assert np.isclose(gains[i], _gains[-1])
+        assert np.allclose(progressive_gains[i], _gains)
+        for o in range(12):
+            assert np.allclose(progressive_coeffs[i, o, :o + 1], _coeffs[o])
+
+def test_analyze_batch_matches_per_frame():
+    signal: np.ndarray = _signal()
+    for window_type, step_size in (('none', 100), ('hann', 100), ('kaiser', 300)):
+        batched = analyze.analyze(signal, 8, 300, step_size, window_type)
+        looped = analyze.analyze(signal.copy(), 8, 300, step_size, window_type, batch=False)
+        assert len(batched) == len(looped)
+        for a, b in zip(batched, looped):
+            assert np.allclose(a.coefficients, b.coefficients)
+            assert np.isclose(a.gain, b.gain)
+            assert np.isclose(a.voice, b.voice)
+
+def test_analyze_stream_matches_analyze():
+    signal: np.ndarray = _signal(5003)
+    for window_size, step_size, chunk in ((300, 100, 77), (300, 100, 1000), (100, 250, 333)):
+        expected = analyze.analyze(signal, 8, window_size, step_size, 'hann')
+        chunks = (signal[i : i + chunk] for i in range(0, len(signal), chunk))
+        streamed = list(analyze.analyze_stream(chunks, 8, window_size, step_size, 'hann'))
+        assert len(streamed) == len(expected)
+        for a, b in zip(streamed, expected):
+            assert np.allclose(a.coefficients, b.coefficients)
+            assert np.isclose(a.gain, b.gain)
+            assert np.isclose(a.voice, b.voice)
+
+def test_analyze_parallel_matches_analyze():
+    signal: np.ndarray = _signal(5003)
+    for window_size, step_size, progressive in ((300, 100, False), (300, 70, True)):
+        expected = analyze.analyze(signal, 8, window_size, step_size, 'hann', progressive,\
+            framerate=16000)
+        parallel = analyze.analyze_parallel(signal, 8, window_size, step_size, 'hann',\
+            progressive, workers=2, framerate=16000)
+        # Frames on both sides of the block boundary, and the ragged last frames, must match
+        assert len(parallel) == len(expected)
+        for a, b in zip(np.ravel(parallel), np.ravel(expected)):
+            assert np.allclose(a.coefficients, b.coefficients)
+            assert np.isclose(a.gain, b.gain)
+            assert np.isclose(a.voice, b.voice)
+            assert np.isclose(a.f0, b.f0)
+
+def test_analyze_tracks_pitch():
+    framerate: int = 16000
+    t: np.ndarray = np.arange(framerate) / framerate
+    f0: float = 137.5
+    voiced: np.ndarray = np.sign(np.sin(2 * np.pi * f0 * t)) * .5
+    noise: np.ndarray = np.random.default_rng(2).standard_normal(framerate) * .5
+    frames = analyze.analyze(np.concatenate((voiced, noise)), 12, 640, 320, 'hann',\
+        framerate=framerate)
+    pitched = [frame.f0 for frame in frames[2 : 48]]
+    assert np.allclose(pitched, f0, rtol=.02)
+    unvoiced = [frame.f0 for frame in frames[52 : 98]]
+    assert np.mean(np.equal(unvoiced, 0)) > .9
+    # Voicing is the tracker's periodicity: near 1 for the pulse train, low for noise
+    voices = np.array([frame.voice for frame in frames])
+    assert np.all((voices >= 0) & (voices <= 1))
+    assert voices[2 : 48].min() > .9
+    assert voices[52 : 98].mean() < .2
+    # Smooth noise correlates well with itself one sample later but has no period
+    smooth: np.ndarray = np.convolve(noise, np.hanning(32), 'same')
+    frames = analyze.analyze(smooth, 12, 640, 320, 'hann', framerate=framerate)
+    assert np.mean([frame.voice for frame in frames]) < .5
+    looped = analyze.analyze(np.concatenate((voiced, noise)), 12, 640, 320, 'hann',\
+        batch=False, framerate=framerate)
+    assert np.allclose([frame.voice for frame in looped], voices)
+
+def test_float32_analysis_tracks_float64():
+    signal: np.ndarray = _signal()
+    doubles = analyze.analyze(signal, 12, 400, 200, 'hann')
+    singles = analyze.analyze(signal, 12, 400, 200, 'hann', dtype=np.float32)
+    assert len(singles) == len(doubles)
+    for a, b in zip(singles, doubles):
+        assert a.coefficients.dtype == np.float32
+        assert np.all(np.abs(np.roots(np.r_[1, a.coefficients])) < 1)
+        envelopes = [10 * np.log10(frame.gain / np.abs(np.fft.rfft(np.r_[1,\
+            frame.coefficients.astype(float)], 256)) ** 2) for frame in (a, b)]
+        assert np.abs(envelopes[0] - envelopes[1]).max() < .01
+
+def test_adaptation_merges_steady_frames_and_silence():
+    t: np.ndarray = np.arange(8000)
+    steady: np.ndarray = np.sin(t * .05) + .5 * np.sin(t * .31)
+    signal: np.ndarray = np.concatenate((np.zeros(2000), steady, np.sin(t[:4000] * .9)))
+    signal[2000:] += .01 * np.random.default_rng(1).standard_normal(12000)
+    frames = analyze.analyze(signal, 12, 400, 200, 'hann')
+    adapted = list(analyze.Adaptation(silence_db=-60).apply(frames))
+    assert len(adapted) * 5 < len(frames)
+    assert sum(frame.duration for frame in adapted) == len(frames)
+    assert adapted[0].gain == 0 and adapted[0].duration >= 8
+    assert all(np.all(np.abs(np.roots(np.r_[1, frame.coefficients])) < 1)\
+        for frame in adapted if frame.gain)
+    skipped = list(analyze.Adaptation(silence_db=-60, skip_silence=True).apply(frames))
+    assert [frame.duration for frame in skipped] == [frame.duration for frame in adapted[1:]]
+    # Without merging, only silent runs are combined
+    silent_only = list(analyze.Adaptation(0, silence_db=-60).apply(frames))
+    assert len(silent_only) == len(frames) - adapted[0].duration + 1
@@ -0,0 +1,53 @@
+from os import path
+
+import numpy as np
+import pytest
+
+from lpyc_tts_shotgunllama.player import bank, codebook, phoneme
+
+_root: str = path.dirname(path.dirname(path.abspath(__file__)))
+phonology = phoneme.Phonology.load(['a', 'e', 'm', 's', 't'], _root)
+
+def test_lsf_round_trip():
+    coefficients = np.concatenate([p.arrays()[0] for p in phonology.phonemes.values()])
+    lsf = codebook.to_lsf(coefficients)
+    assert np.all(np.diff(lsf, axis=1) > 0)
+    assert np.all((lsf > 0) & (lsf < np.pi))
+    assert codebook.spectral_distortion(coefficients, codebook.from_lsf(lsf)).max() < .1
+
+def test_compressed_bank_decodes(tmp_path):
+    dst = str(tmp_path / 'voice.bank')
+    report = codebook.compress(phonology.phonemes, dst, k=32)
+    assert set(report) == set(phonology.phonemes)
+    compressed = bank.Bank(dst)
+    assert compressed.index['codebook']['size'] == 32
+    for name, original in phonology.phonemes.items():
+        decoded = compressed[name]
+        assert len(decoded.frames) == len(original.frames)
+        assert decoded.continuous == original.continuous
+        assert np.allclose(decoded.arrays()[1], original.arrays()[1], rtol=.1)
+    samples = phoneme.Phonology(compressed, seed=1).play_str("'m-a-s")
+    assert np.all(np.isfinite(samples)) and np.abs(samples).max() > 0
+
+def test_kmeans_labels_match_final_centers():
+    data = np.random.default_rng(3).standard_normal((500, 4))
+    for iterations in (1, 2, 25):
+        centers, labels = codebook.kmeans(data, 16, iterations)
+        distances = ((data[:, np.newaxis] - centers) ** 2).sum(axis=2)
+        assert np.array_equal(labels, np.argmin(distances, axis=1))
+
+def test_bank_version_must_match_codebook(tmp_path):
+    dst = str(tmp_path / 'voice.bank')
+    codebook.compress(phonology.phonemes, dst, k=8)
+    compressed = bank.Bank(dst)
+    assert compressed.compressed
+    columns = dict(compressed.columns)
+    for version, entry in ((1, compressed.index['codebook']), (2, None), (3, None)):
+        index = {key: value for key, value in compressed.index.items()\
+            if key not in ('columns', 'codebook')}
+        index['version'] = version
+        if entry is not None:
+            index['codebook'] = entry
+        bank.write_arrays(str(tmp_path / 'bad.bank'), index, columns)
+        with pytest.raises(ValueError):
+            bank.Bank(str(tmp_path / 'bad.bank'))
@@ -0,0 +1,66 @@
+from os import path
+import threading
+import time
+
+from lpyc_tts_shotgunllama import lpc, wavio
+from lpyc_tts_shotgunllama.analyzer import player
+from lpyc_tts_shotgunllama.player import phoneme
+
+_root: str = path.dirname(path.dirname(path.abspath(__file__)))
+frames = phoneme.Phonology.load(['a', 'm'], _root).phonemes['a'].frames
+# Fully voiced, so that the output does not depend on how the noise is drawn
+frames = [lpc.LPC(frame.coefficients, frame.gain, 1., frame.f0) for frame in frames]
+
+def _console() -> player.Console:
+    console = player.Console(frames, 44100)
+    console.player = lpc.LPCPlayer(frames[0].order(), seed=1)
+    return console
+
+def _expected(indices, n_bytes: int) -> bytes:
+    console = _console()
+    console.player.prime(frames[indices[0]], console.freq / console.framerate)
+    loop = wavio.encode(console._render([frames[i] for i in indices], 441))
+    return (loop * (n_bytes // len(loop) + 1))[:n_bytes]
+
+def _pull(console: player.Console, n_bytes: int, chunk: int = 256) -> bytes:
+    """Plays the part of the audio callback, waiting for the render thread to keep up"""
+    data = bytearray()
+    deadline = time.monotonic() + 30
+    while len(data) < n_bytes:
+        while console.ring.available() < 2 * chunk and time.monotonic() < deadline:
+            time.sleep(.001)
+        data += console.callback(None, chunk, {}, 0)[0]
+    return bytes(data[:n_bytes])
+
+def _switch(console: player.Console) -> bytes:
+    """The first callback after a selection starts; holding the lock keeps the render thread
+    from writing during it"""
+    with console.lock:
+        return bytes(console.callback(None, 256, {}, 0)[0])
+
+def test_console_streams_selection_and_switches():
+    console = _console()
+    before = set(threading.enumerate())
+    console.play([0, 1, 2], repeat=True)
+    time.sleep(.05)
+    # Nothing is written until the callback has discarded what was playing before
+    assert console.ring.available() == 0
+    assert _switch(console) == bytes(512)
+    assert _pull(console, 8000) == _expected([0, 1, 2], 8000)
+    # The ring still holds the old selection, which the first read after the switch drops
+    assert console.ring.available() > 0
+    console.play([3, 4], repeat=True)
+    assert _switch(console) == bytes(512)
+    assert _pull(console, 6000) == _expected([3, 4], 6000)
+    threads = set(threading.enumerate()) - before
+    console.stop()
+    for thread in threads:
+        thread.join(5)
+    assert not any(thread.is_alive() for thread in threads)
+
+def test_callback_reuses_its_output_view():
+    console = _console()
+    first = console.callback(None, 256, {}, 0)[0]
+    assert first.readonly and len(first) == 512
+    assert console.callback(None, 256, {}, 0)[0] is first
+    assert len(console.callback(None, 300, {}, 0)[0]) == 600
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+import threading
+
+import pytest
+
+from lpyc_tts_shotgunllama.player import client, daemon, phoneme
+
+_root: str = path.dirname(path.dirname(path.abspath(__file__)))
+
+@pytest.fixture(scope='module')
+def address():
+    phonology = phoneme.Phonology.load(['a', 'm', 'n', 's', 'e'], _root)
+    server = daemon.serve(daemon.Synthesizer(phonology, 2), ('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+def test_round_trip_wav_and_pcm(address):
+    header, chunks = client.request(address, "'m-a-n s-e-e-m", seed=1)
+    data = b''.join(chunks)
+    assert header['format'] == 'wav' and header['rate'] == 44100
+    assert data[:4] == b'RIFF' and len(data) == 44 + 2 * header['samples']
+    header, chunks = client.request(address, "'m-a-n s-e-e-m", fmt='pcm', seed=1)
+    pcm = b''.join(chunks)
+    assert len(pcm) == 2 * header['samples']
+    assert pcm == data[44:]
+
+def test_bad_requests_get_errors(address):
+    with pytest.raises(RuntimeError, match='Unknown mode'):
+        client.request(address, "'m-a-n", mode='shout')
+    with pytest.raises(RuntimeError, match='Unknown parameters'):
+        client.request(address, "'m-a-n", loudness=3)
+
+def test_concurrent_requests_with_a_seed_match(address):
+    def speak(_):
+        return b''.join(client.request(address, "'m-a-n ,s-e-e-m", fmt='pcm', seed=7)[1])
+    with ThreadPoolExecutor(2) as executor:
+        first, second = executor.map(speak, range(2))
+    assert first == second and len(first) > 0
@@ -0,0 +1,42 @@
+from os import path
+
+import numpy as np
+
+from lpyc_tts_shotgunllama.player import g2p, phoneme
+
+_root: str = path.dirname(path.dirname(path.abspath(__file__)))
+
+def test_lexicon_round_trip(tmp_path):
+    source = tmp_path / 'lexicon.txt'
+    source.write_text(';;; comment\nHELLO  HH AH0 L OW1\nHELLO(2)  HH EH0 L OW1\n'\
+        'seem s-EE-m\nnight N AY1 T\n')
+    entries = list(g2p.read_source(str(source)))
+    assert entries == [('hello', 'h-u-l-O'), ('seem', 's-EE-m'), ('night', 'n-A-ee-t')]
+    lexicon_path = str(tmp_path / 'english.lex')
+    assert g2p.compile_lexicon(entries, lexicon_path) == 3
+    lexicon = g2p.Lexicon(lexicon_path)
+    assert len(lexicon) == 3
+    assert lexicon.get('Hello') == 'h-u-l-O'
+    assert lexicon.get('night') == 'n-A-ee-t'
+    assert 'seems' not in lexicon
+    front = g2p.G2P(lexicon_path)
+    assert front.markup('Hello, night. Seem 21!') ==\
+        "h-u-l-O ,n-A-ee-t .s-EE-m t-w-E-n-t-ee w-u-n"
+    assert front.word('hello') is front.word('hello')
+
+def test_rules_cover_unknown_words():
+    front = g2p.G2P()
+    for word in ('strength', 'phonology', 'quickly', 'knowledge', "can't", 'xylophone'):
+        sounds = front.word(word).split('-')
+        assert sounds and all(sound.lower() in g2p.INVENTORY for sound in sounds)
+    assert front.word('ship') == 'c-i-p'
+    assert front.word('made') == 'm-e-ee-d'
+
+def test_text_compiles_to_a_plan():
+    names = [name for line in open(path.join(_root, 'phonemes.txt'))\
+        for name in line.split()[:1] if not name.endswith(':')]
+    assert sorted(names) == sorted(g2p.INVENTORY)
+    phonology = phoneme.Phonology.load(['a', 'e', 'i', 'm', 'n', 's', 't', 'p'], _root)
+    plan = g2p.G2P().compile(phonology, 'Same man, it seems.', base_freq=110)
+    assert plan.n_samples > 0 and len(plan.word_starts) == 5
+    assert np.all(np.isfinite(phonology.render(plan)))
@@ -0,0 +1,24 @@
+import numpy as np
+
+from lpyc_tts_shotgunllama import resample
+
+def test_resample_preserves_tones():
+    for from_rate, to_rate in ((16000, 44100), (44100, 16000), (22050, 44100)):
+        t = np.arange(from_rate) / from_rate
+        y = resample.resample(np.sin(2 * np.pi * 1000 * t), from_rate, to_rate)
+        assert len(y) == resample.output_length(from_rate, from_rate, to_rate)
+        expected = np.sin(2 * np.pi * 1000 * np.arange(len(y)) / to_rate)
+        middle = slice(len(y) // 10, -len(y) // 10)
+        assert np.abs(y[middle] - expected[middle]).max() < 1e-3
+    # A tone above the new Nyquist frequency is removed, not aliased
+    t = np.arange(44100) / 44100
+    y = resample.resample(np.sin(2 * np.pi * 12000 * t), 44100, 16000)
+    assert np.abs(y[1600:-1600]).max() < 1e-3
+
+def test_resampler_stream_matches_resample():
+    x = np.random.default_rng(5).standard_normal(10000)
+    for from_rate, to_rate in ((16000, 44100), (44100, 16000), (8000, 16000)):
+        resampler = resample.Resampler(from_rate, to_rate)
+        parts = [resampler.process(x[i : i + 777]) for i in range(0, len(x), 777)]
+        streamed = np.concatenate(parts + [resampler.flush()])
+        assert np.allclose(streamed, resample.resample(x, from_rate, to_rate), atol=1e-12)
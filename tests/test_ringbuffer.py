@@ -0,0 +1,16 @@
+from lpyc_tts_shotgunllama.ringbuffer import RingBuffer
+
+def test_ring_wraps_and_counts_underruns():
+    ring = RingBuffer(8)
+    out = memoryview(bytearray(6))
+    assert ring.read_into(out) == 0
+    assert ring.underruns == 0
+    assert ring.write(b'abcdef') == 6
+    assert ring.read_into(out) == 6 and bytes(out) == b'abcdef'
+    assert ring.write(b'0123456789') == 8
+    assert ring.read_into(out) == 6 and bytes(out) == b'012345'
+    assert ring.read_into(out) == 2 and bytes(out) == b'67\0\0\0\0'
+    assert (ring.underruns, ring.underrun_bytes) == (1, 4)
+    ring.write(b'xy')
+    ring.clear()
+    assert ring.read_into(out) == 0 and ring.underruns == 1
@@ -0,0 +1,17 @@
+import subprocess
+import sys
+
+_SCRIPT: str = '''
+import sys
+from lpyc_tts_shotgunllama import lpc
+from lpyc_tts_shotgunllama.analyzer import analyze, player
+from lpyc_tts_shotgunllama.player import phoneme
+lpc.warmup()
+print(any(m in sys.modules for m in ('pyaudio', 'tkinter')))
+'''
+
+def test_startup_defers_audio_and_gui_imports():
+    # Startup time is measured by the 'startup' case in benchmarks/bench.py
+    result: subprocess.CompletedProcess = subprocess.run([sys.executable, '-c', _SCRIPT],\
+        capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['False']
@@ -0,0 +1,197 @@
+from os import path
+
+import numpy as np
+
+from lpyc_tts_shotgunllama import lpc, profiling, wavio
+from lpyc_tts_shotgunllama.player import bank, mixer, phoneme, pool
+from lpyc_tts_shotgunllama.player.cache import RenderCache
+
+_root: str = path.dirname(path.dirname(path.abspath(__file__)))
+phonology = phoneme.Phonology.load(['a', 'e', 'i', 'm', 'n', 's', 't', 'p'], _root)
+
+def test_render_plan_length_is_exact():
+    plan = phonology.compile_str("'m-a-!n ,t-I-p >s-e-e-m", base_freq=110)
+    assert plan.n_samples == plan.counts.sum()
+    out = np.full(plan.n_samples + 10, 2.0)
+    rendered = phonology.render(plan, out)
+    assert len(rendered) == plan.n_samples
+    assert np.all(out[plan.n_samples:] == 2)
+    assert np.all(np.abs(rendered) <= 1)
+    sung = phonology.compile_sing('m-a-n s-i-t', duration=.4)
+    assert len(phonology.render(sung)) == sung.n_samples
+
+def test_same_seed_renders_identical_audio():
+    renders = []
+    for seed in (7, 7, 8):
+        phonology.player.reseed(seed)
+        renders.append(phonology.play_str("'m-a-n s-e-e-m", vibrato=.05))
+    assert np.array_equal(renders[0], renders[1])
+    assert not np.array_equal(renders[0], renders[2])
+
+def test_render_cache_replays_words():
+    cached = phoneme.Phonology(phonology.phonemes, seed=3, cache=RenderCache())
+    plan = cached.compile_str("'m-a-n s-e-e-m 'm-a-n")
+    first = cached.render(plan).copy()
+    assert cached.cache.stats()['misses'] == 2
+    assert cached.cache.stats()['hits'] == 1
+    assert np.array_equal(cached.render(plan), first)
+    assert cached.cache.stats()['hits'] == 4
+
+def test_mix_matches_sequential_render():
+    plans = [phonology.compile_sing('m-a-n s-i-t', base_freq=f) for f in (100, 150, 200)]
+    voices = [phonology.fork(seed) for seed in range(3)]
+    tracks = [mixer.Track(voice, [plan], .5, offset) for voice, plan, offset in\
+        zip(voices, plans, (0, 100, 441))]
+    mixed = mixer.mix(tracks, workers=3)
+    voices = [phonology.fork(seed) for seed in range(3)]
+    expected = np.zeros(len(mixed))
+    for voice, plan, offset in zip(voices, plans, (0, 100, 441)):
+        expected[offset : offset + plan.n_samples] += .5 * voice.render(plan)
+    assert np.allclose(mixed, expected)
+
+def test_batch_does_not_depend_on_workers():
+    texts = ["'m-a-n", "s-e-e-m 'p-i-t", "'t-a-p"]
+    params = [pool.SynthesisParams(base_freq=f) for f in (100, 120, 140)]
+    serial = pool.synthesize_batch(phonology, texts, params, workers=1, seed=5)
+    threaded = pool.synthesize_batch(phonology, texts, params, workers=3, seed=5)
+    assert all(np.array_equal(a, b) for a, b in zip(serial, threaded))
+    with pool.SynthesisPool(phonology, 2, seed=5) as workers:
+        unordered = dict(workers.synthesize_batch(texts, params, ordered=False))
+    assert all(np.array_equal(unordered[i], serial[i]) for i in range(len(texts)))
+
+def test_process_workers_match_threads(tmp_path):
+    bank.write_bank(str(tmp_path / 'voice.bank'), phonology.phonemes)
+    texts = ["'m-a-n", "s-e-e-m 'p-i-t 'm-a-n"]
+    loaded = phoneme.Phonology.load_bank(str(tmp_path / 'voice.bank'))
+    loaded.player.block_size = 32
+    loaded.cache = RenderCache(1 << 20)
+    threaded = pool.synthesize_batch(loaded, texts, workers=2, seed=9)
+    processed = pool.synthesize_batch(loaded, texts, workers=2, processes=True, seed=9)
+    assert all(a.dtype == b.dtype and np.array_equal(a, b) for a, b in zip(threaded, processed))
+
+def test_seeded_pool_shares_render_cache():
+    cached = phoneme.Phonology(phonology.phonemes, cache=RenderCache())
+    rendered = pool.synthesize_batch(cached, ["'m-a-n s-e-e-m"] * 6, workers=1, seed=4)
+    assert cached.cache.stats()['misses'] == 2 and cached.cache.stats()['hits'] == 10
+    assert all(np.array_equal(samples, rendered[0]) for samples in rendered)
+
+def test_render_cache_keeps_block_modes_apart():
+    cached = phoneme.Phonology(phonology.phonemes, seed=3, cache=RenderCache())
+    blocked = cached.fork()
+    blocked.player.block_size = 32
+    plan = cached.compile_str("'m-a-n")
+    reference = cached.render(plan).copy()
+    assert not np.array_equal(blocked.render(plan), reference)
+    assert cached.cache.stats()['entries'] == 2
+
+def test_process_workers_keep_phonology_settings(tmp_path):
+    bank.write_bank(str(tmp_path / 'voice.bank'), phonology.phonemes)
+    texts = ["'m-a-n", "s-e-e-m"]
+    loaded = phoneme.Phonology.load_bank(str(tmp_path / 'voice.bank'), np.float32)
+    loaded.output_rate = 48000
+    threaded = pool.synthesize_batch(loaded, texts, workers=2, seed=9)
+    processed = pool.synthesize_batch(loaded, texts, workers=2, processes=True, seed=9)
+    assert all(a.dtype == b.dtype == np.float32 for a, b in zip(threaded, processed))
+    assert [len(a) for a in threaded] == [len(b) for b in processed]
+    plan = loaded.compile_str(texts[0], vibrato=.03)
+    assert len(threaded[0]) == loaded.output_samples(plan) > plan.n_samples
+
+def test_stream_matches_render():
+    text = "'m-a-n ,s-e-e-m 'p-i-t"
+    phonology.player.reseed(11)
+    whole = phonology.play_str(text)
+    phonology.player.reseed(11)
+    chunks = list(phonology.stream_str(text, chunk_samples=1000))
+    assert all(len(chunk) == 1000 for chunk in chunks[:-1])
+    assert np.array_equal(np.concatenate(chunks), whole)
+    phonology.player.reseed(11)
+    pcm = np.concatenate(list(phonology.stream_str(text, width=2)))
+    assert pcm.dtype == np.int16
+    assert np.array_equal(pcm, wavio.to_pcm(whole))
+
+def test_output_rate_resamples_render_and_stream():
+    text = "'m-a-n ,s-e-e-m"
+    upsampled = phoneme.Phonology(phonology.phonemes, seed=4, output_rate=48000)
+    plan = upsampled.compile_str(text)
+    n_samples = upsampled.output_samples(plan)
+    assert abs(n_samples - plan.n_samples * 48000 / phonology.framerate) < 1
+    whole = upsampled.render(plan).copy()
+    assert len(whole) == n_samples
+    upsampled.player.reseed(4)
+    assert np.allclose(upsampled.render(plan, np.empty(n_samples + 5)), whole)
+    upsampled.player.reseed(4)
+    streamed = np.concatenate(list(upsampled.stream(plan, chunk_samples=1000)))
+    assert np.allclose(streamed, whole, atol=1e-9)
+
+def test_frame_durations_match_repeated_frames(tmp_path):
+    # Fully voiced, so that the noise, drawn per frame, does not enter the output
+    frames = [lpc.LPC(frame.coefficients, frame.gain, 1., frame.f0, duration) for frame, duration\
+        in zip(phonology.phonemes['a'].frames, (1, 3, 1, 4, 2, 1))]
+    repeated = [lpc.LPC(frame.coefficients, frame.gain, 1., frame.f0)\
+        for frame in frames for _ in range(frame.duration)]
+    renders = []
+    for sequence in (frames, repeated):
+        merged = phoneme.Phoneme(sequence, False, phonology.framerate)
+        assert merged.sample_count(.15) == 12 * 441
+        renders.append(merged.play_on(lpc.LPCPlayer(48, seed=2), .15, 110, True))
+    assert np.allclose(renders[0], renders[1], rtol=0, atol=1e-12)
+    bank.write_bank(str(tmp_path / 'merged.bank'), {'a': phoneme.Phoneme(frames, True, 44100)})
+    loaded = bank.Bank(str(tmp_path / 'merged.bank'))['a']
+    assert loaded.durations().tolist() == [1, 3, 1, 4, 2, 1]
+    assert len(loaded.play_on(lpc.LPCPlayer(48, seed=2), .2, 110, True)) == 20 * 441
+
+def test_sung_length_counts_merged_frames():
+    t = phonology.phonemes['t']
+    merged = phoneme.Phoneme([lpc.LPC(frame.coefficients, frame.gain, frame.voice, frame.f0,\
+        duration) for frame, duration in zip(t.frames[::2], (2, 2, 1))], False, t.framerate)
+    lengths = []
+    for last in (t, merged):
+        voice = phoneme.Phonology(dict(phonology.phonemes, t=last), seed=1)
+        lengths.append(voice.compile_sing('m-a-t', duration=.5).n_samples)
+    assert lengths[0] == lengths[1]
+    assert abs(lengths[0] - .5 * phonology.framerate) <= 441
+
+def test_profile_records_stages_and_audio():
+    with profiling.Profile() as profile:
+        samples = phonology.play_str("'m-a-n")
+    assert profiling.stage('x') is profiling.stage('y')
+    assert profile.stages['Phonology.render'].calls == 1
+    assert profile.stages['LPCPlayer.kernel'].calls == 3
+    assert np.isclose(profile.audio_seconds['synthesis'], len(samples) / phonology.framerate)
+    assert profile.real_time_factor() > 0
+
+def test_block_mode_spectrum_tracks_reference():
+    def spectra(block_size):
+        voice = phonology.fork(9)
+        voice.player.block_size = block_size
+        samples = voice.play_str("'m-a-n s-e-e-m", vibrato=0)
+        frames = np.lib.stride_tricks.sliding_window_view(samples, 1024)[::441]
+        return 20 * np.log10(np.abs(np.fft.rfft(frames * np.hanning(1024))) + 1e-9)
+    reference = spectra(1)
+    assert np.sqrt(np.mean((spectra(32) - reference) ** 2)) < 3
+
+def test_float32_player_tracks_float64():
+    def spectrum(samples):
+        frames = np.lib.stride_tricks.sliding_window_view(samples, 1024)[::441]
+        return 20 * np.log10(np.abs(np.fft.rfft(frames * np.hanning(1024))) + 1e-9)
+    coefficients, gains, voices, _ = phonology.phonemes['a'].arrays()
+    frequencies = np.full(len(gains), 110 / phonology.framerate)
+    counts = np.full(len(gains), 441)
+    noise = np.random.default_rng(4).random(counts.sum()) * 2 - 1
+    for block_size in (1, 32):
+        spectra = []
+        for dtype in (np.float64, np.float32):
+            player = lpc.LPCPlayer(phonology.player.order, block_size=block_size, dtype=dtype)
+            player.prime(phonology.phonemes['a'].frames[0], frequencies[0])
+            out = noise.astype(dtype)
+            player.render_sequence(coefficients, gains, voices, frequencies, counts, out=out)
+            assert player.cache.dtype == dtype
+            assert np.all(np.isfinite(out)) and np.all(np.abs(out) <= 1)
+            spectra.append(spectrum(out.astype(float)))
+        # Compare the bins within 40 dB of each frame's peak, where rounding noise is inaudible
+        audible = spectra[0] > spectra[0].max(axis=1, keepdims=True) - 40
+        assert np.sqrt(np.mean((spectra[1] - spectra[0])[audible] ** 2)) < 2
+    single = phoneme.Phonology(phonology.phonemes, seed=9, dtype=np.float32)
+    samples = single.play_str("'m-a-n s-e-e-m")
+    assert samples.dtype == np.float32
+    assert np.all(np.isfinite(samples)) and np.all(np.abs(samples) <= 1)
@@ -0,0 +1,49 @@
+import io
+import wave
+
+import numpy as np
+
+from lpyc_tts_shotgunllama import wavio
+
+def _stereo(left, right, width=2):
+    file = io.BytesIO()
+    with wave.open(file, 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(width)
+        w.setframerate(8000)
+        w.writeframes(np.stack([left, right], axis=1).astype('<i2').tobytes())
+    file.seek(0)
+    return file
+
+def test_round_trip_every_width():
+    x = np.concatenate([np.linspace(-1, 1, 1001), [0, .5, -.5, .999]])
+    for width in (1, 2, 3, 4):
+        file = io.BytesIO()
+        wavio.write(file, x, 16000, width)
+        file.seek(0)
+        y, rate = wavio.read(file)
+        assert rate == 16000 and len(y) == len(x)
+        assert np.abs(y - x).max() <= 2 / (1 << (width * 8 - 1))
+        assert y.min() >= -1 and y.max() < 1
+
+def test_8_bit_is_unsigned_around_128():
+    assert np.array_equal(wavio.decode(bytes([0, 64, 128, 192, 255]), 1),\
+        (np.array([0, 64, 128, 192, 255]) - 128) / 128)
+    assert list(wavio.encode(np.array([-1, 0, 1]), 1)) == [1, 128, 255]
+
+def test_24_bit_matches_hand_built_bytes():
+    data = bytes([0x00, 0x00, 0x80, 0xff, 0xff, 0x7f, 0x01, 0x00, 0x00, 0xff, 0xff, 0xff])
+    ints = np.array([-(1 << 23), (1 << 23) - 1, 1, -1])
+    assert np.array_equal(wavio.decode(data, 3), ints / (1 << 23))
+    # Encoding scales by the positive full scale, so -1 maps to -(1 << 23) + 1
+    assert wavio.encode(ints[1:] / ((1 << 23) - 1), 3) == data[3:]
+
+def test_stereo_channel_selection_and_downmix():
+    left = np.array([1000, -2000, 3000, 0])
+    right = np.array([-1000, 2000, 1000, 32767])
+    assert np.array_equal(wavio.read(_stereo(left, right), 0)[0], left / 32768)
+    assert np.array_equal(wavio.read(_stereo(left, right), 1)[0], right / 32768)
+    mixed, rate = wavio.read(_stereo(left, right))
+    assert rate == 8000 and np.allclose(mixed, (left + right) / 2 / 32768)
+    with wavio.WavReader(_stereo(left, right), 1) as reader:
+        assert np.array_equal(np.concatenate(list(reader.chunks(3))), right / 32768)